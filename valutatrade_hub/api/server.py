@@ -0,0 +1,621 @@
+import asyncio
+import json
+import logging
+import math
+import secrets
+import threading
+import time
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+from valutatrade_hub.core.convert import Converter
+from valutatrade_hub.core.currencies import get_currency_registry
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.ledger import get_trade_ledger
+from valutatrade_hub.core.listeners import install_demand_sources, install_rate_listeners
+from valutatrade_hub.core.orders import BOOKS, execute_ticks, get_order_book
+from valutatrade_hub.core.rates_index import get_rates_index
+from valutatrade_hub.core.utils import hash_password, make_salt
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.events import DROP_OLDEST, rate_bus
+from valutatrade_hub.parser_service.fetch_plan import QUERIES, demand_registry
+from valutatrade_hub.parser_service.updater import RatesUpdater
+
+logger = logging.getLogger("ValutaTrade.Api")
+config = ParserConfig()
+
+SESSION_TTL_SECONDS = 24 * 3600
+FLUSH_INTERVAL_SECONDS = 1.0
+RATES_CHECK_INTERVAL_SECONDS = 30
+KEEPALIVE_TIMEOUT_SECONDS = 30
+MAX_BODY_BYTES = 64 * 1024
+STREAM_QUEUE_SIZE = 256
+STREAM_HEARTBEAT_SECONDS = 15
+# обработчики с файловым вводом-выводом (история, ледджер, книга ордеров, блокировка id):
+# выполняются в потоке, а не в event loop
+BLOCKING_ROUTES = {
+    ('POST', '/register'),
+    ('POST', '/buy'),
+    ('POST', '/sell'),
+    ('POST', '/convert'),
+    ('POST', '/orders'),
+    ('GET', '/orders'),
+    ('POST', '/orders/cancel'),
+}
+
+HTTP_REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    409: "Conflict",
+    413: "Payload Too Large",
+    422: "Unprocessable Entity",
+    500: "Internal Server Error",
+}
+
+
+class ApiError(Exception):
+    """
+    Ошибка обработки запроса, превращается в JSON-ответ с кодом status
+    """
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+class ServerState:
+    """
+    Пользователи, портфели и сессии сервера в памяти.
+    Изменения помечают запись как "грязную", на диск (в её шард) её сбрасывает фоновый writer.
+    Изменяющие обработчики выполняются в потоках: записи и "грязные" множества меняются
+    под _lock, книга ордеров - под _book_lock (в таком порядке, если нужны обе)
+    """
+
+    def __init__(self, session_ttl: int = SESSION_TTL_SECONDS) -> None:
+        db = get_database()
+        users = db.users()
+        portfolios = db.portfolios()
+
+        self.users = {u['user_id']: u for u in users}
+        self.user_ids = {u['username']: u['user_id'] for u in users}
+        self.portfolios = {p['user_id']: p for p in portfolios}
+
+        self.session_ttl = session_ttl
+        self.sessions: dict[str, tuple[int, float]] = {}
+        self.dirty_users: set[int] = set()
+        self.dirty_portfolios: set[int] = set()
+        self.queried: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._book_lock = threading.Lock()
+        # конвертер и загруженные им ряды истории живут до следующего обновления курсов
+        self._converter: Converter | None = None
+        self._converter_refresh = None
+        self._converter_lock = threading.Lock()
+
+    # --- сессии ---
+
+    def register(self, username: str, password: str) -> dict:
+        if not username or not password:
+            raise ApiError(400, 'Нужны поля username и password')
+        if username in self.user_ids:
+            raise ApiError(409, f'Имя пользователя {username} уже занято')
+        if len(password) < 4:
+            raise ApiError(400, 'Пароль должен быть не короче 4 символов')
+
+        # id выделяется под межпроцессной блокировкой, поэтому вне _lock
+        user_id = get_database().next_user_id()
+
+        salt = make_salt()
+        user = {
+            "user_id": user_id,
+            "username": username,
+            "hashed_password": hash_password(password, salt),
+            "salt": salt,
+            "registration_date": str(datetime.now()),
+        }
+        with self._lock:
+            if username in self.user_ids:
+                raise ApiError(409, f'Имя пользователя {username} уже занято')
+            self.users[user_id] = user
+            self.user_ids[username] = user_id
+            self.portfolios[user_id] = {"user_id": user_id, "wallets": {}}
+            self.dirty_users.add(user_id)
+            self.dirty_portfolios.add(user_id)
+
+        return {"user_id": user_id}
+
+    def login(self, username: str, password: str) -> dict:
+        user_id = self.user_ids.get(username)
+        if user_id is None:
+            raise ApiError(404, f'Пользователь {username} не найден')
+
+        user = self.users[user_id]
+        if hash_password(password or '', user['salt']) != user['hashed_password']:
+            raise ApiError(401, 'Неверный пароль')
+
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = (user_id, time.monotonic() + self.session_ttl)
+        return {"token": token, "user_id": user_id}
+
+    def logout(self, token: str) -> dict:
+        self.sessions.pop(token, None)
+        return {"ok": True}
+
+    def resolve(self, token: str | None) -> int:
+        """
+        Ф-ция возвращает user_id по токену сессии или бросает 401
+        """
+        session = self.sessions.get(token) if token else None
+        if session is None:
+            raise ApiError(401, 'Сначала выполните login')
+
+        user_id, expires_at = session
+        if expires_at < time.monotonic():
+            del self.sessions[token]
+            raise ApiError(401, 'Сессия истекла, выполните login')
+        return user_id
+
+    # --- портфель ---
+
+    def _wallets(self, user_id: int) -> dict:
+        portfolio = self.portfolios.get(user_id)
+        if portfolio is None:
+            raise ApiError(404, 'Портфель не найден')
+        return portfolio.setdefault('wallets', {})
+
+    @staticmethod
+    def _currency(code) -> str:
+        try:
+            return get_currency_registry().normalize(code or '')
+        except CurrencyNotFoundError as e:
+            raise ApiError(404, str(e)) from e
+
+    @staticmethod
+    def _amount(value) -> float:
+        try:
+            amount = float(value)
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, 'amount должен быть числом') from e
+        if not math.isfinite(amount) or amount <= 0:
+            raise ApiError(400, f'{amount} должен быть положительным числом')
+        return amount
+
+    @staticmethod
+    def _rate(code: str, base: str = config.BASE_CURRENCY) -> float:
+        rate = get_rates_index().rate_to(code, base)
+        if not rate:
+            raise ApiError(404, f'Не удалось получить курс для {code}→{base}')
+        return rate
+
+    def portfolio(self, user_id: int, base: str | None = None) -> dict:
+        base = self._currency(base or config.BASE_CURRENCY)
+        self._rate(base)
+        wallets = self._wallets(user_id)
+        index = get_rates_index()
+
+        items = []
+        total = 0.0
+        # снимок: обработчики в потоках могут добавлять кошельки
+        for code, wallet in list(wallets.items()):
+            balance = wallet.get('balance', 0)
+            value = balance * (index.rate_to(code, base) or 0.0)
+            total += value
+            items.append({"currency": code, "balance": balance, "value": value})
+
+        return {"base": base, "wallets": items, "total": total}
+
+    def buy(self, user_id: int, currency, amount) -> dict:
+        currency = self._currency(currency)
+        amount = self._amount(amount)
+        rate = self._rate(currency)
+
+        with self._lock:
+            wallets = self._wallets(user_id)
+            wallet = wallets.setdefault(currency, {"balance": 0.0})
+            before = wallet['balance']
+            wallet['balance'] += amount
+            after = wallet['balance']
+            self.dirty_portfolios.add(user_id)
+        get_trade_ledger().record(user_id, 'buy', currency, amount, rate, config.BASE_CURRENCY, source='api')
+
+        return {"currency": currency, "rate": rate, "before": before, "after": after}
+
+    def sell(self, user_id: int, currency, amount) -> dict:
+        currency = self._currency(currency)
+        amount = self._amount(amount)
+        rate = self._rate(currency)
+
+        with self._lock:
+            wallets = self._wallets(user_id)
+            wallet = wallets.get(currency)
+            if wallet is None:
+                raise ApiError(404, f'У вас нет кошелька {currency}')
+            if wallet['balance'] < amount:
+                raise ApiError(
+                    422,
+                    f"Недостаточно средств: доступно {wallet['balance']} {currency}, требуется {amount} {currency}",
+                )
+
+            before = wallet['balance']
+            wallet['balance'] -= amount
+            after = wallet['balance']
+            wallets.setdefault(config.BASE_CURRENCY, {"balance": 0.0})['balance'] += amount * rate
+            self.dirty_portfolios.add(user_id)
+        get_trade_ledger().record(user_id, 'sell', currency, amount, rate, config.BASE_CURRENCY, source='api')
+
+        return {"currency": currency, "rate": rate, "before": before, "after": after}
+
+    # --- ордера ---
+
+    def place_order(self, user_id: int, params: dict) -> dict:
+        side = str(params.get('side') or '').lower()
+        kind = str(params.get('type') or '').lower()
+        if f'{side}_{kind}' not in BOOKS:
+            raise ApiError(400, 'Тип ордера: side buy|sell, type limit|stop')
+
+        currency = self._currency(params.get('currency'))
+        if currency == config.BASE_CURRENCY:
+            raise ApiError(400, f'Нельзя выставить ордер на {currency}→{config.BASE_CURRENCY}')
+        amount = self._amount(params.get('amount'))
+        price = self._amount(params.get('price'))
+
+        if side == 'sell':
+            with self._lock:
+                available = self._wallets(user_id).get(currency, {}).get('balance', 0.0)
+            if available < amount:
+                raise ApiError(422, f"Недостаточно средств: доступно {available} {currency}, требуется {amount} {currency}")
+
+        with self._book_lock:
+            book = get_order_book()
+            with book.transaction():
+                order_id = book.place(user_id, f'{currency}_{config.BASE_CURRENCY}', side, kind, amount, price)
+        return {"order_id": order_id}
+
+    def cancel_order(self, user_id: int, order_id) -> dict:
+        with self._book_lock:
+            book = get_order_book()
+            with book.transaction():
+                cancelled = str(order_id).isdigit() and book.cancel(int(order_id), user_id)
+        if not cancelled:
+            raise ApiError(404, f'Открытый ордер #{order_id} не найден')
+        return {"ok": True}
+
+    def orders(self, user_id: int) -> dict:
+        with self._book_lock:
+            opened, closed = get_order_book().user_orders(user_id)
+        return {"open": opened, "closed": closed}
+
+    def on_rate_ticks(self, events) -> None:
+        """
+        Ф-ция исполняет ордера по событиям курсов прямо в портфелях сервера
+        (вызывается в потоке обновления курсов)
+        """
+        with self._book_lock:
+            book = get_order_book()
+            events = [e for e in events if book.has_orders(e.pair)]
+            if not events:
+                return
+            with book.transaction(), self._lock:
+                results = execute_ticks(book, events, self.portfolios.get, config.BASE_CURRENCY)
+                self.dirty_portfolios.update(r['user_id'] for r in results if r['status'] == 'filled')
+
+    # --- курсы ---
+
+    def rates(self, params: dict) -> dict:
+        index = get_rates_index()
+        base = self._currency(params.get('base') or config.BASE_CURRENCY)
+        base_rate = self._rate(base)
+
+        select = {
+            "asset_class": params.get('class'),
+            "base": config.BASE_CURRENCY,
+            "prefix": params.get('prefix'),
+        }
+        if params.get('top'):
+            try:
+                top_n = int(params['top'])
+            except ValueError as e:
+                raise ApiError(400, 'top должен быть целым числом') from e
+            entries = index.top(top_n, **select)
+        else:
+            entries = index.select(**select)
+
+        return {
+            "last_refresh": index.last_refresh,
+            "base": base,
+            "rates": {f"{e.code}_{base}": e.rate / base_rate for e in entries},
+        }
+
+    def rate(self, curr_from, curr_to) -> dict:
+        curr_from = self._currency(curr_from)
+        curr_to = self._currency(curr_to)
+        now = time.time()
+        self.queried[curr_from] = self.queried[curr_to] = now
+        rate = self._rate(curr_from, curr_to)
+        return {
+            "from": curr_from,
+            "to": curr_to,
+            "rate": rate,
+            "reverse_rate": 1 / rate,
+            "updated_at": get_rates_index().last_refresh,
+        }
+
+    def convert(self, params: dict) -> dict:
+        """
+        Ф-ция пересчитывает пачку строк {"amount", "from", "to"[, "timestamp"]} одним вызовом;
+        для неизвестной валюты или отсутствующего курса rate и converted - null
+        """
+        rows = params.get('rows')
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ApiError(400, 'rows должен быть списком объектов {amount, from, to[, timestamp]}')
+
+        timestamps = None
+        if any('timestamp' in r for r in rows):
+            timestamps = [r.get('timestamp') for r in rows]
+            timestamps = [str(t) if t is not None else '' for t in timestamps]
+        rates, converted = self._get_converter().convert(
+            [r.get('amount') for r in rows],
+            [r.get('from') for r in rows],
+            [r.get('to') for r in rows],
+            timestamps,
+        )
+        return {
+            "rows": [
+                {**r, "rate": rate if rate == rate else None, "converted": value if value == value else None}
+                for r, rate, value in zip(rows, map(float, rates), map(float, converted))
+            ],
+        }
+
+    def _get_converter(self) -> Converter:
+        """
+        Ф-ция возвращает общий для запросов конвертер; он пересоздаётся после обновления курсов,
+        чтобы спот-курсы и ряды истории не устаревали (вызывается из потоков обработчиков)
+        """
+        refresh = get_rates_index().last_refresh
+        with self._converter_lock:
+            if self._converter is None or self._converter_refresh != refresh:
+                self._converter = Converter()
+                self._converter_refresh = refresh
+            return self._converter
+
+    # --- спрос на курсы (для выборки по спросу) ---
+
+    def held_codes(self) -> set[str]:
+        with self._lock:
+            return {
+                code
+                for portfolio in self.portfolios.values()
+                for code, wallet in (portfolio.get('wallets') or {}).items()
+                if wallet.get('balance')
+            }
+
+    def recent_queries(self) -> list[str]:
+        deadline = time.time() - config.QUERY_DEMAND_TTL
+        return [code for code, ts in list(self.queried.items()) if ts >= deadline]
+
+    # --- сохранение ---
+
+    def dump_dirty(self) -> tuple[list[dict], list[dict]]:
+        """
+        Ф-ция копирует изменённые записи (под _lock, чтобы снимок был согласованным)
+        """
+        with self._lock:
+            users = [json.loads(json.dumps(self.users[uid])) for uid in self.dirty_users]
+            portfolios = [json.loads(json.dumps(self.portfolios[uid])) for uid in self.dirty_portfolios]
+            self.dirty_users.clear()
+            self.dirty_portfolios.clear()
+        return users, portfolios
+
+    def flush(self) -> None:
+        """
+        Ф-ция сбрасывает изменённые записи в их шарды; если запись не удалась,
+        они снова помечаются "грязными" и уйдут со следующим сбросом
+        """
+        users, portfolios = self.dump_dirty()
+        db = get_database()
+        try:
+            if users:
+                db.save_users(users)
+            if portfolios:
+                db.save_portfolios(portfolios)
+        except OSError as e:
+            logger.error(f"Failed to persist users/portfolios: {e}")
+            with self._lock:
+                self.dirty_users.update(u['user_id'] for u in users)
+                self.dirty_portfolios.update(p['user_id'] for p in portfolios)
+
+
+class ApiServer:
+    """
+    Минимальный HTTP/1.1 JSON-сервер на asyncio поверх ServerState
+    """
+
+    def __init__(self, state: ServerState) -> None:
+        self.state = state
+        self.routes = {
+            ('POST', '/register'): (False, lambda p, uid, tok: self.state.register(p.get('username'), p.get('password'))),
+            ('POST', '/login'): (False, lambda p, uid, tok: self.state.login(p.get('username'), p.get('password'))),
+            ('POST', '/logout'): (True, lambda p, uid, tok: self.state.logout(tok)),
+            ('GET', '/portfolio'): (True, lambda p, uid, tok: self.state.portfolio(uid, p.get('base'))),
+            ('POST', '/buy'): (True, lambda p, uid, tok: self.state.buy(uid, p.get('currency'), p.get('amount'))),
+            ('POST', '/sell'): (True, lambda p, uid, tok: self.state.sell(uid, p.get('currency'), p.get('amount'))),
+            ('GET', '/rates'): (False, lambda p, uid, tok: self.state.rates(p)),
+            ('GET', '/rate'): (False, lambda p, uid, tok: self.state.rate(p.get('from'), p.get('to'))),
+            ('POST', '/convert'): (True, lambda p, uid, tok: self.state.convert(p)),
+            ('POST', '/orders'): (True, lambda p, uid, tok: self.state.place_order(uid, p)),
+            ('GET', '/orders'): (True, lambda p, uid, tok: self.state.orders(uid)),
+            ('POST', '/orders/cancel'): (True, lambda p, uid, tok: self.state.cancel_order(uid, p.get('order_id'))),
+        }
+        self._tasks: list[asyncio.Task] = []
+
+    async def dispatch(self, method: str, target: str, headers: dict, body: bytes) -> tuple[int, dict]:
+        url = urlsplit(target)
+        route = self.routes.get((method, url.path))
+        if route is None:
+            known_path = any(path == url.path for _, path in self.routes)
+            return (405, {"error": "Метод не поддерживается"}) if known_path else (404, {"error": "Не найдено"})
+
+        needs_auth, handler = route
+        params = dict(parse_qsl(url.query))
+        try:
+            if body:
+                payload = json.loads(body)
+                if not isinstance(payload, dict):
+                    raise ApiError(400, 'Тело запроса должно быть JSON-объектом')
+                params.update(payload)
+
+            token = None
+            auth = headers.get('authorization', '')
+            if auth.lower().startswith('bearer '):
+                token = auth[7:].strip()
+            user_id = self.state.resolve(token) if needs_auth else None
+
+            if (method, url.path) in BLOCKING_ROUTES:
+                return 200, await asyncio.to_thread(handler, params, user_id, token)
+            return 200, handler(params, user_id, token)
+        except json.JSONDecodeError:
+            return 400, {"error": "Некорректный JSON"}
+        except ApiError as e:
+            return e.status, {"error": e.message}
+        except Exception as e:
+            logger.exception(f"Unhandled error on {method} {url.path}: {e}")
+            return 500, {"error": "Внутренняя ошибка"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await asyncio.wait_for(reader.readline(), KEEPALIVE_TIMEOUT_SECONDS)
+                if not request_line:
+                    break
+
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length') or 0)
+                if length > MAX_BODY_BYTES:
+                    writer.write(_http_response(413, {"error": "Слишком большой запрос"}, keep_alive=False))
+                    await writer.drain()
+                    break
+
+                body = await reader.readexactly(length) if length else b''
+
+                url = urlsplit(target)
+                if method.upper() == 'GET' and url.path == '/rates/stream':
+                    await self.stream_rates(writer, dict(parse_qsl(url.query)))
+                    break
+
+                status, payload = await self.dispatch(method.upper(), target, headers, body)
+
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(_http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def stream_rates(self, writer: asyncio.StreamWriter, params: dict) -> None:
+        """
+        Ф-ция отдаёт события курсов как Server-Sent Events, пока клиент не отключится
+        """
+        pairs = [p.strip().upper() for p in params.get('pairs', '').split(',') if p.strip()]
+        subscription = rate_bus.subscribe(maxsize=STREAM_QUEUE_SIZE, policy=DROP_OLDEST,
+                                          loop=asyncio.get_running_loop(), pairs=pairs or None)
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream; charset=utf-8\r\n"
+            b"Cache-Control: no-cache\r\n"
+            b"Connection: close\r\n"
+            b"\r\n"
+        )
+        try:
+            await writer.drain()
+            while not writer.is_closing():
+                event = await subscription.next(timeout=STREAM_HEARTBEAT_SECONDS)
+                if event is None:
+                    # комментарий-heartbeat держит соединение и выявляет отключившихся клиентов
+                    writer.write(b": ping\n\n")
+                else:
+                    data = json.dumps(event.to_dict(), ensure_ascii=False)
+                    writer.write(f"event: tick\ndata: {data}\n\n".encode('utf-8'))
+                await writer.drain()
+        finally:
+            subscription.close()
+
+    async def _writer_loop(self) -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SECONDS)
+            await self.flush()
+
+    async def flush(self) -> None:
+        await asyncio.to_thread(self.state.flush)
+
+    async def _rates_loop(self) -> None:
+        updater = RatesUpdater(config)
+        while True:
+            # какие пары и когда запрашивать, решает планировщик выборки по их целевой свежести
+            try:
+                await asyncio.to_thread(updater.refresh_single_flight)
+            except Exception as e:
+                logger.error(f"Background rates update failed: {e}")
+            await asyncio.sleep(RATES_CHECK_INTERVAL_SECONDS)
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port, backlog=4096)
+        # ордера сервера исполняются по портфелям в памяти, а не по файлу на диске
+        rate_bus.add_listener('orders', self.state.on_rate_ticks)
+        # балансы сервера актуальнее файлов, запросы курсов учитываются в памяти
+        demand_registry.add_source('holdings', self.state.held_codes)
+        demand_registry.add_source(QUERIES, self.state.recent_queries)
+        self._tasks = [
+            asyncio.create_task(self._writer_loop()),
+            asyncio.create_task(self._rates_loop()),
+        ]
+        logger.info(f"API server listening on {host}:{port}")
+        print(f'Сервер запущен на http://{host}:{port} (Ctrl+C для остановки)')
+
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            await self.flush()
+
+
+def _http_response(status: int, payload: dict, keep_alive: bool = True) -> bytes:
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    head = (
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}\r\n"
+        "Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+        "\r\n"
+    )
+    return head.encode('latin-1') + body
+
+
+def run_server(host: str = '127.0.0.1', port: int = 8080) -> None:
+    """
+    Ф-ция запускает API-сервер и блокирует поток до Ctrl+C
+    """
+    install_rate_listeners()
+    install_demand_sources()
+    server = ApiServer(ServerState())
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        print('Сервер остановлен')
@@ -2,14 +2,31 @@ import shlex
 
 import prompt
 
+from valutatrade_hub.api.server import run_server
 from valutatrade_hub.core.usecases import (
+    add_alert,
+    backfill_history,
+    backtest,
     buy,
+    cancel_order,
+    convert_rates,
+    export_data,
     get_rate,
+    import_users,
     login,
+    place_order,
     register,
+    remove_alert,
+    reshard_storage,
     sell,
+    show_alerts,
+    show_ohlc,
+    show_orders,
+    show_pnl,
     show_portfolio,
+    show_portfolio_history,
     show_rates,
+    show_risk,
     update_rates,
 )
 
@@ -19,6 +36,7 @@ def print_help():
     print('Авторизация пользователя: login --username <str> --password <str>')
     print('Показать портфолио пользователя в базовой валюте: show-portfolio')
     print('Показать портфолио пользователя в кастомной валюте: show-portfolio --base <str>')
+    print('История стоимости портфеля: portfolio-history --from <date> --to <date> --step <ms>')
     print('Купить валюту: buy --currency <str> --amount <float>')
     print('Продать валюту: sell --currency <str> --amount <float>')
     print('Получить текущий курс: get-rate --from <str> --to <str>')
@@ -26,6 +44,27 @@ def print_help():
     print('Показать список актуальных курсов: show-rates')
     print('Показать N самых дорогих валют: show-rates --top <int>')
     print('Показать курс конкретной валюты: show-rates --currency <str>')
+    print('Фильтры списка курсов: show-rates --class <crypto|fiat> --prefix <str>')
+    print('Загрузить историю курсов из CSV/JSONL: backfill --file <path> --source <str> --workers <int>')
+    print('Выгрузить данные: export --what <history|portfolios|users|trades> --format <csv|jsonl> --out <path> [--gzip]')
+    print('Фильтры выгрузки: export ... --from <date> --to <date> --pair <str> --user <str>')
+    print('Показать свечи OHLC: ohlc --currency <str> --interval <1m|1h|1d> --limit <int>')
+    print('Разложить пользователей и портфели по шардам: reshard --shards <int> --dirs <dir1,dir2>')
+    print('Импортировать пользователей с начальными балансами из CSV/JSONL: import-users --file <path> --workers <int> [--restart]')
+    print('Запустить JSON API сервер: serve --host <str> --port <int>')
+    print('Создать ценовой алерт: alert-add --currency <str> --above <float> | --below <float>')
+    print('Показать алерты: alerts')
+    print('Удалить алерт: alert-remove --id <int>')
+    print('Выставить ордер: order --side <buy|sell> --type <limit|stop> --currency <str> --amount <float> --price <float>')
+    print('Показать ордера: orders')
+    print('Показать реализованный и нереализованный P&L (FIFO): pnl --currency <str>')
+    print('Показать риск портфеля (волатильность, корреляции, VaR): risk --interval <1m|1h|1d> --window <int> --confidence <float> --lookback <int>')
+    print('Отменить ордер: order-cancel --id <int>')
+    print(
+        'Прогнать стратегии по истории курсов: backtest --strategy <name:param=v1|v2;name2> --cash <float> '
+        '--from <date> --to <date> --workers <int> --out <path>'
+    )
+    print('Пересчитать файл сумм (CSV/JSONL, .gz) в другие валюты: convert --file <path> --out <path> [--base <str>]')
 
 
 logged_in = False
@@ -138,8 +177,168 @@ def run():
                 currency = _get_arg(args, '--currency')
                 top = _get_arg(args, '--top')
                 base = _get_arg(args, '--base')
+                asset_class = _get_arg(args, '--class')
+                prefix = _get_arg(args, '--prefix')
 
-                show_rates(currency, top, base)
+                show_rates(currency, top, base, asset_class=asset_class, prefix=prefix)
+
+            case 'backfill':
+                path = _get_arg(args, '--file')
+                source = _get_arg(args, '--source')
+                workers = _get_arg(args, '--workers')
+
+                if not path:
+                    print('Неверные аргументы. Пример: backfill --file dump.csv --workers 4')
+                    continue
+
+                backfill_history(path, source, workers)
+
+            case 'export':
+                what = _get_arg(args, '--what')
+                fmt = _get_arg(args, '--format')
+                out = _get_arg(args, '--out')
+
+                if not what or not out:
+                    print('Неверные аргументы. Пример: export --what history --format csv --out history.csv --gzip')
+                    continue
+
+                export_data(
+                    what,
+                    fmt,
+                    out,
+                    compress='--gzip' in args,
+                    since=_get_arg(args, '--from'),
+                    until=_get_arg(args, '--to'),
+                    pair=_get_arg(args, '--pair'),
+                    username=_get_arg(args, '--user'),
+                )
+
+            case 'ohlc':
+                currency = _get_arg(args, '--currency')
+                interval = _get_arg(args, '--interval')
+                limit = _get_arg(args, '--limit')
+
+                if not currency:
+                    print('Неверные аргументы. Пример: ohlc --currency BTC --interval 1h --limit 24')
+                    continue
+
+                show_ohlc(currency, interval, limit)
+
+            case 'alert-add':
+                currency = _get_arg(args, '--currency')
+                above = _get_arg(args, '--above')
+                below = _get_arg(args, '--below')
+
+                if not currency:
+                    print('Неверные аргументы. Пример: alert-add --currency BTC --above 100000')
+                    continue
+
+                add_alert(logged_id, currency, above, below)
+
+            case 'alerts':
+                show_alerts(logged_id)
+
+            case 'alert-remove':
+                alert_id = _get_arg(args, '--id')
+
+                if not alert_id:
+                    print('Неверные аргументы. Пример: alert-remove --id 1')
+                    continue
+
+                remove_alert(logged_id, alert_id)
+
+            case 'order':
+                side = _get_arg(args, '--side')
+                kind = _get_arg(args, '--type')
+                currency = _get_arg(args, '--currency')
+                amount = _get_arg(args, '--amount')
+                price = _get_arg(args, '--price')
+
+                if not side or not kind or not currency or amount is None or price is None:
+                    print('Неверные аргументы. Пример: order --side buy --type limit --currency BTC --amount 0.01 --price 85000')
+                    continue
+
+                place_order(logged_id, side, kind, currency, amount, price)
+
+            case 'orders':
+                show_orders(logged_id)
+
+            case 'portfolio-history':
+                show_portfolio_history(
+                    logged_id,
+                    since=_get_arg(args, '--from'),
+                    until=_get_arg(args, '--to'),
+                    step=_get_arg(args, '--step'),
+                )
+
+            case 'pnl':
+                show_pnl(logged_id, _get_arg(args, '--currency'))
+
+            case 'risk':
+                show_risk(
+                    logged_id,
+                    interval=_get_arg(args, '--interval'),
+                    window=_get_arg(args, '--window'),
+                    confidence=_get_arg(args, '--confidence'),
+                    lookback=_get_arg(args, '--lookback'),
+                )
+
+            case 'order-cancel':
+                order_id = _get_arg(args, '--id')
+
+                if not order_id:
+                    print('Неверные аргументы. Пример: order-cancel --id 1')
+                    continue
+
+                cancel_order(logged_id, order_id)
+
+            case 'reshard':
+                reshard_storage(_get_arg(args, '--shards'), _get_arg(args, '--dirs'))
+
+            case 'import-users':
+                path = _get_arg(args, '--file')
+
+                if not path:
+                    print('Неверные аргументы. Пример: import-users --file users.csv --workers 4')
+                    continue
+
+                import_users(path, _get_arg(args, '--workers'), restart='--restart' in args)
+
+            case 'backtest':
+                strategies = _get_arg(args, '--strategy')
+
+                if not strategies:
+                    print('Неверные аргументы. Пример: backtest --strategy "hold;rebalance:threshold=0.02|0.05" --cash 10000')
+                    continue
+
+                backtest(
+                    strategies,
+                    cash=_get_arg(args, '--cash'),
+                    since=_get_arg(args, '--from'),
+                    until=_get_arg(args, '--to'),
+                    workers=_get_arg(args, '--workers'),
+                    out=_get_arg(args, '--out'),
+                )
+
+            case 'convert':
+                path = _get_arg(args, '--file')
+                out = _get_arg(args, '--out')
+
+                if not path or not out:
+                    print('Неверные аргументы. Пример: convert --file amounts.csv --out converted.csv')
+                    continue
+
+                convert_rates(path, out, _get_arg(args, '--base'))
+
+            case 'serve':
+                host = _get_arg(args, '--host') or '127.0.0.1'
+                port = _get_arg(args, '--port') or '8080'
+
+                if not port.isdigit():
+                    print('Неверные аргументы. Пример: serve --host 127.0.0.1 --port 8080')
+                    continue
+
+                run_server(host, int(port))
 
             case 'help':
                 print_help()
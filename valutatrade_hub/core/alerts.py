@@ -0,0 +1,199 @@
+import bisect
+import logging
+from datetime import datetime
+
+from valutatrade_hub.core.journal import JournaledBook
+from valutatrade_hub.infra.settings import settings
+
+logger = logging.getLogger("ValutaTrade.Alerts")
+
+ABOVE = "above"
+BELOW = "below"
+TRIGGERED_KEEP = 10000
+
+_threshold = lambda entry: entry[0]
+
+
+class AlertBook(JournaledBook):
+    """
+    Хранилище ценовых алертов.
+    Для каждой пары держит два списка [threshold, alert_id, user_id], отсортированных по порогу,
+    поэтому на тике сработавшие алерты находятся бисекцией между прошлым и новым курсом,
+    а стоимость проверки зависит только от числа сработавших алертов.
+    Создание, удаление и срабатывание алерта - одна строка журнала (см. JournaledBook),
+    поэтому изменения проводятся внутри transaction()
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        super().__init__(path or settings.get_data_file_path("alerts.json"))
+
+    def _load(self, data: dict) -> None:
+        self.next_id = data.get("next_id", 1)
+        self.active: dict[str, dict[str, list]] = data.get("active", {})
+        self.by_id: dict[str, list] = data.get("by_id", {})
+        self.triggered: list[dict] = data.get("triggered", [])
+
+    def _dump(self) -> dict:
+        return {
+            "next_id": self.next_id,
+            "active": self.active,
+            "by_id": self.by_id,
+            "triggered": self.triggered,
+        }
+
+    def _apply(self, op: dict) -> None:
+        if op["op"] == "add":
+            alert_id = op["alert_id"]
+            self.next_id = max(self.next_id, alert_id + 1)
+            sides = self.active.setdefault(op["pair"], {ABOVE: [], BELOW: []})
+            bisect.insort(sides[op["direction"]], [op["threshold"], alert_id, op["user_id"]], key=_threshold)
+            # ключи JSON - строки, поэтому и в памяти индекс держим по строковому id
+            self.by_id[str(alert_id)] = [op["pair"], op["direction"], op["threshold"], op["user_id"], op["created_at"]]
+        elif op["op"] == "remove":
+            self._drop(op["alert_id"])
+        elif op["op"] == "fire":
+            # в процессе, где алерт сработал, он уже снят с книги в evaluate
+            self._drop(op["alert"]["alert_id"])
+            self.triggered.append(op["alert"])
+            del self.triggered[:-TRIGGERED_KEEP]
+        elif op["op"] == "seen":
+            for alert in self.triggered:
+                if alert["user_id"] == op["user_id"]:
+                    alert["seen"] = True
+
+    def _drop(self, alert_id: int) -> None:
+        info = self.by_id.pop(str(alert_id), None)
+        if info is None:
+            return
+        pair, direction, threshold = info[0], info[1], info[2]
+        entries = self.active[pair][direction]
+        i = bisect.bisect_left(entries, threshold, key=_threshold)
+        while i < len(entries) and entries[i][0] == threshold:
+            if entries[i][1] == alert_id:
+                del entries[i]
+                break
+            i += 1
+
+    def add(self, user_id: int, pair: str, direction: str, threshold: float) -> int:
+        if direction not in (ABOVE, BELOW):
+            raise ValueError(f"unknown direction: {direction}")
+
+        alert_id = self.next_id
+        self._do({
+            "op": "add",
+            "alert_id": alert_id,
+            "pair": pair,
+            "direction": direction,
+            "threshold": threshold,
+            "user_id": user_id,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        })
+        return alert_id
+
+    def remove(self, alert_id: int, user_id: int | None = None) -> bool:
+        info = self.by_id.get(str(alert_id))
+        if info is None or (user_id is not None and info[3] != user_id):
+            return False
+        self._do({"op": "remove", "alert_id": alert_id})
+        return True
+
+    def mark_seen(self, user_id: int) -> None:
+        self._do({"op": "seen", "user_id": user_id})
+
+    def evaluate(self, pair: str, prev_rate: float | None, rate: float, timestamp: str) -> list[dict]:
+        """
+        Ф-ция снимает и возвращает алерты пары, чей порог пересечён движением prev_rate → rate.
+        above срабатывает на prev < threshold <= rate, below - на rate <= threshold < prev.
+        Без прошлого курса срабатывают алерты, условие которых уже выполнено
+        """
+        sides = self.active.get(pair)
+        if not sides:
+            return []
+
+        fired = []
+        above = sides[ABOVE]
+        if above and (prev_rate is None or rate > prev_rate):
+            lo = 0 if prev_rate is None else bisect.bisect_right(above, prev_rate, key=_threshold)
+            hi = bisect.bisect_right(above, rate, key=_threshold)
+            fired += [(ABOVE, e) for e in above[lo:hi]]
+            del above[lo:hi]
+
+        below = sides[BELOW]
+        if below and (prev_rate is None or rate < prev_rate):
+            lo = bisect.bisect_left(below, rate, key=_threshold)
+            hi = len(below) if prev_rate is None else bisect.bisect_left(below, prev_rate, key=_threshold)
+            fired += [(BELOW, e) for e in below[lo:hi]]
+            del below[lo:hi]
+
+        result = []
+        for direction, (threshold, alert_id, user_id) in fired:
+            self.by_id.pop(str(alert_id), None)
+            alert = {
+                "alert_id": alert_id,
+                "user_id": user_id,
+                "pair": pair,
+                "direction": direction,
+                "threshold": threshold,
+                "rate": rate,
+                "triggered_at": timestamp,
+                "seen": False,
+            }
+            self._do({"op": "fire", "alert": alert})
+            result.append(alert)
+        return result
+
+    def user_alerts(self, user_id: int) -> list[tuple]:
+        """
+        Ф-ция возвращает активные алерты пользователя: (alert_id, pair, direction, threshold, created_at)
+        """
+        return [
+            (int(alert_id), info[0], info[1], info[2], info[4])
+            for alert_id, info in self.by_id.items()
+            if info[3] == user_id
+        ]
+
+
+_book: AlertBook | None = None
+
+
+def get_alert_book() -> AlertBook:
+    """
+    Ф-ция возвращает общий для процесса AlertBook, актуальный по файлу
+    """
+    global _book
+    if _book is None:
+        _book = AlertBook()
+    _book.refresh()
+    return _book
+
+
+def on_rate_ticks(events) -> None:
+    """
+    Слушатель шины курсов: проверяет алерты по каждой изменившейся паре
+    """
+    book = get_alert_book()
+    events = [e for e in events if any(book.active.get(e.pair, {}).values())]
+    if not events:
+        return
+
+    fired = []
+    # срабатывание дописывается в журнал, файл алертов целиком не переписывается
+    with book.transaction():
+        for event in events:
+            fired += book.evaluate(event.pair, event.prev_rate, event.rate, event.timestamp)
+
+    for alert in fired:
+        logger.info(
+            f"Alert {alert['alert_id']} for user {alert['user_id']}: "
+            f"{alert['pair']} {alert['direction']} {alert['threshold']} (rate {alert['rate']})"
+        )
+
+
+def demanded_codes():
+    """
+    Источник спроса для планировщика выборки: валюты пар с активными алертами
+    """
+    book = get_alert_book()
+    for pair, sides in book.active.items():
+        if any(sides.values()):
+            yield from pair.split("_")
@@ -0,0 +1,259 @@
+import hashlib
+import logging
+import marshal
+import math
+import os
+import threading
+
+from valutatrade_hub.core.timeseries import asof_indices
+from valutatrade_hub.infra.settings import settings
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import Storage
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость (extra "fast")
+    np = None
+
+logger = logging.getLogger("ValutaTrade.Analytics")
+config = ParserConfig()
+
+# сколько окон считается за один блок накопленных сумм: ограничивает и память,
+# и накопление ошибки округления на длинных рядах
+ROLLING_CHUNK = 4096
+SECONDS_PER_YEAR = 365 * 86400
+# сколько матриц доходностей держать в памяти и в data/cache/
+CACHE_MAX_ENTRIES = 32
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+class ReturnsCache:
+    """
+    Кеш матриц лог-доходностей: в памяти процесса и в data/cache/*.bin (marshal - только данные,
+    без исполнения кода при чтении). Запись действительна, пока не изменился файл свечей
+    (отметка mtime/size); хранится не больше max_entries последних записей
+    """
+
+    def __init__(self, directory: str | None = None, max_entries: int = CACHE_MAX_ENTRIES) -> None:
+        self.directory = directory or settings.get_data_file_path("cache")
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._memory: dict = {}
+
+    def _path(self, key: tuple) -> str:
+        digest = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=12).hexdigest()
+        return os.path.join(self.directory, f"returns-{digest}.bin")
+
+    def _remember(self, key: tuple, stamp, value) -> None:
+        with self._lock:
+            self._memory.pop(key, None)
+            self._memory[key] = (stamp, value)
+            while len(self._memory) > self.max_entries:
+                del self._memory[next(iter(self._memory))]
+
+    def get(self, key: tuple, stamp):
+        with self._lock:
+            cached = self._memory.get(key)
+        if cached and cached[0] == stamp:
+            return cached[1]
+
+        try:
+            with open(self._path(key), "rb") as f:
+                saved_stamp, value = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if saved_stamp != stamp or not isinstance(value, dict):
+            return None
+        if np is not None:
+            value["returns"] = np.asarray(value["returns"], dtype=np.float64)
+        self._remember(key, stamp, value)
+        return value
+
+    def put(self, key: tuple, stamp, value) -> None:
+        self._remember(key, stamp, value)
+        returns = value["returns"]
+        stored = dict(value, returns=returns.tolist() if hasattr(returns, "tolist") else returns)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self._path(key) + f".{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                marshal.dump((stamp, stored), f)
+            os.replace(tmp_path, self._path(key))
+            self._evict()
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to cache returns matrix: {e}")
+
+    def _evict(self) -> None:
+        """
+        Ф-ция удаляет самые старые файлы кеша сверх max_entries
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.startswith("returns-") and not entry.name.endswith(".tmp"):
+                try:
+                    entries.append((entry.stat().st_mtime_ns, entry.path))
+                except OSError:
+                    pass
+        entries.sort()
+        for _, path in entries[:max(len(entries) - self.max_entries, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+_cache = ReturnsCache()
+
+
+def load_returns(codes: list[str], interval: str, lookback: int, base: str | None = None) -> dict | None:
+    """
+    Ф-ция строит выровненную матрицу лог-доходностей по закрытиям свечей interval:
+    общая сетка с шагом интервала, закрытие каждой пары присоединяется as-of (последнее
+    не позже точки), сетка начинается, когда курс известен у всех пар.
+    Возвращает {"times", "closes" (последняя строка цен), "returns" (строки - время, столбцы - codes)}
+    """
+    base = base or config.BASE_CURRENCY
+    stamp = _stamp(config.OHLC_FILE_PATH)
+    key = (tuple(codes), interval, lookback, base)
+    cached = _cache.get(key, stamp)
+    if cached is not None:
+        return cached
+
+    step = config.OHLC_RESOLUTIONS[interval]
+    ohlc = Storage(config).load_ohlc()
+    series = []
+    for code in codes:
+        rows = ohlc.get(f"{code}_{base}", {}).get(interval, [])
+        if len(rows) < 2:
+            return None
+        series.append(([row[0] for row in rows], [math.nan] + [row[4] for row in rows]))
+
+    start = max(times[0] for times, _ in series)
+    stop = max(times[-1] for times, _ in series)
+    first = max(start, stop - lookback * step)
+    grid = list(range(first, stop + 1, step))
+    if len(grid) < 2:
+        return None
+
+    columns = []
+    for times, closes in series:
+        indices = asof_indices(times, grid)
+        columns.append([closes[i] for i in indices])
+
+    if np is not None:
+        prices = np.array(columns, dtype=np.float64).T
+        returns = np.diff(np.log(prices), axis=0)
+        last = prices[-1].tolist()
+    else:
+        returns = [
+            [math.log(col[t + 1] / col[t]) for col in columns]
+            for t in range(len(grid) - 1)
+        ]
+        last = [col[-1] for col in columns]
+
+    result = {"times": grid[1:], "closes": last, "returns": returns}
+    _cache.put(key, stamp, result)
+    return result
+
+
+def rolling_volatility(returns, window: int, chunk: int = ROLLING_CHUNK):
+    """
+    Ф-ция считает скользящее стандартное отклонение доходностей каждого столбца за один проход:
+    суммы в окне - разности накопленных сумм, накопление перезапускается каждые chunk окон
+    """
+    n = len(returns)
+    if window < 2 or n < window:
+        return []
+
+    if np is not None:
+        returns = np.asarray(returns, dtype=np.float64)
+        out = np.empty((n - window + 1, returns.shape[1]))
+        zero = np.zeros((1, returns.shape[1]))
+        for start in range(0, n - window + 1, chunk):
+            stop = min(start + chunk, n - window + 1)
+            block = returns[start:stop + window - 1]
+            c1 = np.cumsum(np.vstack([zero, block]), axis=0)
+            c2 = np.cumsum(np.vstack([zero, block * block]), axis=0)
+            s1 = c1[window:] - c1[:-window]
+            s2 = c2[window:] - c2[:-window]
+            var = (s2 - s1 * s1 / window) / (window - 1)
+            out[start:stop] = np.sqrt(np.maximum(var, 0.0))
+        return out
+
+    columns = len(returns[0])
+    out = []
+    for start in range(0, n - window + 1, chunk):
+        stop = min(start + chunk, n - window + 1)
+        s1 = [0.0] * columns
+        s2 = [0.0] * columns
+        for t in range(start, start + window):
+            for k, r in enumerate(returns[t]):
+                s1[k] += r
+                s2[k] += r * r
+        for t in range(start, stop):
+            if t > start:
+                for k in range(columns):
+                    old, new = returns[t - 1][k], returns[t + window - 1][k]
+                    s1[k] += new - old
+                    s2[k] += new * new - old * old
+            out.append([math.sqrt(max((s2[k] - s1[k] * s1[k] / window) / (window - 1), 0.0)) for k in range(columns)])
+    return out
+
+
+def correlation(returns, window: int) -> list[list[float]]:
+    """
+    Ф-ция возвращает матрицу корреляций доходностей за последние window точек
+    """
+    tail = returns[-window:]
+    if np is not None:
+        tail = np.asarray(tail, dtype=np.float64)
+        if tail.shape[1] == 1:
+            return [[1.0]]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.corrcoef(tail, rowvar=False).tolist()
+
+    columns = list(zip(*tail))
+    means = [sum(col) / len(col) for col in columns]
+    centered = [[x - m for x in col] for col, m in zip(columns, means)]
+    norms = [math.sqrt(sum(x * x for x in col)) for col in centered]
+    return [
+        [
+            sum(a * b for a, b in zip(ci, cj)) / (ni * nj) if ni and nj else math.nan
+            for cj, nj in zip(centered, norms)
+        ]
+        for ci, ni in zip(centered, norms)
+    ]
+
+
+def historical_var(returns, values: list[float], confidence: float, window: int | None = None) -> tuple[float, float]:
+    """
+    Ф-ция считает исторический VaR и expected shortfall портфеля: позиции values (в базовой валюте)
+    переоцениваются по каждому историческому сценарию доходностей. Возвращает (VaR, ES) как
+    положительные суммы убытка
+    """
+    tail = returns[-window:] if window else returns
+    if np is not None:
+        scenarios = np.expm1(np.asarray(tail, dtype=np.float64)) @ np.asarray(values, dtype=np.float64)
+        cutoff = np.quantile(scenarios, 1 - confidence)
+        losses = scenarios[scenarios <= cutoff]
+        return float(-cutoff), float(-losses.mean())
+
+    scenarios = sorted(sum(math.expm1(r) * v for r, v in zip(row, values)) for row in tail)
+    # та же линейная интерполяция квантиля, что и у numpy.quantile
+    pos = (len(scenarios) - 1) * (1 - confidence)
+    lo = int(pos)
+    hi = min(lo + 1, len(scenarios) - 1)
+    cutoff = scenarios[lo] + (scenarios[hi] - scenarios[lo]) * (pos - lo)
+    losses = [s for s in scenarios if s <= cutoff]
+    return -cutoff, -sum(losses) / len(losses)
+
+
+def annualize(volatility: float, interval: str) -> float:
+    return volatility * math.sqrt(SECONDS_PER_YEAR / config.OHLC_RESOLUTIONS[interval])
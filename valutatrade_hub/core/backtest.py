@@ -0,0 +1,296 @@
+import itertools
+import logging
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from valutatrade_hub.core.orders import BUY, SELL, apply_fill
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import Storage
+
+logger = logging.getLogger("ValutaTrade.Backtest")
+config = ParserConfig()
+
+STRATEGIES: dict[str, type] = {}
+
+# история курсов в процессе пула: передаётся один раз на процесс через initializer
+_steps: list | None = None
+
+
+def register_strategy(name: str):
+    """
+    Декоратор регистрирует класс стратегии под именем name. Стратегия создаётся с параметрами
+    запуска (strategy(**params)) и получает шаги через on_step(ctx); для пула процессов модуль
+    со стратегией должен импортироваться в дочерних процессах
+    """
+    def decorator(cls):
+        STRATEGIES[name] = cls
+        return cls
+    return decorator
+
+
+def load_steps(since: str | None = None, until: str | None = None, base: str | None = None) -> list[tuple]:
+    """
+    Ф-ция читает историю курсов к base в порядке времени и группирует записи с одинаковым
+    timestamp в шаги виртуальных часов: [(timestamp, {код: курс}), ...]
+    """
+    base = base or config.BASE_CURRENCY
+    steps = []
+    for timestamp, records in itertools.groupby(Storage(config).iter_history(since, until), key=lambda r: r["timestamp"]):
+        ticks = {}
+        for r in records:
+            rate = r.get("rate")
+            if r.get("to_currency") == base and isinstance(rate, (int, float)) and rate > 0:
+                ticks[r["from_currency"]] = float(rate)
+        if ticks:
+            steps.append((timestamp, dict(sorted(ticks.items()))))
+    return steps
+
+
+class Context:
+    """
+    Состояние одного прогона: виртуальные часы (now), последние курсы и копия портфеля в памяти.
+    Сделки проводятся той же ф-цией, что и исполнение ордеров (apply_fill): обе ноги сразу,
+    при нехватке средств сделка отклоняется
+    """
+
+    def __init__(self, cash: float, base: str) -> None:
+        self.base = base
+        self.now: str | None = None
+        self.prices: dict[str, float] = {}
+        self.wallets: dict = {base: {"balance": cash}}
+        self.trades: list[tuple] = []
+        self.rejected = 0
+
+    def balance(self, code: str) -> float:
+        return self.wallets.get(code, {}).get("balance", 0.0)
+
+    def value(self, code: str) -> float:
+        if code == self.base:
+            return self.balance(code)
+        return self.balance(code) * self.prices.get(code, 0.0)
+
+    def equity(self) -> float:
+        return sum(self.value(code) for code in self.wallets)
+
+    def _trade(self, side: str, code: str, amount: float) -> bool:
+        rate = self.prices.get(code)
+        if rate is None or amount <= 0 or code == self.base:
+            return False
+        order = {"pair": f"{code}_{self.base}", "side": side, "amount": amount}
+        if not apply_fill(self.wallets, order, rate, self.base):
+            self.rejected += 1
+            return False
+        self.trades.append((self.now, side, code, amount, rate))
+        return True
+
+    def buy(self, code: str, amount: float) -> bool:
+        return self._trade(BUY, code, amount)
+
+    def sell(self, code: str, amount: float) -> bool:
+        return self._trade(SELL, code, amount)
+
+    def order_value(self, code: str, target: float) -> bool:
+        """
+        Ф-ция докупает или продаёт валюту до стоимости позиции target (в базовой валюте)
+        """
+        rate = self.prices.get(code)
+        if not rate:
+            return False
+        delta = target - self.value(code)
+        if delta > 0:
+            cash = self.balance(self.base)
+            amount = min(delta, cash) / rate
+            # не больше доступного кеша, чтобы округление не отклонило сделку
+            while amount > 0 and amount * rate > cash:
+                amount = math.nextafter(amount, 0.0)
+            return self.buy(code, amount)
+        return self.sell(code, min(-delta / rate, self.balance(code)))
+
+
+@register_strategy("hold")
+class BuyAndHold:
+    """
+    Покупает валюты поровну на весь кеш, как только известны курсы всех, и держит
+    """
+
+    def __init__(self, codes: str = "") -> None:
+        self.codes = [c for c in codes.upper().split("+") if c]
+        self.done = False
+
+    def on_step(self, ctx: Context) -> None:
+        if self.done:
+            return
+        codes = self.codes or sorted(ctx.prices)
+        if not all(code in ctx.prices for code in codes):
+            return
+        cash = ctx.balance(ctx.base)
+        for code in codes:
+            ctx.order_value(code, cash / len(codes))
+        self.done = True
+
+
+@register_strategy("rebalance")
+class Rebalance:
+    """
+    Равные веса валют (и доля cash в базовой валюте); ребалансировка, когда вес любой позиции
+    отклонился от целевого больше чем на threshold
+    """
+
+    def __init__(self, threshold: float = 0.05, cash: float = 0.0, codes: str = "") -> None:
+        self.threshold = float(threshold)
+        self.cash = float(cash)
+        if not 0 < self.threshold < 1 or not 0 <= self.cash < 1:
+            raise ValueError("threshold must be in (0, 1), cash in [0, 1)")
+        self.codes = [c for c in codes.upper().split("+") if c]
+
+    def on_step(self, ctx: Context) -> None:
+        codes = self.codes or sorted(ctx.prices)
+        codes = [code for code in codes if code in ctx.prices]
+        if not codes:
+            return
+        equity = ctx.equity()
+        target = equity * (1 - self.cash) / len(codes)
+        if equity <= 0 or all(abs(ctx.value(code) - target) / equity <= self.threshold for code in codes):
+            return
+        # сначала продажи, чтобы покупкам хватило кеша
+        ordered = sorted(codes, key=lambda code: ctx.value(code) - target, reverse=True)
+        for code in ordered:
+            ctx.order_value(code, target)
+
+
+@register_strategy("momentum")
+class Momentum:
+    """
+    Пересечение скользящих средних по каждой валюте: когда короткая средняя (short шагов)
+    поднимается выше длинной (long шагов), покупается позиция на 1/N капитала, когда опускается
+    ниже - валюта продаётся в кеш
+    """
+
+    def __init__(self, short: int = 5, long: int = 20, codes: str = "") -> None:
+        self.short = int(short)
+        self.long = int(long)
+        if not 0 < self.short <= self.long:
+            raise ValueError("short and long must be positive, short <= long")
+        self.codes = [c for c in codes.upper().split("+") if c]
+        self.history: dict[str, list] = {}
+        self.signals: dict[str, bool] = {}
+
+    def on_step(self, ctx: Context) -> None:
+        codes = self.codes or sorted(ctx.prices)
+        for code in codes:
+            if code in ctx.prices:
+                series = self.history.setdefault(code, [])
+                series.append(ctx.prices[code])
+                del series[:-self.long]
+
+        ready = [code for code in codes if len(self.history.get(code, ())) >= self.long]
+        if not ready:
+            return
+        target = ctx.equity() / len(codes)
+        changed = {}
+        for code in ready:
+            series = self.history[code]
+            signal = sum(series[-self.short:]) / self.short > sum(series) / len(series)
+            if signal != self.signals.get(code, False):
+                changed[code] = self.signals[code] = signal
+        # сначала продажи, чтобы покупкам хватило кеша
+        for code in sorted(changed, key=lambda c: changed[c]):
+            ctx.order_value(code, target if changed[code] else 0.0)
+
+
+def _max_drawdown(curve: list[tuple]) -> float:
+    peak = -math.inf
+    worst = 0.0
+    for _, equity in curve:
+        peak = max(peak, equity)
+        if peak > 0:
+            worst = max(worst, 1 - equity / peak)
+    return worst
+
+
+def run_backtest(spec: tuple, steps: list, cash: float, base: str) -> dict:
+    """
+    Ф-ция прогоняет стратегию spec = (имя, параметры) по шагам истории и возвращает
+    кривую капитала [(timestamp, equity), ...] и сводку прогона
+    """
+    name, params = spec
+    strategy = STRATEGIES[name](**params)
+    ctx = Context(cash, base)
+    curve = []
+    for timestamp, ticks in steps:
+        ctx.now = timestamp
+        ctx.prices.update(ticks)
+        strategy.on_step(ctx)
+        curve.append((timestamp, ctx.equity()))
+
+    final = curve[-1][1] if curve else cash
+    return {
+        "strategy": name,
+        "params": params,
+        "final": final,
+        "return": final / cash - 1 if cash else 0.0,
+        "max_drawdown": _max_drawdown(curve),
+        "trades": len(ctx.trades),
+        "rejected": ctx.rejected,
+        "curve": curve,
+    }
+
+
+def _init_worker(steps: list) -> None:
+    global _steps
+    _steps = steps
+
+
+def _run_in_worker(args: tuple) -> dict:
+    spec, cash, base = args
+    return run_backtest(spec, _steps, cash, base)
+
+
+def parse_specs(text: str) -> list[tuple]:
+    """
+    Ф-ция разбирает описание прогонов "имя:ключ=v1|v2,ключ2=v;имя2" в список (имя, параметры):
+    значения через | раскрываются в декартово произведение наборов параметров
+    """
+    specs = []
+    for part in text.split(";"):
+        name, _, raw = part.strip().partition(":")
+        if not name:
+            continue
+        if name not in STRATEGIES:
+            raise ValueError(f"unknown strategy: {name}")
+        keys, choices = [], []
+        for item in filter(None, raw.split(",")):
+            key, sep, values = item.partition("=")
+            if not sep:
+                raise ValueError(f"bad parameter: {item}")
+            keys.append(key.strip())
+            choices.append(values.split("|"))
+        for combo in itertools.product(*choices):
+            params = dict(zip(keys, combo))
+            # стратегия проверяет параметры в конструкторе: ошибка видна до запуска прогонов
+            try:
+                STRATEGIES[name](**params)
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"{name}: {e}") from e
+            specs.append((name, params))
+    return specs
+
+
+def run_backtests(specs: list[tuple], cash: float, since: str | None = None, until: str | None = None,
+                  base: str | None = None, workers: int | None = None) -> list[dict]:
+    """
+    Ф-ция загружает историю один раз и прогоняет все стратегии: при нескольких прогонах - в пуле
+    процессов, история передаётся каждому процессу один раз и только читается.
+    Результаты идут в порядке specs и не зависят от числа процессов
+    """
+    base = base or config.BASE_CURRENCY
+    steps = load_steps(since, until, base)
+    logger.info(f"Backtest: {len(specs)} runs over {len(steps)} steps")
+    workers = min(workers or os.cpu_count() or 1, len(specs))
+    tasks = [(spec, cash, base) for spec in specs]
+
+    if workers <= 1:
+        return [run_backtest(spec, steps, cash, base) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(steps,)) as pool:
+        return list(pool.map(_run_in_worker, tasks))
@@ -0,0 +1,329 @@
+import csv
+import gzip
+import json
+import math
+import os
+from datetime import datetime
+from functools import lru_cache
+from itertools import islice
+
+from valutatrade_hub.core.currencies import get_currency_registry
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.rates_index import get_rates_index
+from valutatrade_hub.core.timeseries import asof_indices, rate_steps
+from valutatrade_hub.parser_service.config import ParserConfig
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость (extra "fast")
+    np = None
+
+config = ParserConfig()
+
+CHUNK_ROWS = 65536
+IN_FIELDS = ["amount", "from", "to", "timestamp"]
+OUT_FIELDS = ["rate", "converted"]
+
+
+@lru_cache(maxsize=65536)
+def _ts_ms(value: str) -> int | None:
+    """
+    Ф-ция переводит timestamp строки (ISO или epoch в секундах) в мс; в выгрузках даты
+    повторяются, поэтому разбор кешируется
+    """
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return int(float(value) * 1000)
+    except ValueError:
+        pass
+    try:
+        return int(datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp() * 1000)
+    except ValueError:
+        return None
+
+
+class Converter:
+    """
+    Пересчёт сумм между валютами пачками. Текущие курсы берутся из одного снимка индекса
+    курсов, взятого при создании; строки с timestamp пересчитываются по курсу as-of из истории
+    (последний курс не позже момента строки). Ряды истории загружаются лениво, по одному на валюту
+    """
+
+    def __init__(self, base: str | None = None) -> None:
+        self.base = base or config.BASE_CURRENCY
+        self.spot = {e.code: e.rate for e in get_rates_index().select(base=self.base)}
+        self.spot[self.base] = 1.0
+        self.registry = get_currency_registry()
+        self._codes: dict = {}
+        self._factors: dict = {}
+        self._series: dict = {}
+
+    def _code(self, raw) -> str | None:
+        code = self._codes.get(raw, False)
+        if code is False:
+            try:
+                code = self.registry.normalize(raw)
+            except CurrencyNotFoundError:
+                code = None
+            self._codes[raw] = code
+        return code
+
+    def _factor(self, pair: tuple) -> float:
+        factor = self._factors.get(pair)
+        if factor is None:
+            src, dst = self._code(pair[0]), self._code(pair[1])
+            rate_src, rate_dst = self.spot.get(src), self.spot.get(dst)
+            factor = rate_src / rate_dst if rate_src and rate_dst else math.nan
+            self._factors[pair] = factor
+        return factor
+
+    def _history(self, code: str) -> tuple[list, list]:
+        series = self._series.get(code)
+        if series is None:
+            times, rates = rate_steps(code, self.base)
+            if np is not None:
+                times, rates = np.asarray(times, dtype=np.int64), np.asarray(rates, dtype=np.float64)
+            series = self._series[code] = (times, rates)
+        return series
+
+    def _asof_rates(self, raw_codes: list, times: list, rows: list[int], out) -> None:
+        """
+        Ф-ция заполняет out[i] курсом валюты строки i к базе на момент строки (для строк rows)
+        """
+        by_code: dict = {}
+        for i in rows:
+            by_code.setdefault(self._code(raw_codes[i]), []).append(i)
+
+        for code, positions in by_code.items():
+            if code is None:
+                continue
+            if code == self.base:
+                for i in positions:
+                    out[i] = 1.0
+                continue
+            series_times, rates = self._history(code)
+            indices = asof_indices(series_times, [times[i] for i in positions])
+            for i, j in zip(positions, indices):
+                out[i] = rates[j]
+
+    def _spot_vector(self, raw_codes) -> "np.ndarray":
+        """
+        Ф-ция возвращает спот-курс к базе для каждого из (уникальных) сырых кодов, NaN - курс неизвестен
+        """
+        return np.array([self.spot.get(self._code(raw)) or math.nan for raw in raw_codes], dtype=np.float64)
+
+    def _asof_vector(self, raw_codes, inverse, times, dated) -> "np.ndarray":
+        """
+        Ф-ция возвращает курс к базе на момент каждой строки с timestamp (dated), остальным - NaN.
+        inverse - номер кода строки в raw_codes; строки группируются по коду одной сортировкой,
+        и каждая группа присоединяется к ряду истории своей валюты одним searchsorted
+        """
+        out = np.full(len(inverse), math.nan)
+        rows = np.flatnonzero(dated)
+        keys = inverse[rows]
+        order = np.argsort(keys, kind="stable")
+        rows, keys = rows[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+        ends = list(starts[1:]) + [len(keys)]
+
+        for start, end in zip(starts, ends):
+            code = self._code(raw_codes[keys[start]])
+            group = rows[start:end]
+            if code is None:
+                continue
+            if code == self.base:
+                out[group] = 1.0
+                continue
+            series_times, rates = self._history(code)
+            out[group] = rates[asof_indices(series_times, times[group])]
+        return out
+
+    def _convert_np(self, amounts: list, sources: list, targets: list, timestamps: list | None):
+        # коды и timestamp переводятся в номера уникальных значений: курсы считаются
+        # по маленьким векторам уникальных значений и раздаются строкам индексированием
+        src_codes, src_inv = np.unique(np.asarray(sources, dtype=str), return_inverse=True)
+        dst_codes, dst_inv = np.unique(np.asarray(targets, dtype=str), return_inverse=True)
+        src_rates = self._spot_vector(src_codes)[src_inv]
+        dst_rates = self._spot_vector(dst_codes)[dst_inv]
+
+        if timestamps is not None:
+            stamps, ts_inv = np.unique(np.asarray(timestamps, dtype=str), return_inverse=True)
+            parsed = np.array([math.nan if (t := _ts_ms(s)) is None else t for s in stamps], dtype=np.float64)[ts_inv]
+            dated = ~np.isnan(parsed)
+            if dated.any():
+                times = np.where(dated, parsed, 0).astype(np.int64)
+                src_rates = np.where(dated, self._asof_vector(src_codes, src_inv, times, dated), src_rates)
+                dst_rates = np.where(dated, self._asof_vector(dst_codes, dst_inv, times, dated), dst_rates)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            factors = src_rates / dst_rates
+        factors[np.isinf(factors)] = math.nan
+
+        try:
+            values = np.asarray(amounts, dtype=np.float64)
+        except (TypeError, ValueError):
+            values = np.array([_to_float(a) for a in amounts], dtype=np.float64)
+        return factors, values * factors
+
+    def convert(self, amounts: list, sources: list, targets: list, timestamps: list | None = None):
+        """
+        Ф-ция пересчитывает пачку строк. Возвращает (курсы, суммы) - массивы numpy или списки;
+        NaN - курс неизвестен или сумма не число
+        """
+        if np is not None:
+            return self._convert_np(amounts, sources, targets, timestamps)
+
+        n = len(amounts)
+        factors = [self._factor(pair) for pair in zip(sources, targets)]
+
+        if timestamps is not None:
+            times = [_ts_ms(t) if isinstance(t, str) else t for t in timestamps]
+            dated = [i for i, t in enumerate(times) if t is not None]
+            if dated:
+                src_rates = [math.nan] * n
+                dst_rates = [math.nan] * n
+                self._asof_rates(sources, times, dated, src_rates)
+                self._asof_rates(targets, times, dated, dst_rates)
+                for i in dated:
+                    factors[i] = src_rates[i] / dst_rates[i] if dst_rates[i] else math.nan
+
+        values = [_to_float(a) for a in amounts]
+        return factors, [v * f for v, f in zip(values, factors)]
+
+
+def _to_float(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _open(path: str, mode: str, compress: bool | None = None):
+    if path.endswith(".gz") if compress is None else compress:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _is_csv(path: str) -> bool:
+    return path.removesuffix(".gz").lower().endswith(".csv")
+
+
+def _blank(value):
+    return None if value != value else value
+
+
+def _read_chunks(f, is_csv: bool):
+    """
+    Ф-ция читает вход пачками по CHUNK_ROWS: (колонки, строки). Строки CSV - списки,
+    колонки - заголовок; строки JSONL - словари, колонки - None (битая строка или не объект -
+    пустой словарь, такая строка попадает в missing)
+    """
+    if is_csv:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return
+        chunks = iter(lambda: list(islice(reader, CHUNK_ROWS)), [])
+        for rows in chunks:
+            yield header, rows
+    else:
+        for lines in iter(lambda: list(islice(f, CHUNK_ROWS)), []):
+            yield None, [_json_row(line) for line in lines if line.strip()]
+
+
+def _json_row(line: str) -> dict:
+    try:
+        row = json.loads(line)
+    except json.JSONDecodeError:
+        return {}
+    return row if isinstance(row, dict) else {}
+
+
+def _columns(header: list | None, rows: list) -> tuple:
+    """
+    Ф-ция выделяет из пачки колонки amount, from, to и timestamp (None, если её нет)
+    """
+    if header is None:
+        timestamps = None
+        if any("timestamp" in r for r in rows):
+            timestamps = [str(r.get("timestamp") or "") for r in rows]
+        return [r.get("amount") for r in rows], [r.get("from") for r in rows], [r.get("to") for r in rows], timestamps
+
+    index = {name.strip().lower(): i for i, name in enumerate(header)}
+    try:
+        ia, ifrom, ito = index["amount"], index["from"], index["to"]
+    except KeyError as e:
+        raise ValueError(f"missing column: {e.args[0]}") from e
+    it = index.get("timestamp")
+    width = max(i for i in (ia, ifrom, ito, it) if i is not None) + 1
+    for n, r in enumerate(rows):
+        if len(r) < width:
+            # короткая строка CSV дополняется пустыми ячейками: её сумма не пересчитается (missing)
+            rows[n] = r + [""] * (width - len(r))
+    return (
+        [r[ia] for r in rows],
+        [r[ifrom] for r in rows],
+        [r[ito] for r in rows],
+        [r[it] for r in rows] if it is not None else None,
+    )
+
+
+def convert_file(src: str, dst: str, base: str | None = None) -> dict:
+    """
+    Ф-ция потоково пересчитывает файл строк (amount, from, to[, timestamp]) в CSV или JSON Lines
+    (формат по расширению, .gz - сжатие). К строкам добавляются колонки rate и converted,
+    память не зависит от размера файла. Результат пишется во временный файл и заменяет dst
+    только после успешного пересчёта, поэтому dst может совпадать с src, а сбой посреди
+    пересчёта не оставляет недописанный файл
+    """
+    converter = Converter(base)
+    tmp_path = f"{dst}.{os.getpid()}.tmp"
+    try:
+        with _open(src, "r") as fin, _open(tmp_path, "w", compress=dst.endswith(".gz")) as fout:
+            result = _convert_stream(converter, _is_csv(src), _is_csv(dst), fin, fout)
+        os.replace(tmp_path, dst)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return result
+
+
+def _convert_stream(converter: Converter, src_csv: bool, dst_csv: bool, fin, fout) -> dict:
+    total = 0
+    missing = 0
+    writer = None
+
+    for header, rows in _read_chunks(fin, src_csv):
+        rates, converted = converter.convert(*_columns(header, rows))
+        if np is not None:
+            rates, converted = rates.tolist(), converted.tolist()
+        chunk_missing = sum(1 for v in converted if v != v)
+        if chunk_missing or any(r != r for r in rates):
+            # NaN пишется пустой ячейкой CSV и null в JSON
+            rates = [_blank(r) for r in rates]
+            converted = [_blank(c) for c in converted]
+        missing += chunk_missing
+        total += len(rows)
+
+        if header is not None and not dst_csv:
+            rows = [dict(zip(header, row)) for row in rows]
+        elif header is None and dst_csv:
+            header = IN_FIELDS
+            rows = [[row.get(name, "") for name in IN_FIELDS] for row in rows]
+
+        if dst_csv:
+            if writer is None:
+                writer = csv.writer(fout)
+                writer.writerow(list(header) + OUT_FIELDS)
+            # числа форматирует сам csv.writer (repr), None - пустая ячейка
+            writer.writerows([[*row, r, c] for row, r, c in zip(rows, rates, converted)])
+        else:
+            fout.writelines(
+                json.dumps(dict(row, rate=r, converted=c), ensure_ascii=False, separators=(",", ":"))
+                + "\n"
+                for row, r, c in zip(rows, rates, converted)
+            )
+
+    return {"rows": total, "missing": missing}
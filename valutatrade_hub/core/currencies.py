@@ -1,6 +1,10 @@
+import functools
+import json
+import sys
 from abc import ABC, abstractmethod
 
 from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.infra.settings import settings
 
 
 class Currency(ABC):
@@ -43,24 +47,129 @@ class CryptoCurrency(Currency):
         return f'[CRYPTO] {self.code} — {self.name} (Algo: {self.algorithm}, MCAP: {self.market_cap})'
 
 
+class CurrencyRegistry:
+    """
+    Общий для процесса реестр валют.
+    Коды и классы активов берутся из конфигурации, коды интернируются,
+    а метаданные (название, страна, алгоритм) читаются из файла
+    и превращаются в объекты Currency только при первом обращении
+    """
+
+    def __init__(self, codes_by_class: dict, metadata_path: str | None = None, metadata: dict | None = None) -> None:
+        self._classes: dict[str, str] = {}
+        for asset_class, codes in codes_by_class.items():
+            for code in codes:
+                self._classes.setdefault(sys.intern(code.strip().upper()), asset_class)
+
+        self._by_class: dict[str, tuple] = {}
+        for code, asset_class in self._classes.items():
+            self._by_class.setdefault(asset_class, ())
+            self._by_class[asset_class] += (code,)
+
+        self._metadata_path = metadata_path
+        self._metadata = metadata
+        self._currencies: dict[str, Currency] = {}
+
+    def __contains__(self, code) -> bool:
+        return isinstance(code, str) and code.strip().upper() in self._classes
+
+    def __len__(self) -> int:
+        return len(self._classes)
+
+    def normalize(self, code: str) -> str:
+        """
+        Ф-ция возвращает интернированный код валюты или бросает CurrencyNotFoundError
+        """
+        code_upper = code.strip().upper() if isinstance(code, str) else str(code)
+        if code_upper not in self._classes:
+            raise CurrencyNotFoundError(code_upper)
+        return sys.intern(code_upper)
+
+    def asset_class(self, code: str) -> str | None:
+        """
+        Ф-ция возвращает класс актива ('fiat'/'crypto') или None для неизвестной валюты
+        """
+        return self._classes.get(code)
+
+    def codes(self, asset_class: str | None = None) -> tuple:
+        if asset_class is None:
+            return tuple(self._classes)
+        return self._by_class.get(asset_class, ())
+
+    def get_currency(self, code: str) -> Currency:
+        """
+        Ф-ция возвращает объект валюты, создавая его при первом обращении
+        """
+        code = self.normalize(code)
+        currency = self._currencies.get(code)
+        if currency is None:
+            currency = self._currencies[code] = self._make_currency(code)
+        return currency
+
+    def _make_currency(self, code: str) -> Currency:
+        meta = self._load_metadata().get(code, {})
+        name = meta.get("name") or code
+
+        if self._classes[code] == "crypto":
+            return CryptoCurrency(name, code, meta.get("algorithm", "unknown"), meta.get("market_cap", "unknown"))
+        return FiatCurrency(name, code, meta.get("issuing_country", "unknown"))
+
+    def _load_metadata(self) -> dict:
+        if self._metadata is None:
+            self._metadata = _read_metadata(self._metadata_path)
+        return self._metadata
+
+
+def _read_metadata(path: str | None) -> dict:
+    if not path:
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            loaded = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return loaded if isinstance(loaded, dict) else {}
+
+
+@functools.cache
+def get_currency_registry() -> CurrencyRegistry:
+    """
+    Ф-ция строит реестр валют один раз на процесс.
+    Классы берутся из ParserConfig, дополнительные коды - из supported_currencies
+    (их класс определяется по файлу метаданных)
+    """
+    from valutatrade_hub.parser_service.config import ParserConfig
+
+    parser_config = ParserConfig()
+    metadata_path = settings.get_data_file_path("currencies.json")
+    codes_by_class = {
+        "fiat": (parser_config.BASE_CURRENCY, *parser_config.FIAT_CURRENCIES),
+        "crypto": tuple(parser_config.CRYPTO_CURRENCIES),
+    }
+
+    known = {code for codes in codes_by_class.values() for code in codes}
+    extra = [code.upper() for code in settings.get("supported_currencies", []) if code.upper() not in known]
+
+    metadata = None
+    if extra:
+        metadata = _read_metadata(metadata_path)
+        for code in extra:
+            asset_class = metadata.get(code, {}).get("type", "fiat")
+            codes_by_class[asset_class] = (*codes_by_class.get(asset_class, ()), code)
+
+    return CurrencyRegistry(codes_by_class, metadata_path, metadata)
+
+
 class CurrencyMaker:
+    """
+    Совместимая обёртка над общим реестром валют
+    """
+
     def __init__(self) -> None:
-        self.__currency_dict = {
-            "USD": FiatCurrency("US Dollar", "USD", "United States"),
-            "BTC": CryptoCurrency("Bitcoin", "BTC", "SHA-256", "1.12e12"),
-            "ETH": CryptoCurrency("Ethereum", "ETH", "SHA-256", "1.12e12"),
-            "SOL": CryptoCurrency("Solana", "SOL", "SHA-256", "1.12e12"),
-            "EUR": FiatCurrency("Euro", "EUR", "European Union"),
-            "GBP": FiatCurrency("British Pound", "GBP", "United Kingdom"),
-            "RUB": FiatCurrency("Ruble", "RUB", "Russian Federation"),
-        }
+        self._registry = get_currency_registry()
 
     def get_currency(self, code: str):
-        code_upper = code.upper()
-        currency = self.__currency_dict.get(code_upper)
-        if currency is None:
-            raise CurrencyNotFoundError(code_upper)
-        return currency
+        return self._registry.get_currency(code)
 
     def get_currency_list(self):
-        return list(self.__currency_dict.keys())
+        return list(self._registry.codes())
@@ -1,7 +1,7 @@
 class CurrencyNotFoundError(Exception):
     """
     Исключение, возникающее при попытке получить неизвестную валюту
-    Выбрасывается в currencies.get_currency() и get-rate
+    Выбрасывается в CurrencyRegistry.normalize()/get_currency() и get-rate
     """
 
     def __init__(self, code: str):
@@ -33,3 +33,15 @@ class ApiRequestError(Exception):
     def __init__(self, reason: str):
         self.reason = reason
         super().__init__(f"Ошибка при обращении к внешнему API: {reason}")
+
+
+class CircuitOpenError(ApiRequestError):
+    """
+    Источник отключён автоматом (circuit breaker) после серии сбоев
+    Выбрасывается в BreakerClient.fetch_rates() без обращения к сети
+    """
+
+    def __init__(self, source: str, retry_in: float):
+        self.source = source
+        self.retry_in = retry_in
+        super().__init__(f"источник {source} временно отключён, повтор через {retry_in:.0f} с")
@@ -0,0 +1,116 @@
+import csv
+import gzip
+import json
+
+from valutatrade_hub.core.ledger import get_trade_ledger
+from valutatrade_hub.core.utils import iter_json_array
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import Storage
+
+config = ParserConfig()
+
+FORMATS = ("csv", "jsonl")
+
+# поля пользователя, которые никогда не попадают в выгрузку
+SECRET_FIELDS = {"hashed_password", "salt"}
+
+HISTORY_FIELDS = ["id", "from_currency", "to_currency", "rate", "timestamp", "source"]
+PORTFOLIO_FIELDS = ["user_id", "currency", "balance"]
+USER_FIELDS = ["user_id", "username", "registration_date"]
+TRADE_FIELDS = ["trade_id", "user_id", "side", "currency", "amount", "price", "base", "timestamp", "source"]
+
+
+def _bound(value: str | None, end: bool) -> str | None:
+    """
+    Ф-ция превращает дату YYYY-MM-DD в границу интервала по timestamp истории
+    """
+    if value and len(value) == 10:
+        return value + ("T23:59:59" if end else "T00:00:00")
+    return value
+
+
+def iter_history_rows(since: str | None = None, until: str | None = None, pairs=None):
+    """
+    Ф-ция потоково отдаёт записи истории курсов в порядке времени
+    """
+    records = Storage(config).iter_history(_bound(since, False), _bound(until, True), pairs)
+    for record in records:
+        yield {field: record.get(field) for field in HISTORY_FIELDS}
+
+
+def iter_portfolio_rows(user_id: int | None = None):
+    """
+    Ф-ция отдаёт портфели построчно: один кошелёк - одна строка
+    """
+    db = get_database()
+    if user_id is None:
+        portfolios = db.iter_portfolios(iter_json_array)
+    else:
+        portfolios = filter(None, [db.portfolio(user_id)])
+    for portfolio in portfolios:
+        for currency, wallet in (portfolio.get("wallets") or {}).items():
+            yield {
+                "user_id": portfolio.get("user_id"),
+                "currency": currency,
+                "balance": wallet.get("balance", 0.0),
+            }
+
+
+def iter_user_rows(user_id: int | None = None):
+    """
+    Ф-ция отдаёт пользователей без хеша пароля и соли
+    """
+    db = get_database()
+    if user_id is None:
+        users = db.iter_users(iter_json_array)
+    else:
+        users = filter(None, [db.user(user_id)])
+    for user in users:
+        yield {k: v for k, v in user.items() if k not in SECRET_FIELDS}
+
+
+def iter_trade_rows(user_id: int | None = None):
+    """
+    Ф-ция потоково отдаёт сделки из журналов
+    """
+    return get_trade_ledger().iter_trades(user_id)
+
+
+def _open_output(path: str, compress: bool):
+    if compress:
+        return gzip.open(path, "wt", encoding="utf-8", newline="")
+    return open(path, "w", encoding="utf-8", newline="")
+
+
+def write_rows(rows, fieldnames: list[str], path: str, fmt: str, compress: bool = False) -> int:
+    """
+    Ф-ция построчно пишет строки в CSV или JSON Lines (опционально gzip) и возвращает их число.
+    Строки не накапливаются в памяти
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"unknown format: {fmt}")
+
+    count = 0
+    with _open_output(path, compress) as f:
+        if fmt == "csv":
+            writer = csv.DictWriter(f, fieldnames=fieldnames, extrasaction="ignore")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow(row)
+                count += 1
+        else:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+                count += 1
+    return count
+
+
+# что выгружаем -> (генератор строк, поля CSV)
+EXPORTS = {
+    "history": (iter_history_rows, HISTORY_FIELDS),
+    "portfolios": (iter_portfolio_rows, PORTFOLIO_FIELDS),
+    "users": (iter_user_rows, USER_FIELDS),
+    "trades": (iter_trade_rows, TRADE_FIELDS),
+}
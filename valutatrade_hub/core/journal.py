@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+from contextlib import contextmanager
+
+from valutatrade_hub.core.utils import write_text_atomic
+from valutatrade_hub.parser_service.refresh_lock import RefreshLock
+
+logger = logging.getLogger("ValutaTrade.Journal")
+
+# после стольких операций в журнале снимок переписывается, а журнал начинается заново
+COMPACT_EVERY = 1000
+LOCK_TIMEOUT = 60
+
+
+class JournaledBook:
+    """
+    Основа книг (ордера, алерты), которые хранятся снимком JSON и журналом операций.
+    Изменение дописывает в журнал одну строку, снимок переписывается раз в COMPACT_EVERY операций.
+    Снимок хранит номер поколения журнала (gen): при сжатии пишется снимок со следующим
+    поколением, и только потом удаляется старый журнал, поэтому читатель никогда не применит
+    операцию дважды. Между вызовами refresh дочитываются только новые строки журнала.
+
+    Подкласс задаёт _load(data), _dump() и _apply(op); изменения проводятся через _do(op)
+    внутри transaction()
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._root = os.path.splitext(path)[0]
+        self.lock_path = f"{self._root}.lock"
+        self._stamp = None
+        self._gen = 0
+        self._offset = 0
+        self._entries = 0
+        self._pending: list[dict] = []
+        self._in_transaction = False
+        self._load({})
+
+    def _load(self, data: dict) -> None:
+        raise NotImplementedError
+
+    def _dump(self) -> dict:
+        raise NotImplementedError
+
+    def _apply(self, op: dict) -> None:
+        raise NotImplementedError
+
+    def _journal_path(self, gen: int) -> str:
+        return f"{self._root}.{gen}.journal"
+
+    def refresh(self) -> None:
+        """
+        Ф-ция перечитывает снимок, если его переписали, и дочитывает новые операции журнала
+        """
+        try:
+            st = os.stat(self.path)
+            stamp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            stamp = None
+
+        if stamp != self._stamp:
+            data = {}
+            if stamp is not None:
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        data = json.load(f)
+                except (OSError, json.JSONDecodeError):
+                    data = {}
+            self._stamp = stamp
+            self._gen = data.get("gen", 0)
+            self._offset = 0
+            self._entries = 0
+            self._load(data)
+
+        try:
+            with open(self._journal_path(self._gen), "rb") as f:
+                f.seek(self._offset)
+                chunk = f.read()
+        except OSError:
+            return
+        # недописанная последняя строка будет прочитана в следующий раз
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            try:
+                op = json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping broken line in {self._journal_path(self._gen)}")
+                continue
+            self._apply(op)
+            self._entries += 1
+        self._offset += end
+
+    @contextmanager
+    def transaction(self):
+        """
+        Контекст изменения книги: межпроцессная блокировка, актуальное состояние на входе,
+        запись операций в журнал на выходе. При исключении несохранённые изменения
+        отбрасываются: книга перечитывается с диска
+        """
+        lock = RefreshLock(self.lock_path)
+        if not lock.acquire(timeout=LOCK_TIMEOUT):
+            raise TimeoutError(f"{self.lock_path} is busy for more than {LOCK_TIMEOUT} s")
+        try:
+            self.refresh()
+            self._in_transaction = True
+            try:
+                yield self
+                self._commit()
+            except BaseException:
+                # несохранённые изменения отбрасываются перечитыванием с диска
+                self._stamp = False
+                raise
+            finally:
+                self._in_transaction = False
+                self._pending.clear()
+        finally:
+            lock.release()
+
+    def _do(self, op: dict) -> None:
+        if not self._in_transaction:
+            raise RuntimeError("book changes must be made inside transaction()")
+        self._apply(op)
+        self._pending.append(op)
+
+    def _commit(self) -> None:
+        if not self._pending:
+            return
+        if self._entries + len(self._pending) >= COMPACT_EVERY:
+            self._compact()
+            return
+
+        data = "".join(json.dumps(op, ensure_ascii=False, separators=(",", ":")) + "\n" for op in self._pending)
+        data = data.encode("utf-8")
+        with open(self._journal_path(self._gen), "ab") as f:
+            f.write(data)
+        self._offset += len(data)
+        self._entries += len(self._pending)
+
+    def _compact(self) -> None:
+        """
+        Ф-ция переписывает снимок со следующим поколением журнала и удаляет старый журнал
+        """
+        old = self._journal_path(self._gen)
+        self._gen += 1
+        data = dict(self._dump(), gen=self._gen)
+        write_text_atomic(self.path, json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        st = os.stat(self.path)
+        self._stamp = (st.st_mtime_ns, st.st_size)
+        self._offset = 0
+        self._entries = 0
+        try:
+            os.remove(old)
+        except OSError:
+            pass
@@ -0,0 +1,232 @@
+import json
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+
+from valutatrade_hub.core.utils import write_text_atomic
+from valutatrade_hub.infra.settings import settings
+
+logger = logging.getLogger("ValutaTrade.Ledger")
+
+BUY = "buy"
+SELL = "sell"
+EPS = 1e-12
+# состояние лотов сохраняется не чаще, чем раз в столько сделок (и не чаще, чем раз в число
+# открытых лотов, чтобы запись снимка оставалась амортизированно O(1) на сделку):
+# журнал - источник истины, а хвост после сохранённого смещения доигрывается при загрузке
+CHECKPOINT_EVERY = 100
+
+
+class LotBook:
+    """
+    FIFO-лоты одного пользователя, поддерживаемые инкрементально по журналу сделок.
+    По каждой валюте хранятся очередь лотов [количество, цена], суммарная позиция,
+    стоимость открытых лотов и накопленный реализованный P&L, поэтому сделка стоит
+    O(затронутых лотов), а чтение P&L - O(1) на валюту
+    """
+
+    def __init__(self, ledger_path: str, state_path: str) -> None:
+        self.ledger_path = ledger_path
+        self.state_path = state_path
+        self.offset = 0
+        self.trades = 0
+        self.pending = 0
+        self.currencies: dict[str, dict] = {}
+
+        try:
+            with open(state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            state = {}
+
+        if state:
+            self.offset = state.get("offset", 0)
+            self.trades = state.get("trades", 0)
+            for code, data in state.get("currencies", {}).items():
+                self.currencies[code] = dict(data, lots=deque(data.get("lots", [])))
+
+    def _currency(self, code: str) -> dict:
+        return self.currencies.setdefault(
+            code,
+            {"lots": deque(), "position": 0.0, "cost": 0.0, "realized": 0.0, "unmatched": 0.0},
+        )
+
+    def apply(self, trade: dict) -> None:
+        """
+        Ф-ция проводит сделку по лотам: покупка открывает лот, продажа закрывает лоты с головы очереди
+        """
+        data = self._currency(trade["currency"])
+        amount, price = trade["amount"], trade["price"]
+
+        if trade["side"] == BUY:
+            data["lots"].append([amount, price])
+            data["position"] += amount
+            data["cost"] += amount * price
+        else:
+            lots = data["lots"]
+            left = amount
+            while left > EPS and lots:
+                lot = lots[0]
+                matched = min(lot[0], left)
+                data["realized"] += matched * (price - lot[1])
+                data["position"] -= matched
+                data["cost"] -= matched * lot[1]
+                lot[0] -= matched
+                left -= matched
+                if lot[0] <= EPS:
+                    lots.popleft()
+            # продано то, что было куплено до появления журнала: себестоимость неизвестна
+            if left > EPS:
+                data["unmatched"] += left
+            if not lots:
+                data["position"] = 0.0
+                data["cost"] = 0.0
+
+        self.trades += 1
+        self.pending += 1
+
+    def catch_up(self) -> None:
+        """
+        Ф-ция доигрывает сделки, дописанные в журнал после сохранённого смещения
+        """
+        try:
+            size = os.path.getsize(self.ledger_path)
+        except OSError:
+            return
+        if size < self.offset:
+            # журнал заменён - строим лоты заново
+            self.offset = 0
+            self.trades = 0
+            self.currencies = {}
+        if size == self.offset:
+            return
+
+        with open(self.ledger_path, "rb") as f:
+            f.seek(self.offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # строка ещё дописывается другим процессом
+                    break
+                self.offset += len(line)
+                if line.strip():
+                    self.apply(json.loads(line))
+
+    def save(self) -> None:
+        state = {
+            "offset": self.offset,
+            "trades": self.trades,
+            "currencies": {code: dict(data, lots=list(data["lots"])) for code, data in self.currencies.items()},
+        }
+        write_text_atomic(self.state_path, json.dumps(state, separators=(",", ":")))
+        self.pending = 0
+
+    def checkpoint(self) -> None:
+        open_lots = sum(len(data["lots"]) for data in self.currencies.values())
+        if self.pending >= max(CHECKPOINT_EVERY, open_lots):
+            self.save()
+
+
+class TradeLedger:
+    """
+    Журналы сделок: append-only JSON Lines на пользователя (data/ledger/<user_id>.jsonl)
+    и рядом снимок его FIFO-лотов (<user_id>.lots.json)
+    """
+
+    def __init__(self, directory: str | None = None) -> None:
+        self.directory = directory or settings.get_data_file_path("ledger")
+        self._lock = threading.Lock()
+        self._books: dict[int, LotBook] = {}
+
+    def ledger_path(self, user_id: int) -> str:
+        return os.path.join(self.directory, f"{user_id}.jsonl")
+
+    def _book(self, user_id: int) -> LotBook:
+        book = self._books.get(user_id)
+        if book is None:
+            book = LotBook(self.ledger_path(user_id), os.path.join(self.directory, f"{user_id}.lots.json"))
+            self._books[user_id] = book
+        book.catch_up()
+        return book
+
+    def record(self, user_id: int, side: str, currency: str, amount: float, price: float,
+               base: str, source: str = "cli", timestamp: str | None = None) -> dict:
+        """
+        Ф-ция дописывает сделку в журнал пользователя и проводит её по лотам
+        """
+        with self._lock:
+            book = self._book(user_id)
+            trade = {
+                "trade_id": book.trades + 1,
+                "user_id": user_id,
+                "side": side,
+                "currency": currency,
+                "amount": amount,
+                "price": price,
+                "base": base,
+                "timestamp": timestamp or datetime.now().isoformat(timespec="seconds"),
+                "source": source,
+            }
+            line = (json.dumps(trade, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+            os.makedirs(self.directory, exist_ok=True)
+            with open(book.ledger_path, "ab") as f:
+                f.write(line)
+
+            book.catch_up()
+            book.checkpoint()
+            return trade
+
+    def positions(self, user_id: int) -> dict[str, dict]:
+        """
+        Ф-ция возвращает по каждой валюте позицию, стоимость открытых лотов, реализованный P&L
+        """
+        with self._lock:
+            book = self._book(user_id)
+            return {
+                code: {k: v for k, v in data.items() if k != "lots"} | {"lots": len(data["lots"])}
+                for code, data in book.currencies.items()
+            }
+
+    def iter_trades(self, user_id: int | None = None):
+        """
+        Ф-ция потоково отдаёт сделки из журналов (одного пользователя или всех)
+        """
+        if user_id is not None:
+            paths = [self.ledger_path(user_id)]
+        else:
+            try:
+                names = sorted(n for n in os.listdir(self.directory) if n.endswith(".jsonl"))
+            except OSError:
+                names = []
+            paths = [os.path.join(self.directory, n) for n in names]
+
+        for path in paths:
+            try:
+                f = open(path, "r", encoding="utf-8")
+            except OSError:
+                continue
+            with f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def unrealized(position: dict, rate: float | None) -> float | None:
+    if rate is None:
+        return None
+    return position["position"] * rate - position["cost"]
+
+
+_ledger: TradeLedger | None = None
+
+
+def get_trade_ledger() -> TradeLedger:
+    """
+    Ф-ция возвращает общий для процесса TradeLedger
+    """
+    global _ledger
+    if _ledger is None:
+        _ledger = TradeLedger()
+    return _ledger
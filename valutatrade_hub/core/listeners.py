@@ -0,0 +1,34 @@
+from valutatrade_hub.core.alerts import demanded_codes as alerts_demanded_codes
+from valutatrade_hub.core.alerts import on_rate_ticks as alerts_on_rate_ticks
+from valutatrade_hub.core.orders import demanded_codes as orders_demanded_codes
+from valutatrade_hub.core.orders import on_rate_ticks as orders_on_rate_ticks
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.parser_service.events import rate_bus
+from valutatrade_hub.parser_service.fetch_plan import demand_registry
+
+
+def install_rate_listeners():
+    """
+    Ф-ция подписывает обработчики ядра на шину курсов (повторный вызов безопасен)
+    """
+    rate_bus.add_listener('alerts', alerts_on_rate_ticks)
+    rate_bus.add_listener('orders', orders_on_rate_ticks)
+
+
+def held_codes():
+    """
+    Источник спроса для планировщика выборки: валюты с ненулевым балансом в портфелях
+    """
+    held = set()
+    for portfolio in get_database().iter_portfolios():
+        held.update(code for code, wallet in (portfolio.get('wallets') or {}).items() if wallet.get('balance'))
+    return held
+
+
+def install_demand_sources():
+    """
+    Ф-ция регистрирует источники спроса на курсы для выборки по спросу (повторный вызов безопасен)
+    """
+    demand_registry.add_source('holdings', held_codes)
+    demand_registry.add_source('alerts', alerts_demanded_codes)
+    demand_registry.add_source('orders', orders_demanded_codes)
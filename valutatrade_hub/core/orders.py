@@ -0,0 +1,225 @@
+import heapq
+import logging
+from datetime import datetime
+
+from valutatrade_hub.core.journal import JournaledBook
+from valutatrade_hub.core.ledger import get_trade_ledger
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.infra.settings import settings
+from valutatrade_hub.parser_service.config import ParserConfig
+
+logger = logging.getLogger("ValutaTrade.Orders")
+config = ParserConfig()
+
+BUY = "buy"
+SELL = "sell"
+LIMIT = "limit"
+STOP = "stop"
+HISTORY_KEEP = 10000
+
+# книга -> (знак ключа кучи, условие исполнения для курса rate и цены ордера price).
+# Для покупок по лимиту и продаж по стопу лучшая цена - максимальная, поэтому ключ отрицательный
+BOOKS = {
+    f"{BUY}_{LIMIT}": (-1, lambda rate, price: rate <= price),
+    f"{SELL}_{LIMIT}": (1, lambda rate, price: rate >= price),
+    f"{BUY}_{STOP}": (1, lambda rate, price: rate >= price),
+    f"{SELL}_{STOP}": (-1, lambda rate, price: rate <= price),
+}
+
+
+class OrderBook(JournaledBook):
+    """
+    Книги лимитных и стоп-ордеров по парам.
+    Каждая книга - куча [sign * price, order_id]: order_id растёт монотонно, поэтому
+    куча даёт приоритет цена-время, а исполнение одного ордера стоит O(log n).
+    Отменённые ордера удаляются из open и пропускаются при извлечении из кучи.
+    Выставление и закрытие ордера - одна строка журнала (см. JournaledBook), поэтому
+    изменения проводятся внутри transaction()
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        super().__init__(path or settings.get_data_file_path("orders.json"))
+
+    def _load(self, data: dict) -> None:
+        self.next_id = data.get("next_id", 1)
+        self.books: dict[str, dict[str, list]] = data.get("books", {})
+        self.open: dict[str, dict] = data.get("open", {})
+        self.history: list[dict] = data.get("history", [])
+
+    def _dump(self) -> dict:
+        # в снимок попадают только записи куч открытых ордеров
+        books = {}
+        for pair, pair_books in self.books.items():
+            books[pair] = {}
+            for name, heap in pair_books.items():
+                heap = [entry for entry in heap if str(entry[1]) in self.open]
+                heapq.heapify(heap)
+                books[pair][name] = heap
+        return {
+            "next_id": self.next_id,
+            "books": books,
+            "open": self.open,
+            "history": self.history,
+        }
+
+    def _apply(self, op: dict) -> None:
+        if op["op"] == "place":
+            order = op["order"]
+            order_id = order["order_id"]
+            self.next_id = max(self.next_id, order_id + 1)
+            sign, _ = BOOKS[f"{order['side']}_{order['type']}"]
+            books = self.books.setdefault(order["pair"], {name: [] for name in BOOKS})
+            heapq.heappush(books[f"{order['side']}_{order['type']}"], [sign * order["price"], order_id])
+            self.open[str(order_id)] = order
+        elif op["op"] == "close":
+            done = op["order"]
+            self.open.pop(str(done["order_id"]), None)
+            self.history.append(done)
+            del self.history[:-HISTORY_KEEP]
+
+    def has_orders(self, pair: str) -> bool:
+        return any(self.books.get(pair, {}).values())
+
+    def place(self, user_id: int, pair: str, side: str, kind: str, amount: float, price: float) -> int:
+        if f"{side}_{kind}" not in BOOKS:
+            raise ValueError(f"unknown order type: {side} {kind}")
+
+        order_id = self.next_id
+        self._do({"op": "place", "order": {
+            "order_id": order_id,
+            "user_id": user_id,
+            "pair": pair,
+            "side": side,
+            "type": kind,
+            "amount": amount,
+            "price": price,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+        }})
+        return order_id
+
+    def cancel(self, order_id: int, user_id: int | None = None) -> bool:
+        order = self.open.get(str(order_id))
+        if order is None or (user_id is not None and order["user_id"] != user_id):
+            return False
+
+        # запись в куче остаётся и будет пропущена при извлечении
+        self.finish(order, "cancelled", None, datetime.now().isoformat(timespec="seconds"))
+        return True
+
+    def pop_triggered(self, pair: str, rate: float):
+        """
+        Ф-ция лениво извлекает из книг пары ордера, условие которых выполнено при курсе rate
+        """
+        for book_name, (sign, triggered) in BOOKS.items():
+            heap = self.books.get(pair, {}).get(book_name)
+            while heap:
+                order = self.open.get(str(heap[0][1]))
+                if order is None:
+                    heapq.heappop(heap)
+                    continue
+                if not triggered(rate, sign * heap[0][0]):
+                    break
+                heapq.heappop(heap)
+                del self.open[str(order["order_id"])]
+                yield order
+
+    def finish(self, order: dict, status: str, rate: float | None, timestamp: str) -> dict:
+        done = dict(order, status=status, fill_rate=rate, closed_at=timestamp)
+        self._do({"op": "close", "order": done})
+        return done
+
+    def user_orders(self, user_id: int) -> tuple[list[dict], list[dict]]:
+        """
+        Ф-ция возвращает открытые и закрытые ордера пользователя
+        """
+        opened = [o for o in self.open.values() if o["user_id"] == user_id]
+        closed = [o for o in self.history if o["user_id"] == user_id]
+        return opened, closed
+
+
+def apply_fill(wallets: dict, order: dict, rate: float, base: str) -> bool:
+    """
+    Ф-ция проводит обе ноги сделки в кошельках или не меняет ничего при нехватке средств
+    """
+    code = order["pair"].split("_")[0]
+    amount = order["amount"]
+    cost = amount * rate
+
+    if order["side"] == BUY:
+        pay, pay_amount, get, get_amount = base, cost, code, amount
+    else:
+        pay, pay_amount, get, get_amount = code, amount, base, cost
+
+    if wallets.get(pay, {}).get("balance", 0.0) < pay_amount:
+        return False
+
+    wallets.setdefault(pay, {"balance": 0.0})["balance"] -= pay_amount
+    wallets.setdefault(get, {"balance": 0.0})["balance"] += get_amount
+    return True
+
+
+def execute_ticks(book: OrderBook, events, get_portfolio, base: str) -> list[dict]:
+    """
+    Ф-ция исполняет сработавшие ордера по событиям курсов.
+    get_portfolio(user_id) возвращает портфель, который изменяется на месте
+    """
+    results = []
+    for event in events:
+        for order in book.pop_triggered(event.pair, event.rate):
+            portfolio = get_portfolio(order["user_id"])
+            wallets = portfolio.setdefault("wallets", {}) if portfolio is not None else {}
+            filled = portfolio is not None and apply_fill(wallets, order, event.rate, base)
+            status = "filled" if filled else "rejected"
+            if filled:
+                get_trade_ledger().record(
+                    order["user_id"], order["side"], order["pair"].split("_")[0], order["amount"],
+                    event.rate, base, source="order", timestamp=event.timestamp,
+                )
+            results.append(book.finish(order, status, event.rate, event.timestamp))
+            logger.info(
+                f"Order {order['order_id']} {order['side']} {order['type']} {order['amount']} "
+                f"{order['pair']} @ {order['price']}: {status} at {event.rate}"
+            )
+    return results
+
+
+_book: OrderBook | None = None
+
+
+def get_order_book() -> OrderBook:
+    """
+    Ф-ция возвращает общий для процесса OrderBook, актуальный по файлу
+    """
+    global _book
+    if _book is None:
+        _book = OrderBook()
+    _book.refresh()
+    return _book
+
+
+def on_rate_ticks(events) -> None:
+    """
+    Слушатель шины курсов: исполняет ордера и сохраняет портфели их владельцев.
+    Портфели читаются и пишутся под блокировкой записи базы, поэтому исполнение не затрёт
+    одновременную покупку или продажу из другого процесса
+    """
+    book = get_order_book()
+    events = [e for e in events if book.has_orders(e.pair)]
+    if not events:
+        return
+
+    def fill(get_portfolio):
+        results = execute_ticks(book, events, get_portfolio, config.BASE_CURRENCY)
+        # переписываются только шарды владельцев исполненных ордеров
+        return {r["user_id"] for r in results if r["status"] == "filled"}
+
+    with book.transaction():
+        get_database().update_portfolios(fill)
+
+
+def demanded_codes():
+    """
+    Источник спроса для планировщика выборки: валюты пар с открытыми ордерами
+    """
+    for order in get_order_book().open.values():
+        yield from order["pair"].split("_")
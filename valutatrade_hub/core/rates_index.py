@@ -0,0 +1,159 @@
+import heapq
+import json
+import os
+import sys
+from typing import NamedTuple
+
+from valutatrade_hub.core.currencies import get_currency_registry
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import read_last_refresh
+
+config = ParserConfig()
+
+
+class PairRate(NamedTuple):
+    """
+    Разобранная запись кеша курсов: BTC_USD -> ("BTC", "USD", rate)
+    """
+    code: str
+    base: str
+    rate: float
+    updated_at: str | None
+
+
+class RatesIndex:
+    """
+    Индекс курсов из rates.json.
+    Ключи пар разбираются один раз при загрузке, повторная загрузка
+    происходит только если файл изменился (mtime/size).
+    """
+
+    def __init__(self, path: str = config.RATES_FILE_PATH) -> None:
+        self.path = path
+        self._stamp = None
+        self._entries: list[PairRate] = []
+        self._by_pair: dict[tuple[str, str], PairRate] = {}
+        self._last_refresh = None
+
+    def refresh(self) -> bool:
+        """
+        Ф-ция перечитывает файл, если он изменился. Возвращает True при перестроении
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._reset(None)
+            return False
+
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return False
+
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                loaded = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            loaded = {}
+
+        self._reset(stamp)
+        if not isinstance(loaded, dict) or not isinstance(loaded.get('pairs'), dict):
+            return True
+
+        entries = []
+        for key, value in loaded['pairs'].items():
+            code, sep, base = key.partition('_')
+            if not sep or not isinstance(value, dict) or value.get('rate') is None:
+                continue
+            entries.append(PairRate(sys.intern(code), sys.intern(base), float(value['rate']), value.get('updated_at')))
+
+        entries.sort()
+        self._entries = entries
+        self._by_pair = {(e.code, e.base): e for e in entries}
+        self._last_refresh = loaded.get('last_refresh')
+        return True
+
+    def _reset(self, stamp) -> None:
+        self._stamp = stamp
+        self._entries = []
+        self._by_pair = {}
+        self._last_refresh = None
+
+    @property
+    def last_refresh(self) -> str | None:
+        # курсы могли быть проверены без изменений - тогда отметка есть только в файле свежести
+        return read_last_refresh(config, self._last_refresh)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str, base: str = config.BASE_CURRENCY) -> PairRate | None:
+        return self._by_pair.get((code, base))
+
+    def rate_to(self, code: str, base: str) -> float | None:
+        """
+        Ф-ция возвращает курс code→base: напрямую или кросс-курсом через базовую валюту
+        """
+        if code == base:
+            return 1.0
+
+        direct = self._by_pair.get((code, base))
+        if direct is not None:
+            return direct.rate
+
+        pivot = config.BASE_CURRENCY
+        code_pivot = 1.0 if code == pivot else getattr(self._by_pair.get((code, pivot)), 'rate', None)
+        if code_pivot is None:
+            return None
+        if base == pivot:
+            return code_pivot
+
+        base_pivot = getattr(self._by_pair.get((base, pivot)), 'rate', None)
+        if not base_pivot:
+            return None
+        return code_pivot / base_pivot
+
+    def select(self, asset_class=None, base=None, prefix=None):
+        """
+        Ф-ция лениво отдаёт записи индекса (в порядке пар) с фильтрами
+        по классу актива ('crypto'/'fiat'), базовой валюте пары и префиксу кода
+        """
+        prefix = prefix.upper() if prefix else None
+        for entry in self._entries:
+            if base and entry.base != base:
+                continue
+            if prefix and not entry.code.startswith(prefix):
+                continue
+            if asset_class and asset_class_of(entry.code) != asset_class:
+                continue
+            yield entry
+
+    def top(self, n: int, asset_class=None, base=None, prefix=None) -> list[PairRate]:
+        """
+        Ф-ция возвращает N самых дорогих валют за O(len * log N)
+        """
+        return heapq.nlargest(
+            n,
+            self.select(asset_class=asset_class, base=base, prefix=prefix),
+            key=lambda e: e.rate,
+        )
+
+
+def asset_class_of(code: str) -> str | None:
+    """
+    Ф-ция определяет класс актива по коду валюты через реестр валют
+    """
+    return get_currency_registry().asset_class(code)
+
+
+_indexes: dict[str, RatesIndex] = {}
+
+
+def get_rates_index(path: str = config.RATES_FILE_PATH) -> RatesIndex:
+    """
+    Ф-ция возвращает общий для процесса индекс курсов, обновлённый по файлу
+    """
+    index = _indexes.get(path)
+    if index is None:
+        index = _indexes[path] = RatesIndex(path)
+    index.refresh()
+    return index
@@ -0,0 +1,127 @@
+import bisect
+import math
+from datetime import datetime
+
+from valutatrade_hub.core.ledger import BUY, get_trade_ledger
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import Storage
+
+try:
+    import numpy as np
+except ImportError:  # numpy - необязательная зависимость (extra "fast")
+    np = None
+
+config = ParserConfig()
+
+MAX_POINTS = 200000
+
+
+def to_ms(timestamp: str) -> int:
+    return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+
+
+def asof_indices(times: list, grid: list) -> list:
+    """
+    Ф-ция для каждой точки сетки находит число значений ряда с временем <= точки
+    (индекс в ряду, дополненном начальным значением слева)
+    """
+    if np is not None:
+        return np.searchsorted(np.asarray(times, dtype=np.int64), np.asarray(grid, dtype=np.int64), side="right")
+    return [bisect.bisect_right(times, t) for t in grid]
+
+
+def _take(values: list, indices):
+    if np is not None:
+        return np.asarray(values, dtype=np.float64)[indices]
+    return [values[i] for i in indices]
+
+
+def _base_delta(trade: dict) -> float:
+    """
+    Ф-ция возвращает изменение баланса базовой валюты от сделки: продажа зачисляет выручку,
+    а покупка списывает оплату только при исполнении ордера (buy в CLI и API базу не списывает)
+    """
+    cost = trade["amount"] * trade["price"]
+    if trade["side"] == BUY:
+        return -cost if trade.get("source") == "order" else 0.0
+    return cost
+
+
+def holdings_steps(wallets: dict, trades: list[dict], base: str) -> dict[str, tuple[list, list]]:
+    """
+    Ф-ция восстанавливает ступенчатые ряды балансов по валютам: текущие балансы
+    откатываются по журналу сделок назад. Для валюты возвращается (времена изменений в мс,
+    балансы), где балансы[0] - баланс до первого изменения, балансы[i] - после i-го
+    """
+    deltas: dict[str, list] = {}
+    for trade in trades:
+        ts = to_ms(trade["timestamp"])
+        sign = 1.0 if trade["side"] == BUY else -1.0
+        deltas.setdefault(trade["currency"], []).append((ts, sign * trade["amount"]))
+        base_delta = _base_delta(trade)
+        if base_delta:
+            deltas.setdefault(base, []).append((ts, base_delta))
+
+    steps = {}
+    for code in set(wallets) | set(deltas):
+        changes = deltas.get(code, [])
+        balance = wallets.get(code, {}).get("balance", 0.0)
+        balances = [balance]
+        for _, delta in reversed(changes):
+            balance -= delta
+            balances.append(balance)
+        balances.reverse()
+        steps[code] = ([ts for ts, _ in changes], balances)
+    return steps
+
+
+def rate_steps(code: str, base: str, until: str | None = None) -> tuple[list, list]:
+    """
+    Ф-ция собирает ряд курса code→base из истории в тех же координатах, что и holdings_steps
+    (курс до первой записи неизвестен - NaN)
+    """
+    times, rates = [], [math.nan]
+    for record in Storage(config).iter_history(until=until, pairs=[f"{code}_{base}"]):
+        times.append(to_ms(record["timestamp"]))
+        rates.append(record["rate"])
+    return times, rates
+
+
+def portfolio_value_series(user_id: int, wallets: dict, since_ms: int | None, until_ms: int,
+                           step_ms: int, base: str | None = None) -> list[tuple[int, float | None]]:
+    """
+    Ф-ция строит ряд стоимости портфеля на сетке [since_ms, until_ms] с шагом step_ms:
+    балансы и курсы каждой валюты присоединяются к сетке as-of (последнее значение не позже точки)
+    """
+    base = base or config.BASE_CURRENCY
+    trades = list(get_trade_ledger().iter_trades(user_id))
+    trades.sort(key=lambda t: t["timestamp"])
+
+    if since_ms is None:
+        since_ms = to_ms(trades[0]["timestamp"]) if trades else until_ms - 24 * 3600 * 1000
+    points = (until_ms - since_ms) // step_ms + 1
+    if points <= 0:
+        return []
+    if points > MAX_POINTS:
+        raise ValueError(f"too many points: {points} > {MAX_POINTS}")
+
+    grid = list(range(since_ms, until_ms + 1, step_ms))
+    until = datetime.fromtimestamp(until_ms / 1000).isoformat(timespec="seconds")
+
+    total = np.zeros(len(grid)) if np is not None else [0.0] * len(grid)
+    for code, (times, balances) in holdings_steps(wallets, trades, base).items():
+        held = _take(balances, asof_indices(times, grid))
+        if code == base:
+            value = held
+        else:
+            rate_times, rates = rate_steps(code, base, until)
+            rate = _take(rates, asof_indices(rate_times, grid))
+            value = held * rate if np is not None else [h * r for h, r in zip(held, rate)]
+
+        if np is not None:
+            # нулевой баланс при неизвестном курсе не делает стоимость неизвестной
+            total = total + np.where(held == 0, 0.0, value)
+        else:
+            total = [s + (0.0 if h == 0 else v) for s, h, v in zip(total, held, value)]
+
+    return [(t, None if math.isnan(v) else float(v)) for t, v in zip(grid, total)]
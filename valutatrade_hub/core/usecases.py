@@ -1,25 +1,49 @@
-import hashlib
-import random
+import json
+import os
+import time
 from datetime import datetime
 
 from prettytable import PrettyTable
 
-from valutatrade_hub.core.currencies import CurrencyMaker
+from valutatrade_hub.core.alerts import ABOVE, BELOW, get_alert_book
+from valutatrade_hub.core.analytics import annualize, correlation, historical_var, load_returns, rolling_volatility
+from valutatrade_hub.core.backtest import STRATEGIES, parse_specs, run_backtests
+from valutatrade_hub.core.convert import convert_file
+from valutatrade_hub.core.currencies import get_currency_registry
 from valutatrade_hub.core.exceptions import CurrencyNotFoundError, InsufficientFundsError
-from valutatrade_hub.core.utils import from_json, get_rates, to_json
+from valutatrade_hub.core.export import EXPORTS, FORMATS, write_rows
+from valutatrade_hub.core.ledger import get_trade_ledger, unrealized
+from valutatrade_hub.core.listeners import install_demand_sources, install_rate_listeners
+from valutatrade_hub.core.orders import BOOKS, get_order_book
+from valutatrade_hub.core.rates_index import get_rates_index
+from valutatrade_hub.core.timeseries import portfolio_value_series, to_ms
+from valutatrade_hub.core.user_import import UserImporter
+from valutatrade_hub.core.utils import get_rates, hash_password, make_salt
 from valutatrade_hub.decorators import log_action
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.infra.settings import settings
+from valutatrade_hub.parser_service.backfill import HistoryBackfill
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.fetch_plan import record_queries
+from valutatrade_hub.parser_service.storage import Storage
 from valutatrade_hub.parser_service.updater import RatesUpdater
 
 config = ParserConfig()
+install_rate_listeners()
+install_demand_sources()
 
-def register(username, password):
-    data = from_json('data/users.json') or []
+RATES_PAGE_SIZE = 50
+ORDERS_HISTORY_SHOWN = 20
+OHLC_ROWS_DEFAULT = 24
+PORTFOLIO_HISTORY_STEP_MS = 3600 * 1000
+RISK_WINDOW_DEFAULT = 24
+RISK_LOOKBACK_DEFAULT = 1000
+BACKTEST_CASH_DEFAULT = 10000.0
 
-    names = [user.get('username') for user in data]
-    id = [user.get('user_id') for user in data if user.get('user_id') is not None]
+def register(username, password):
+    db = get_database()
 
-    if username in names:
+    if db.user_by_name(username) is not None:
         print(f'Имя пользователя {username} уже занято')
         return None
 
@@ -27,13 +51,10 @@ def register(username, password):
         print('Пароль должен быть не короче 4 символов')
         return None
 
-    current_id = max(id) + 1 if id else 1
+    current_id = db.next_user_id()
 
-    symbols = '1234567890-=+*%!?><$#@;:qwertyuiopasdfghjklzxcvbnm'
-    salt = ''.join(random.choices(symbols, k=random.randint(5, 20)))
-    hashed_password = hashlib.sha256(
-        (password + salt).encode('utf-8')
-    ).hexdigest()
+    salt = make_salt()
+    hashed_password = hash_password(password, salt)
 
     new_user = {
         "user_id": current_id,
@@ -43,22 +64,13 @@ def register(username, password):
         "registration_date": str(datetime.now()),
     }
 
-    data.append(new_user)
-    to_json('data/users.json', data)
-
-    portfolios = from_json('data/portfolios.json') or []
-    portfolios.append({"user_id": current_id, "wallets": {}})
-    to_json('data/portfolios.json', portfolios)
+    db.save_user(new_user)
+    db.save_portfolio({"user_id": current_id, "wallets": {}})
 
     return current_id
 
 def login(username, password):
-    data = from_json('data/users.json') or []
-
-    user = next(
-        (val for val in data if val.get('username') == username),
-        None
-    )
+    user = get_database().user_by_name(username)
 
     if user is None:
         print(f'Пользователь {username} не найден')
@@ -68,9 +80,7 @@ def login(username, password):
     hashed_password = user.get('hashed_password')
     user_id = user.get('user_id')
 
-    check_hash = hashlib.sha256(
-        (password + salt).encode('utf-8')
-    ).hexdigest()
+    check_hash = hash_password(password, salt)
 
     if hashed_password != check_hash:
         print('Неверный пароль')
@@ -86,11 +96,7 @@ def show_portfolio(logged_in, logged_id, base_currency=config.BASE_CURRENCY):
     if base_currency is None:
         base_currency = config.BASE_CURRENCY
 
-    portfolios = from_json('data/portfolios.json') or []
-    portfolio = next(
-        (val for val in portfolios if val.get('user_id') == logged_id),
-        None
-    )
+    portfolio = get_database().portfolio(logged_id)
 
     if portfolio is None:
         print('Портфель не найден')
@@ -106,7 +112,7 @@ def show_portfolio(logged_in, logged_id, base_currency=config.BASE_CURRENCY):
         print(f'Неизвестная базовая валюта {base_currency}')
         return None
 
-    exchange_rates, _ = get_rates(base_currency)
+    exchange_rates, _ = get_rates(base_currency, codes=list(wallets))
 
     result = 0.0
     for currency_code, wallet in wallets.items():
@@ -135,28 +141,30 @@ def buy(logged_id, currency, amount):
         print(f'{amount} должен быть положительным числом')
         return None
 
-    exchange_rates, _ = get_rates(config.BASE_CURRENCY)
+    # валюта сделки попадает в выборку по спросу, даже если её ещё нет в портфеле
+    record_queries(config, [currency, config.BASE_CURRENCY])
+    exchange_rates, _ = get_rates(config.BASE_CURRENCY, codes=[currency])
 
     if currency not in exchange_rates.keys():
         print(f'Не удалось получить курс для {currency}→{config.BASE_CURRENCY}')
         return None
 
-    portfolios = from_json('data/portfolios.json')
-    portfolio_index = [i for i in range(len(portfolios)) if portfolios[i].get('user_id') == logged_id][0]
-    portfolio = portfolios[portfolio_index]
-    wallets = portfolio.get('wallets')
-
-    if currency not in wallets.keys():
-        wallets.update({currency: {"balance": 0.0}})
+    changes = {}
 
-    before = wallets[currency]["balance"]
-    wallets[currency]["balance"] += amount
+    def apply_buy(get_portfolio):
+        wallets = get_portfolio(logged_id).setdefault('wallets', {})
+        wallet = wallets.setdefault(currency, {"balance": 0.0})
+        changes['before'] = wallet['balance']
+        wallet['balance'] += amount
+        changes['after'] = wallet['balance']
+        return [logged_id]
 
-    print(f'- {currency}: \n Было: {before} \n Стало: {wallets[currency]["balance"]}')
+    # портфель меняется на копии под блокировкой записи: исполнение ордера в другом процессе
+    # не затрётся, а при ошибке сохранения кеш базы останется прежним
+    get_database().update_portfolios(apply_buy)
 
-    portfolio['wallets'].update(wallets)
-    portfolios[portfolio_index] = portfolio
-    to_json('data/portfolios.json', portfolios)
+    print(f'- {currency}: \n Было: {changes["before"]} \n Стало: {changes["after"]}')
+    get_trade_ledger().record(logged_id, 'buy', currency, amount, exchange_rates[currency], config.BASE_CURRENCY)
 
     return True
 
@@ -169,9 +177,7 @@ def sell(logged_id, currency, amount):
 
     amount = float(amount)
 
-    portfolios = from_json('data/portfolios.json')
-    portfolio_index = [i for i in range(len(portfolios)) if portfolios[i].get('user_id') == logged_id][0]
-    portfolio = portfolios[portfolio_index]
+    portfolio = get_database().portfolio(logged_id)
 
     wallets = portfolio.get('wallets')
 
@@ -179,39 +185,49 @@ def sell(logged_id, currency, amount):
         print(f'У вас нет кошелька {currency}. Добавьте валюту: она создаётся автоматически при первой покупке.')
         return None
 
-    before = wallets[currency]["balance"]
-    amount = float(amount)
-
-    if before < amount:
-        raise InsufficientFundsError(currency, before, amount)
-    exchange_rates, _ = get_rates(config.BASE_CURRENCY)
-    cost = amount * exchange_rates.get(currency)
+    if wallets[currency]["balance"] < amount:
+        raise InsufficientFundsError(currency, wallets[currency]["balance"], amount)
+    record_queries(config, [currency, config.BASE_CURRENCY])
+    exchange_rates, _ = get_rates(config.BASE_CURRENCY, codes=[currency])
+    rate = exchange_rates.get(currency)
+    if rate is None:
+        print(f'Не удалось получить курс для {currency}→{config.BASE_CURRENCY}')
+        return None
 
-    if wallets.get(config.BASE_CURRENCY) is None:
-        wallets.update({config.BASE_CURRENCY: {"balance": 0.0}})
-    wallets[config.BASE_CURRENCY]["balance"] += cost
-    wallets[currency]["balance"] -= amount
+    changes = {}
+
+    def apply_sell(get_portfolio):
+        wallets = get_portfolio(logged_id).setdefault('wallets', {})
+        # баланс перепроверяется под блокировкой: его мог изменить другой процесс
+        before = wallets.get(currency, {}).get('balance', 0.0)
+        if before < amount:
+            raise InsufficientFundsError(currency, before, amount)
+        wallets.setdefault(config.BASE_CURRENCY, {"balance": 0.0})['balance'] += amount * rate
+        wallets[currency]['balance'] -= amount
+        changes['before'] = before
+        changes['after'] = wallets[currency]['balance']
+        return [logged_id]
+
+    get_database().update_portfolios(apply_sell)
     print(
-        f'Продажа выполнена: {amount} {currency} по курсу {exchange_rates.get(currency)} {config.BASE_CURRENCY}/{currency}')
+        f'Продажа выполнена: {amount} {currency} по курсу {rate} {config.BASE_CURRENCY}/{currency}')
     print('Изменения в портфеле:')
-    print(f'- {currency}: \n Было: {before} \n Стало: {wallets[currency]["balance"]}')
+    print(f'- {currency}: \n Было: {changes["before"]} \n Стало: {changes["after"]}')
 
-    portfolio['wallets'].update(wallets)
-    portfolios[portfolio_index] = portfolio
-    to_json('data/portfolios.json', portfolios)
+    get_trade_ledger().record(logged_id, 'sell', currency, amount, rate, config.BASE_CURRENCY)
     return True
 
-
 def get_rate(curr_from, curr_to):
-    cm = CurrencyMaker()
+    registry = get_currency_registry()
 
     try:
-        cm.get_currency(curr_from)
-        cm.get_currency(curr_to)
+        curr_from = registry.normalize(curr_from)
+        curr_to = registry.normalize(curr_to)
     except CurrencyNotFoundError:
         return None
 
-    exchange_rates, update_dates = get_rates(curr_to)
+    record_queries(config, [curr_from, curr_to])
+    exchange_rates, update_dates = get_rates(curr_to, codes=[curr_from, curr_to])
     if not exchange_rates:
         return None
 
@@ -235,7 +251,11 @@ def update_rates(source):
         updater = RatesUpdater(config)
         count = updater.run_update(sources)
         if count > 0:
-            print(f"Update successful. Total rates updated: {count}.")
+            delta = updater.last_delta
+            print(
+                f"Update successful. Rates fetched: {count}, changed: {delta['changed']}"
+                f", quarantined: {delta['quarantined']}."
+            )
         else:
             print("Update completed with errors. Check logs/parser.log for details.")
         return count
@@ -243,72 +263,601 @@ def update_rates(source):
         print(f"Update failed. Error: {e}. Check logs/parser.log for details.")
         return None
 
-def show_rates(currency, top, base):
-    base = config.BASE_CURRENCY if base is None else base
-    rates_data = from_json("data/rates.json") or {}
-
-    if (
-        isinstance(rates_data, list)
-        or not rates_data
-        or "pairs" not in rates_data
-        or not rates_data["pairs"]
-    ):
-        raise FileNotFoundError("Кеш пуст")
-
-    pairs = rates_data["pairs"]
-    last_update = rates_data.get("last_refresh", "unknown")
-    print(f"Rates from cache (updated at {last_update}):")
-
+def _print_rates_page(rows, with_header):
     table = PrettyTable(["Pair", "Rate"])
+    table.min_width = {"Pair": 12, "Rate": 20}
+    table.align = "l"
+    table.add_rows(rows)
+
+    text = table.get_string(header=with_header)
+    if not with_header:
+        # верхняя граница уже напечатана нижней границей прошлой страницы
+        text = text.split("\n", 1)[1]
+    print(text)
+
+
+def _print_rates_stream(rows, page_size=RATES_PAGE_SIZE):
+    """
+    Ф-ция печатает строки таблицы постранично, не накапливая весь список в памяти
+    """
+    page = []
+    printed = 0
+    for row in rows:
+        page.append(row)
+        if len(page) == page_size:
+            _print_rates_page(page, with_header=printed == 0)
+            printed += len(page)
+            page = []
+
+    if page or printed == 0:
+        _print_rates_page(page, with_header=printed == 0)
+
+
+def show_rates(currency, top, base, asset_class=None, prefix=None):
+    base = config.BASE_CURRENCY if base is None else base.strip().upper()
+    record_queries(config, [base, currency.strip() if currency else None])
+    index = get_rates_index()
+
+    if not len(index):
+        raise FileNotFoundError("Кеш пуст")
 
-    base_usd_pair = f"{base}_USD"
-    base_usd_rate = pairs.get(base_usd_pair, {}).get("rate", 1.0) if base != "USD" else 1.0
+    print(f"Rates from cache (updated at {index.last_refresh or 'unknown'}):")
 
     # 1) Показ конкретной валюты -> печатаем и выходим
     if currency:
         code = currency.strip().upper()
-        cur_pair = f"{code}_{base}"
-        cur_usd_pair = f"{code}_USD"
-        cur_usd_rate = pairs.get(cur_usd_pair, {}).get("rate", 0)
+        rate_base = index.rate_to(code, base)
 
-        if cur_usd_rate == 0:
+        if not rate_base:
             print(f"Курс для '{currency}' не найден в кеше.")
             return None
 
-        cur_base_rate = (cur_usd_rate / base_usd_rate) if base != "USD" else cur_usd_rate
-        table.add_row([cur_pair, f"{cur_base_rate:.5f}"])
-        print(table)
+        _print_rates_stream([[f"{code}_{base}", f"{rate_base:.5f}"]])
+        return None
+
+    pivot = config.BASE_CURRENCY
+    base_rate = index.rate_to(base, pivot)
+    if not base_rate:
+        print(f"Курс для '{base}' не найден в кеше.")
         return None
 
-    # 2) Top N -> печатаем и выходим
+    # 2) Top N -> heapq по индексу, без полной сортировки
     if top:
         top_n = int(top)
-        crypto_usd = {
-            k: v for k, v in pairs.items()
-            if k.split("_")[0] in config.CRYPTO_CURRENCIES
-        }
-        sorted_crypto = sorted(
-            crypto_usd.items(),
-            key=lambda x: x[1]["rate"] / base_usd_rate,
-            reverse=True,
-        )[:top_n]
-
-        for pair_usd, p in sorted_crypto:
-            code = pair_usd.split("_")[0]
-            rate_base = (p["rate"] / base_usd_rate) if base != "USD" else p["rate"]
-            table.add_row([f"{code}_{base}", f"{rate_base:.2f}"])
+        best = index.top(top_n, asset_class=asset_class or "crypto", base=pivot, prefix=prefix)
+        _print_rates_stream(
+            [f"{e.code}_{base}", f"{e.rate / base_rate:.2f}"] for e in best
+        )
+        return None
+
+    # 3) Иначе выводим всё, постранично
+    entries = index.select(asset_class=asset_class, base=pivot, prefix=prefix)
+    _print_rates_stream(
+        [f"{e.code}_{base}", f"{e.rate / base_rate:.5f}"] for e in entries
+    )
+    return None
+
+
+def add_alert(logged_id, currency, above, below):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    if (above is None) == (below is None):
+        print('Укажите ровно один порог: --above или --below')
+        return None
+
+    try:
+        code = get_currency_registry().normalize(currency)
+        threshold = float(above if above is not None else below)
+    except CurrencyNotFoundError as e:
+        print(e)
+        return None
+    except ValueError:
+        print('Порог должен быть числом')
+        return None
+
+    if threshold <= 0:
+        print(f'{threshold} должен быть положительным числом')
+        return None
+
+    direction = ABOVE if above is not None else BELOW
+    pair = f'{code}_{config.BASE_CURRENCY}'
+    current = get_rates_index().rate_to(code, config.BASE_CURRENCY)
+
+    if current is not None and (
+        (direction == ABOVE and current >= threshold) or (direction == BELOW and current <= threshold)
+    ):
+        print(f'Условие уже выполнено: текущий курс {pair} = {current}')
+        return None
+
+    book = get_alert_book()
+    with book.transaction():
+        alert_id = book.add(logged_id, pair, direction, threshold)
+
+    sign = '≥' if direction == ABOVE else '≤'
+    print(f'Алерт #{alert_id} создан: {pair} {sign} {threshold}')
+    return alert_id
+
+
+def remove_alert(logged_id, alert_id):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    book = get_alert_book()
+    with book.transaction():
+        removed = str(alert_id).isdigit() and book.remove(int(alert_id), logged_id)
+    if not removed:
+        print(f'Алерт #{alert_id} не найден')
+        return None
+
+    print(f'Алерт #{alert_id} удалён')
+    return True
 
+
+def show_alerts(logged_id):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    book = get_alert_book()
+    with book.transaction():
+        active = sorted(book.user_alerts(logged_id))
+        fired = [dict(a) for a in book.triggered if a['user_id'] == logged_id and not a['seen']]
+        if fired:
+            book.mark_seen(logged_id)
+
+    if not active and not fired:
+        print('Алертов нет')
+        return None
+
+    if active:
+        table = PrettyTable(["ID", "Pair", "Condition", "Created"])
+        for alert_id, pair, direction, threshold, created_at in active:
+            sign = '≥' if direction == ABOVE else '≤'
+            table.add_row([alert_id, pair, f'{sign} {threshold}', created_at])
+        print('Активные алерты:')
+        print(table)
+
+    if fired:
+        table = PrettyTable(["ID", "Pair", "Condition", "Rate", "Triggered"])
+        for alert in fired:
+            sign = '≥' if alert['direction'] == ABOVE else '≤'
+            table.add_row([alert['alert_id'], alert['pair'], f"{sign} {alert['threshold']}", alert['rate'], alert['triggered_at']])
+        print('Сработавшие алерты:')
         print(table)
+
+    return None
+
+
+def place_order(logged_id, side, kind, currency, amount, price):
+    if not logged_id:
+        print('Сначала выполните login')
         return None
 
-    # 3) Иначе выводим всё
-    for pair_usd, p in sorted(pairs.items()):
-        code = pair_usd.split("_")[0]
-        rate_usd = p["rate"]
-        rate_base = (rate_usd / base_usd_rate) if base != "USD" else rate_usd
-        pair_base = f"{code}_{base}"
-        table.add_row([pair_base, f"{rate_base:.5f}"])
+    side = (side or '').lower()
+    kind = (kind or '').lower()
+    if f'{side}_{kind}' not in BOOKS:
+        print('Тип ордера: --side buy|sell --type limit|stop')
+        return None
+
+    try:
+        code = get_currency_registry().normalize(currency)
+        amount = float(amount)
+        price = float(price)
+    except CurrencyNotFoundError as e:
+        print(e)
+        return None
+    except ValueError:
+        print('amount и price должны быть числами')
+        return None
+
+    if amount <= 0 or price <= 0:
+        print('amount и price должны быть положительными числами')
+        return None
+
+    if code == config.BASE_CURRENCY:
+        print(f'Нельзя выставить ордер на {code}→{config.BASE_CURRENCY}')
+        return None
+
+    if side == 'sell':
+        portfolio = get_database().portfolio(logged_id) or {}
+        available = portfolio.get('wallets', {}).get(code, {}).get('balance', 0.0)
+        if available < amount:
+            print(InsufficientFundsError(code, available, amount))
+            return None
+
+    pair = f'{code}_{config.BASE_CURRENCY}'
+    book = get_order_book()
+    with book.transaction():
+        order_id = book.place(logged_id, pair, side, kind, amount, price)
+
+    print(f'Ордер #{order_id} принят: {side} {kind} {amount} {code} по {price} {config.BASE_CURRENCY}')
+    return order_id
+
+
+def cancel_order(logged_id, order_id):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    book = get_order_book()
+    with book.transaction():
+        cancelled = str(order_id).isdigit() and book.cancel(int(order_id), logged_id)
+    if not cancelled:
+        print(f'Открытый ордер #{order_id} не найден')
+        return None
+
+    print(f'Ордер #{order_id} отменён')
+    return True
+
+
+def show_orders(logged_id):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    opened, closed = get_order_book().user_orders(logged_id)
+    if not opened and not closed:
+        print('Ордеров нет')
+        return None
+
+    if opened:
+        table = PrettyTable(["ID", "Pair", "Side", "Type", "Amount", "Price", "Created"])
+        for o in sorted(opened, key=lambda o: o['order_id']):
+            table.add_row([o['order_id'], o['pair'], o['side'], o['type'], o['amount'], o['price'], o['created_at']])
+        print('Открытые ордера:')
+        print(table)
+
+    if closed:
+        table = PrettyTable(["ID", "Pair", "Side", "Type", "Amount", "Price", "Status", "Fill rate", "Closed"])
+        for o in closed[-ORDERS_HISTORY_SHOWN:]:
+            table.add_row([o['order_id'], o['pair'], o['side'], o['type'], o['amount'], o['price'],
+                           o['status'], o['fill_rate'], o['closed_at']])
+        print('Закрытые ордера:')
+        print(table)
 
-    print(table)
     return None
 
+
+def show_ohlc(currency, interval, limit):
+    interval = interval or '1h'
+    if interval not in config.OHLC_RESOLUTIONS:
+        print(f"Неизвестный интервал {interval}. Доступны: {', '.join(config.OHLC_RESOLUTIONS)}")
+        return None
+
+    try:
+        code = get_currency_registry().normalize(currency)
+        limit = int(limit) if limit else OHLC_ROWS_DEFAULT
+    except CurrencyNotFoundError as e:
+        print(e)
+        return None
+    except ValueError:
+        print('limit должен быть целым числом')
+        return None
+
+    pair = f'{code}_{config.BASE_CURRENCY}'
+    rows = Storage(config).get_ohlc(pair, interval, limit=limit)
+    if not rows:
+        print(f'Свечей {pair} ({interval}) нет')
+        return None
+
+    table = PrettyTable(["Time", "Open", "High", "Low", "Close", "Ticks"])
+    for bucket, open_, high, low, close, count, *_ in rows:
+        time_str = datetime.fromtimestamp(bucket).isoformat(timespec='minutes')
+        table.add_row([time_str, open_, high, low, close, count])
+
+    print(f'{pair}, интервал {interval}:')
+    print(table)
+    return rows
+
+
+def backfill_history(path, source, workers):
+    try:
+        workers = int(workers) if workers else None
+    except ValueError:
+        print('workers должен быть целым числом')
+        return None
+
+    if not os.path.isfile(path):
+        print(f'Файл {path} не найден')
+        return None
+
+    result = HistoryBackfill(config, workers=workers).run(path, source or 'backfill')
+    print(
+        f"Импортировано {result['imported']} из {result['parsed']} записей "
+        f"(дубликатов: {result['duplicates']}, отброшено строк: {result['rejected']}) "
+        f"за {result['seconds']:.2f} с — {result.get('records_per_second', 0):.0f} записей/с"
+    )
+    return result
+
+
+def export_data(what, fmt, out, compress=False, since=None, until=None, pair=None, username=None):
+    fmt = (fmt or 'csv').lower()
+    if what not in EXPORTS:
+        print(f"Неизвестный набор {what}. Доступны: {', '.join(EXPORTS)}")
+        return None
+    if fmt not in FORMATS:
+        print(f"Неизвестный формат {fmt}. Доступны: {', '.join(FORMATS)}")
+        return None
+
+    iter_rows, fieldnames = EXPORTS[what]
+    if what == 'history':
+        pairs = None
+        if pair:
+            pair = pair.upper()
+            pairs = [pair if '_' in pair else f'{pair}_{config.BASE_CURRENCY}']
+        rows = iter_rows(since, until, pairs)
+    else:
+        user_id = None
+        if username:
+            user = get_database().user_by_name(username)
+            if user is None:
+                print(f'Пользователь {username} не найден')
+                return None
+            user_id = user['user_id']
+        rows = iter_rows(user_id)
+
+    if compress and not out.endswith('.gz'):
+        out += '.gz'
+
+    count = write_rows(rows, fieldnames, out, fmt, compress)
+    print(f'Выгружено {count} строк ({what}) в {out}')
+    return count
+
+
+def show_pnl(logged_id, currency=None):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    positions = get_trade_ledger().positions(logged_id)
+    if currency:
+        try:
+            currency = get_currency_registry().normalize(currency)
+        except CurrencyNotFoundError as e:
+            print(e)
+            return None
+        positions = {k: v for k, v in positions.items() if k == currency}
+
+    if not positions:
+        print('Сделок пока нет')
+        return None
+
+    index = get_rates_index()
+    base = config.BASE_CURRENCY
+    table = PrettyTable(["Currency", "Position", "Avg cost", "Rate", "Unrealized", "Realized", "Open lots"])
+    total_realized = total_unrealized = 0.0
+    for code, position in sorted(positions.items()):
+        rate = index.rate_to(code, base)
+        open_pnl = unrealized(position, rate)
+        avg_cost = position['cost'] / position['position'] if position['position'] else None
+        total_realized += position['realized']
+        total_unrealized += open_pnl or 0.0
+        table.add_row([
+            code,
+            round(position['position'], 8),
+            round(avg_cost, 8) if avg_cost is not None else None,
+            rate,
+            round(open_pnl, 2) if open_pnl is not None else None,
+            round(position['realized'], 2),
+            position['lots'],
+        ])
+
+    print(table)
+    print(f'Реализованный P&L: {total_realized:.2f} {base}, нереализованный: {total_unrealized:.2f} {base}')
+    unmatched = {k: v['unmatched'] for k, v in positions.items() if v['unmatched']}
+    if unmatched:
+        print('Продано без известной себестоимости (куплено до ведения журнала): '
+              + ', '.join(f'{v} {k}' for k, v in unmatched.items()))
+    return positions
+
+
+def show_portfolio_history(logged_id, since=None, until=None, step=None):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    try:
+        step_ms = int(step) if step else PORTFOLIO_HISTORY_STEP_MS
+        since_ms = to_ms(since) if since else None
+        until_ms = to_ms(until) if until else int(datetime.now().timestamp() * 1000)
+    except ValueError:
+        print('step - целое число миллисекунд, from/to - даты в формате ISO (YYYY-MM-DD[THH:MM:SS])')
+        return None
+    if step_ms <= 0:
+        print('step должен быть положительным числом')
+        return None
+
+    portfolio = get_database().portfolio(logged_id) or {}
+
+    try:
+        series = portfolio_value_series(logged_id, portfolio.get('wallets') or {}, since_ms, until_ms, step_ms)
+    except ValueError as e:
+        print(f'Слишком мелкий шаг для интервала: {e}')
+        return None
+
+    if not series:
+        print('Пустой интервал')
+        return None
+
+    table = PrettyTable(["Time", f"Value, {config.BASE_CURRENCY}"])
+    for ts, value in series:
+        table.add_row([
+            datetime.fromtimestamp(ts / 1000).isoformat(timespec='seconds'),
+            round(value, 2) if value is not None else '—',
+        ])
+    print(table)
+    return series
+
+
+def reshard_storage(shards, dirs=None):
+    try:
+        shards = int(shards) if shards else settings.storage_shards
+    except ValueError:
+        print('shards должен быть целым числом')
+        return None
+    if shards < 1:
+        print('shards должен быть положительным числом')
+        return None
+
+    dirs = [d.strip() for d in dirs.split(',') if d.strip()] if dirs else None
+    moved = get_database().reshard(shards, dirs)
+    print(
+        f"Данные разложены по {shards} шардам: перенесено пользователей {moved['users']}, "
+        f"портфелей {moved['portfolios']}, записей индекса имён {moved['usernames']}"
+    )
+    return moved
+
+
+def import_users(path, workers=None, restart=False):
+    try:
+        workers = int(workers) if workers else None
+    except ValueError:
+        print('workers должен быть целым числом')
+        return None
+
+    if not os.path.isfile(path):
+        print(f'Файл {path} не найден')
+        return None
+
+    def progress(rows, imported, seconds):
+        print(f'Обработано строк: {rows}, импортировано: {imported} ({rows / seconds if seconds else 0:.0f} строк/с)')
+
+    result = UserImporter(workers=workers).run(path, restart=restart, progress=progress)
+    rejected = ', '.join(f'{reason}: {count}' for reason, count in result['rejected'].items()) or 'нет'
+    print(
+        f"Импортировано пользователей: {result['imported']} из {result['rows']} строк "
+        f"за {result['seconds']:.2f} с (отклонено - {rejected})"
+    )
+    return result
+
+
+def show_risk(logged_id, interval=None, window=None, confidence=None, lookback=None):
+    if not logged_id:
+        print('Сначала выполните login')
+        return None
+
+    interval = interval or '1h'
+    if interval not in config.OHLC_RESOLUTIONS:
+        print(f"Неизвестный интервал {interval}. Доступны: {', '.join(config.OHLC_RESOLUTIONS)}")
+        return None
+    try:
+        window = int(window) if window else RISK_WINDOW_DEFAULT
+        lookback = int(lookback) if lookback else RISK_LOOKBACK_DEFAULT
+        confidence = float(confidence) if confidence else 0.99
+    except ValueError:
+        print('window и lookback - целые числа, confidence - число от 0 до 1')
+        return None
+    if window < 2 or lookback < window or not 0 < confidence < 1:
+        print('Нужно: window >= 2, lookback >= window, 0 < confidence < 1')
+        return None
+
+    base = config.BASE_CURRENCY
+    wallets = (get_database().portfolio(logged_id) or {}).get('wallets') or {}
+    balances = {code: w.get('balance', 0.0) for code, w in wallets.items() if code != base and w.get('balance')}
+    if not balances:
+        print('В портфеле нет валют, кроме базовой: рисковать нечем')
+        return None
+
+    codes = sorted(balances)
+    data = load_returns(codes, interval, lookback, base)
+    if data is None or len(data['returns']) < window:
+        print(f'Недостаточно свечей {interval} для окна {window}: нужна история по {", ".join(codes)}')
+        return None
+
+    returns = data['returns']
+    values = [balances[code] * close for code, close in zip(codes, data['closes'])]
+    vol = rolling_volatility(returns, window)[-1]
+    var, es = historical_var(returns, values, confidence)
+
+    table = PrettyTable(["Currency", f"Value, {base}", f"Vol {window}x{interval}, % год."])
+    for code, value, sigma in zip(codes, values, vol):
+        table.add_row([code, round(value, 2), round(annualize(float(sigma), interval) * 100, 2)])
+    print(table)
+
+    if len(codes) > 1:
+        corr = PrettyTable(["", *codes])
+        for code, row in zip(codes, correlation(returns, window)):
+            corr.add_row([code, *(round(float(x), 3) for x in row)])
+        print(f'Корреляции доходностей за последние {window} x {interval}:')
+        print(corr)
+
+    print(
+        f'Исторический VaR {confidence:.0%} на горизонте {interval} по {len(returns)} сценариям: '
+        f'{var:.2f} {base} (expected shortfall {es:.2f} {base})'
+    )
+    return {"var": var, "es": es, "values": dict(zip(codes, values))}
+
+
+def convert_rates(src, out, base=None):
+    if not os.path.isfile(src):
+        print(f'Файл {src} не найден')
+        return None
+
+    if base:
+        try:
+            base = get_currency_registry().normalize(base)
+        except CurrencyNotFoundError as e:
+            print(e)
+            return None
+
+    started = time.perf_counter()
+    try:
+        result = convert_file(src, out, base)
+    except (ValueError, KeyError) as e:
+        print(f'Не удалось разобрать файл {src}: {e}')
+        return None
+    seconds = time.perf_counter() - started
+
+    print(
+        f"Пересчитано {result['rows']} строк в {out} (без курса: {result['missing']}) "
+        f"за {seconds:.2f} с - {result['rows'] / seconds if seconds else 0:.0f} строк/с"
+    )
+    return result
+
+
+def backtest(strategies, cash=None, since=None, until=None, workers=None, out=None):
+    try:
+        specs = parse_specs(strategies)
+        cash = float(cash) if cash else BACKTEST_CASH_DEFAULT
+        workers = int(workers) if workers else None
+    except ValueError as e:
+        print(f"Неверные параметры: {e}. Стратегии: {', '.join(STRATEGIES)}")
+        return None
+    if not specs or not cash > 0:
+        print('Нужна хотя бы одна стратегия и положительный --cash')
+        return None
+
+    try:
+        results = run_backtests(specs, cash, since, until, workers=workers)
+    except (TypeError, ValueError) as e:
+        print(f'Неверные параметры стратегии: {e}')
+        return None
+    if not results[0]['curve']:
+        print('В истории нет курсов за указанный период')
+        return None
+
+    base = config.BASE_CURRENCY
+    table = PrettyTable(["Strategy", "Params", f"Final, {base}", "Return, %", "Max DD, %", "Trades", "Rejected"])
+    for r in results:
+        params = ', '.join(f'{k}={v}' for k, v in r['params'].items()) or '-'
+        table.add_row([
+            r['strategy'], params, round(r['final'], 2), round(r['return'] * 100, 2),
+            round(r['max_drawdown'] * 100, 2), r['trades'], r['rejected'],
+        ])
+    curve = results[0]['curve']
+    print(f'Прогон по {len(curve)} шагам истории: {curve[0][0]} - {curve[-1][0]}')
+    print(table)
+
+    if out:
+        rows = (
+            {"run": i, "strategy": r['strategy'], "params": json.dumps(r['params']), "timestamp": ts, "equity": equity}
+            for i, r in enumerate(results)
+            for ts, equity in r['curve']
+        )
+        fmt = 'jsonl' if out.removesuffix('.gz').endswith('.jsonl') else 'csv'
+        count = write_rows(rows, ["run", "strategy", "params", "timestamp", "equity"], out, fmt, out.endswith('.gz'))
+        print(f'Кривые капитала ({count} точек) сохранены в {out}')
+    return results
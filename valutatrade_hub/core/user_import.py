@@ -0,0 +1,191 @@
+import csv
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+
+from valutatrade_hub.core.currencies import get_currency_registry
+from valutatrade_hub.core.exceptions import CurrencyNotFoundError
+from valutatrade_hub.core.utils import hash_password, make_salt, write_text_atomic
+from valutatrade_hub.infra.database import get_database
+from valutatrade_hub.infra.settings import settings
+
+logger = logging.getLogger("ValutaTrade.Import")
+
+# строк на один проход записи (и на одну контрольную точку)
+BATCH_ROWS = 50000
+HASH_CHUNK = 2000
+MIN_PASSWORD = 4
+
+
+def hash_chunk(items: list[tuple[str, str]]) -> list[str]:
+    """
+    Ф-ция хеширует пары (пароль, соль) - выполняется в процессе пула
+    """
+    return [hash_password(password, salt) for password, salt in items]
+
+
+def _iter_rows(path: str):
+    """
+    Ф-ция потоково отдаёт строки файла: CSV (username,password и колонки-валюты с начальными
+    балансами) или JSONL ({"username", "password", "balances": {валюта: баланс}})
+    """
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if path.lower().endswith(".csv"):
+            for row in csv.DictReader(f):
+                balances = {k: v for k, v in row.items() if k not in ("username", "password") and v not in (None, "")}
+                yield {"username": row.get("username"), "password": row.get("password"), "balances": balances}
+        else:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    row = {}
+                # не объект (массив, число) - такая же пустая строка, отклоняется с причиной
+                yield row if isinstance(row, dict) else {}
+
+
+class UserImporter:
+    """
+    Массовый импорт пользователей с начальными балансами.
+    Файл читается пачками по BATCH_ROWS строк: строки проверяются по индексу имён в памяти,
+    пароли хешируются в пуле процессов, пользователи и портфели пачки записываются
+    одним проходом по шардам, после чего сохраняется контрольная точка - прерванный импорт
+    того же файла продолжается с неё
+    """
+
+    def __init__(self, workers: int | None = None) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.db = get_database()
+        self.registry = get_currency_registry()
+
+    def _checkpoint_path(self, path: str) -> str:
+        name = os.path.basename(path)
+        return settings.get_data_file_path(os.path.join("imports", f"{name}.checkpoint.json"))
+
+    @staticmethod
+    def _file_stamp(path: str) -> list:
+        st = os.stat(path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _load_checkpoint(self, path: str) -> dict:
+        try:
+            with open(self._checkpoint_path(path), "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+        # файл изменился - начинаем заново
+        if state.get("file") != os.path.abspath(path) or state.get("stamp") != self._file_stamp(path):
+            return {}
+        return state
+
+    def _validate(self, row: dict, names: set, reasons: dict) -> dict | None:
+        # имя берётся как есть, как и в register: "bob" и "bob " - разные имена
+        username = str(row.get("username") or "")
+        password = str(row.get("password") or "")
+
+        reason = None
+        if not username.strip():
+            reason = "no_username"
+        elif username in names:
+            reason = "duplicate"
+        elif len(password) < MIN_PASSWORD:
+            reason = "short_password"
+
+        wallets = {}
+        if reason is None:
+            try:
+                for code, balance in (row.get("balances") or {}).items():
+                    balance = float(balance)
+                    if not math.isfinite(balance) or balance < 0:
+                        raise ValueError(balance)
+                    wallets[self.registry.normalize(code)] = {"balance": balance}
+            except (CurrencyNotFoundError, TypeError, ValueError, AttributeError):
+                reason = "bad_balance"
+
+        if reason is not None:
+            reasons[reason] = reasons.get(reason, 0) + 1
+            return None
+
+        names.add(username)
+        return {"username": username, "password": password, "salt": make_salt(), "wallets": wallets}
+
+    def run(self, path: str, restart: bool = False, progress=None) -> dict:
+        started = time.perf_counter()
+        state = {} if restart else self._load_checkpoint(path)
+        done = state.get("rows", 0)
+        imported = state.get("imported", 0)
+        reasons = dict(state.get("rejected", {}))
+
+        names = {u.get("username") for u in self.db.iter_users()}
+        rows = _iter_rows(path)
+        if done:
+            logger.info(f"Resuming import of {path} after {done} rows")
+            for _ in islice(rows, done):
+                pass
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                batch = list(islice(rows, BATCH_ROWS))
+                if not batch:
+                    break
+
+                accepted = [a for a in (self._validate(row, names, reasons) for row in batch) if a]
+                if accepted:
+                    self._write(pool, accepted)
+
+                done += len(batch)
+                imported += len(accepted)
+                self._save_checkpoint(path, done, imported, reasons)
+                if progress:
+                    progress(done, imported, time.perf_counter() - started)
+
+        seconds = time.perf_counter() - started
+        result = {
+            "rows": done,
+            "imported": imported,
+            "rejected": reasons,
+            "seconds": seconds,
+        }
+        logger.info(f"User import from {path}: {result}")
+        return result
+
+    def _write(self, pool: ProcessPoolExecutor, accepted: list[dict]) -> None:
+        items = [(a["password"], a["salt"]) for a in accepted]
+        chunks = [items[i:i + HASH_CHUNK] for i in range(0, len(items), HASH_CHUNK)]
+        hashes = [h for chunk in pool.map(hash_chunk, chunks) for h in chunk]
+
+        first_id = self.db.next_user_id(len(accepted))
+        registered = str(datetime.now())
+        users, portfolios = [], []
+        for offset, (entry, hashed) in enumerate(zip(accepted, hashes)):
+            user_id = first_id + offset
+            users.append({
+                "user_id": user_id,
+                "username": entry["username"],
+                "hashed_password": hashed,
+                "salt": entry["salt"],
+                "registration_date": registered,
+            })
+            portfolios.append({"user_id": user_id, "wallets": entry["wallets"]})
+
+        # портфели пишутся первыми, чтобы пользователь не появился без портфеля
+        self.db.save_portfolios(portfolios)
+        self.db.save_users(users)
+
+    def _save_checkpoint(self, path: str, rows: int, imported: int, reasons: dict) -> None:
+        state = {
+            "file": os.path.abspath(path),
+            "stamp": self._file_stamp(path),
+            "rows": rows,
+            "imported": imported,
+            "rejected": reasons,
+            "updated_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        write_text_atomic(self._checkpoint_path(path), json.dumps(state))
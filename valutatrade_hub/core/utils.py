@@ -1,7 +1,15 @@
+import hashlib
 import json
+import os
+import random
+import tempfile
+import time
 from datetime import datetime
 
+from valutatrade_hub.infra.database import get_database
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.rate_board import read_rate_board
+from valutatrade_hub.parser_service.storage import Storage, read_last_refresh
 from valutatrade_hub.parser_service.updater import RatesUpdater
 
 config = ParserConfig()
@@ -18,6 +26,44 @@ def from_json(filepath):
         return {}
 
 
+def iter_json_array(filepath, chunk_size=65536):
+    """
+    Ф-ция потоково отдаёт элементы JSON-массива из файла, не загружая его целиком
+    """
+    decoder = json.JSONDecoder()
+    try:
+        file = open(filepath, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return
+
+    with file:
+        buf = file.read(chunk_size).lstrip()
+        if not buf.startswith('['):
+            return
+        buf = buf[1:]
+        eof = False
+
+        while True:
+            buf = buf.lstrip().lstrip(',').lstrip()
+            if buf.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buf)
+                # элемент упёрся в конец буфера - он может быть не дочитан
+                if end == len(buf) and not eof:
+                    raise json.JSONDecodeError('incomplete', buf, end)
+            except json.JSONDecodeError:
+                if eof:
+                    return
+                more = file.read(chunk_size)
+                eof = not more
+                buf += more
+                continue
+
+            yield item
+            buf = buf[end:]
+
+
 def to_json(filepath, data):
     """
     Ф-ция сохраняет переданные данные в JSON-файл
@@ -26,57 +72,119 @@ def to_json(filepath, data):
         json.dump(data, file, ensure_ascii=False, indent=2)
 
 
-def get_rates(to_currency):
+def write_text_atomic(filepath, text):
     """
-    Ф-ция загружает курсы валют из JSON-файла
+    Ф-ция записывает текст в файл через временный файл и os.replace
     """
+    dir_path = os.path.dirname(filepath) or '.'
+    os.makedirs(dir_path, exist_ok=True)
+
+    tmp_path = None
     try:
-        with open('data/rates.json', 'r') as file:
-            loaded = json.load(file)
+        with tempfile.NamedTemporaryFile('w', delete=False, suffix='.json', dir=dir_path, encoding='utf-8') as tmp:
+            tmp.write(text)
+            tmp_path = tmp.name
+        os.replace(tmp_path, filepath)
+        tmp_path = None
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
 
-        if not isinstance(loaded, dict):
-            return {}, []
 
-        data = loaded.get('pairs', {})
-        if not isinstance(data, dict):
-            return {}, []
+def to_json_atomic(filepath, data):
+    """
+    Ф-ция атомарно сохраняет переданные данные в JSON-файл
+    """
+    write_text_atomic(filepath, json.dumps(data, ensure_ascii=False, indent=2))
 
-        to_currency = to_currency.upper().strip()
-        last_date_str = loaded.get('last_refresh')
 
-        if last_date_str:
-            last_date = datetime.strptime(last_date_str, '%Y-%m-%dT%H:%M:%S')
-            minutes = (datetime.now() - last_date).total_seconds() / 60
-        else:
-            minutes = 999
+SALT_SYMBOLS = '1234567890-=+*%!?><$#@;:qwertyuiopasdfghjklzxcvbnm'
 
-        if minutes > 5:
-            updater = RatesUpdater(config)
-            updater.run_update(None)
 
-            with open('data/rates.json', 'r') as file:
-                loaded = json.load(file)
+def make_salt():
+    """
+    Ф-ция генерирует случайную соль для пароля
+    """
+    return ''.join(random.choices(SALT_SYMBOLS, k=random.randint(5, 20)))
 
-            if not isinstance(loaded, dict):
-                return {}, []
 
-            data = loaded.get('pairs', {})
-            if not isinstance(data, dict):
-                return {}, []
+def hash_password(password, salt):
+    """
+    Ф-ция возвращает sha256 пароля с солью
+    """
+    return hashlib.sha256((password + salt).encode('utf-8')).hexdigest()
 
-            last_date_str = loaded.get('last_refresh')
 
-        valid_keys = [key for key in data if key.endswith(f'_{to_currency}')]
+def get_rates(to_currency, codes=None):
+    """
+    Ф-ция загружает курсы валют из JSON-файла (через тёплый снимок).
+    codes - валюты, курсы которых нужны свежими: их возраст считается по проверке каждой пары,
+    а не по общему last_refresh (выборка по спросу обновляет не все пары сразу)
+    """
+    to_currency = to_currency.upper().strip()
+    db = get_database()
+    if codes is None:
+        def is_stale():
+            return _rates_age_minutes(db) > 5
+    else:
+        codes = {code.upper() for code in codes if code} - {config.BASE_CURRENCY}
+
+        def is_stale():
+            return _pairs_age_minutes(db, codes) > 5
+
+    if to_currency == config.BASE_CURRENCY:
+        board = read_rate_board(config)
+        if board is not None:
+            rates, refreshed_at = board
+            fresh = time.time() - refreshed_at <= 5 * 60 if codes is None else not is_stale()
+            if fresh:
+                last_date_str = datetime.fromtimestamp(refreshed_at).isoformat(timespec='seconds')
+                valid_courses = {pair.split('_')[0]: rate for pair, rate in rates.items()}
+                return valid_courses, [last_date_str] * len(valid_courses)
+
+    if not isinstance(db.rates().get('pairs'), dict):
+        return {}, []
+
+    if is_stale():
+        # из одновременных вызовов обновляет один процесс, остальные ждут и читают его результат
+        RatesUpdater(config).refresh_single_flight(is_stale)
 
-        valid_courses = {
-            key.replace(f'_{to_currency}', ''): data[key].get('rate')
-            for key in valid_keys
-        }
+    loaded = db.rates()
+    if not isinstance(loaded.get('pairs'), dict):
+        return {}, []
 
-        update_dates = [last_date_str] * len(valid_courses)
+    last_date_str = read_last_refresh(config, loaded.get('last_refresh'))
+    valid_courses = dict(db.rates_to(to_currency))
+    update_dates = [last_date_str] * len(valid_courses)
 
-        return valid_courses, update_dates
+    return valid_courses, update_dates
 
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}, []
 
+def _rates_age_minutes(db):
+    """
+    Ф-ция возвращает возраст последней проверки курсов в минутах
+    """
+    last_date_str = read_last_refresh(config, db.rates().get('last_refresh'))
+    if not last_date_str:
+        return 999
+    last_date = datetime.strptime(last_date_str, '%Y-%m-%dT%H:%M:%S')
+    return (datetime.now() - last_date).total_seconds() / 60
+
+
+def _pairs_age_minutes(db, codes):
+    """
+    Ф-ция возвращает в минутах возраст самой давней проверки курсов codes к базовой валюте
+    """
+    if not codes:
+        return 0
+    checks = Storage(config).load_pair_checks()
+    pairs = db.rates().get('pairs') or {}
+    oldest = None
+    for code in codes:
+        pair = f'{code}_{config.BASE_CURRENCY}'
+        checked = max(checks.get(pair) or '', (pairs.get(pair) or {}).get('updated_at') or '')
+        if not checked:
+            return 999
+        oldest = min(oldest or checked, checked)
+    last_date = datetime.strptime(oldest[:19], '%Y-%m-%dT%H:%M:%S')
+    return (datetime.now() - last_date).total_seconds() / 60
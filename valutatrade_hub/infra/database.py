@@ -0,0 +1,470 @@
+import copy
+import hashlib
+import json
+import logging
+import marshal
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+from valutatrade_hub.infra.settings import settings
+from valutatrade_hub.parser_service.refresh_lock import RefreshLock
+
+logger = logging.getLogger("ValutaTrade.Database")
+
+SNAPSHOT_MAGIC = b"VTSNAP3\n"
+DIGEST_SIZE = 32
+SCAN_WORKERS = 8
+# сколько ждать межпроцессную блокировку записи пользователей и портфелей
+WRITE_LOCK_TIMEOUT = 60
+
+# вид данных -> поле-ключ, по хешу которого запись попадает в шард
+KEYS = {
+    "users": "user_id",
+    "portfolios": "user_id",
+    "usernames": "username",
+}
+
+
+class _DatabaseMeta(type):
+    """
+    Метакласс для реализации Singleton
+    """
+    _instance = None
+
+    def __call__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__call__(*args, **kwargs)
+        return cls._instance
+
+
+def shard_of(key, shards: int) -> int:
+    """
+    Ф-ция возвращает номер шарда ключа (crc32 стабилен между процессами, в отличие от hash)
+    """
+    return zlib.crc32(str(key).encode("utf-8")) % shards
+
+
+def _stamp(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _read_json(path: str, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return default
+    return data if isinstance(data, type(default)) else default
+
+
+def _write_json(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _build_shard(key: str):
+    def build(rows: list) -> dict:
+        return {"rows": rows, "pos": {row.get(key): i for i, row in enumerate(rows)}}
+    return build
+
+
+def _build_rates(data: dict) -> dict:
+    # курсы, сгруппированные по валюте котировки: {"USD": {"BTC": 90000.0, ...}}
+    by_quote: dict[str, dict[str, float]] = {}
+    pairs = data.get("pairs")
+    for key, value in (pairs if isinstance(pairs, dict) else {}).items():
+        code, sep, quote = key.partition("_")
+        if sep and isinstance(value, dict):
+            by_quote.setdefault(quote, {})[code] = value.get("rate")
+    return {"raw": data, "by_quote": by_quote}
+
+
+class DatabaseManager(metaclass=_DatabaseMeta):
+    """
+    Шардированное JSON-хранилище пользователей и портфелей.
+    Запись попадает в шард по crc32 от user_id (индекс имён - от username), шарды
+    раскладываются по каталогам данных из настроек. Раскладки перечислены в манифесте
+    shards.json: первая - текущая, остальные - старые, ещё не перенесённые при решардинге;
+    чтение идёт от новой раскладки к старым, запись - в новую с удалением из старой.
+    Без манифеста действует исходная раскладка: один шард users.json / portfolios.json.
+
+    Каждый прочитанный файл кешируется в памяти и в бинарном снимке (marshal с контрольной
+    суммой blake2b и отметкой mtime/size исходника), поэтому новый процесс читает готовые
+    таблицы одним read и разбирает JSON только изменившихся шардов. marshal восстанавливает
+    только данные (словари, списки, строки, числа) и ничего не исполняет, поэтому подмена
+    снимка в data/ не даёт выполнить код; контрольная сумма ловит только повреждение
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.RLock()
+        self._tables: dict[str, tuple] = {}
+        self._manifest = None
+        self._manifest_stamp = None
+
+    # --- межпроцессная блокировка ---
+
+    @contextmanager
+    def _write_lock(self):
+        """
+        Блокировка записи для всех процессов (файл data/users.lock): под ней выдаются user_id,
+        переписываются шарды и переносятся шарды при решардинге. Не вкладывается сама в себя
+        """
+        lock = RefreshLock(settings.get_data_file_path("users.lock"))
+        if not lock.acquire(timeout=WRITE_LOCK_TIMEOUT):
+            raise TimeoutError(f"database write lock is busy for more than {WRITE_LOCK_TIMEOUT} s")
+        try:
+            yield
+        finally:
+            lock.release()
+
+    # --- раскладки ---
+
+    @staticmethod
+    def manifest_path() -> str:
+        return settings.get_data_file_path("shards.json")
+
+    def layouts(self) -> list[dict]:
+        with self._lock:
+            stamp = _stamp(self.manifest_path())
+            if self._manifest is None or stamp != self._manifest_stamp:
+                manifest = _read_json(self.manifest_path(), {})
+                self._manifest = manifest.get("layouts") or [
+                    {"gen": 0, "shards": 1, "dirs": [settings.data_directory]}
+                ]
+                self._manifest_stamp = stamp
+            return self._manifest
+
+    def _save_layouts(self, layouts: list[dict]) -> None:
+        _write_json(self.manifest_path(), {"layouts": layouts})
+        self._manifest = layouts
+        self._manifest_stamp = _stamp(self.manifest_path())
+
+    @staticmethod
+    def shard_paths(kind: str, layout: dict) -> list[str]:
+        return [settings.get_shard_path(kind, layout["gen"], i, layout["dirs"]) for i in range(layout["shards"])]
+
+    def _shard_path(self, kind: str, layout: dict, key) -> str:
+        return settings.get_shard_path(kind, layout["gen"], shard_of(key, layout["shards"]), layout["dirs"])
+
+    # --- файлы и снимки ---
+
+    @staticmethod
+    def _snapshot_path(path: str) -> str:
+        return str(Path(settings.get_data_file_path("snapshots")) / (Path(path).name + ".bin"))
+
+    def _read_snapshot(self, path: str, stamp):
+        try:
+            with open(self._snapshot_path(path), "rb") as f:
+                blob = f.read()
+        except OSError:
+            return None
+
+        header = len(SNAPSHOT_MAGIC) + DIGEST_SIZE
+        if not blob.startswith(SNAPSHOT_MAGIC) or len(blob) <= header:
+            return None
+        digest, payload = blob[len(SNAPSHOT_MAGIC):header], blob[header:]
+        if hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest() != digest:
+            logger.warning(f"Snapshot of {path}: checksum mismatch, falling back to JSON")
+            return None
+
+        # сборщик мусора здесь не отключается: снимки читаются и из потоков _scan,
+        # а gc.disable()/gc.enable() действуют на весь процесс
+        try:
+            snapshot = marshal.loads(payload)
+        except (EOFError, ValueError, TypeError) as e:
+            logger.warning(f"Snapshot of {path} is unreadable: {e}")
+            return None
+        if not isinstance(snapshot, dict) or not isinstance(snapshot.get("table"), dict):
+            return None
+        return snapshot["table"] if snapshot.get("stamp") == stamp else None
+
+    def _write_snapshot(self, path: str, stamp, table: dict) -> None:
+        try:
+            payload = marshal.dumps({"stamp": stamp, "table": table})
+        except ValueError as e:
+            # в JSON-данных оказалось значение, которое marshal не сериализует
+            logger.warning(f"Failed to write snapshot of {path}: {e}")
+            return
+        digest = hashlib.blake2b(payload, digest_size=DIGEST_SIZE).digest()
+        snapshot_path = self._snapshot_path(path)
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        tmp_path = f"{snapshot_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(SNAPSHOT_MAGIC + digest + payload)
+            os.replace(tmp_path, snapshot_path)
+        except OSError as e:
+            logger.warning(f"Failed to write snapshot of {path}: {e}")
+
+    def _table(self, path: str, default, build) -> dict:
+        """
+        Ф-ция возвращает таблицу файла: из памяти, из снимка или разбором JSON (по отметке mtime/size)
+        """
+        stamp = _stamp(path)
+        with self._lock:
+            cached = self._tables.get(path)
+            if cached and cached[0] == stamp:
+                return cached[1]
+
+        table = self._read_snapshot(path, stamp) if stamp else None
+        if table is None:
+            table = build(_read_json(path, default))
+            if stamp:
+                self._write_snapshot(path, stamp, table)
+
+        with self._lock:
+            self._tables[path] = (stamp, table)
+        return table
+
+    def _shard(self, kind: str, path: str) -> dict:
+        return self._table(path, [], _build_shard(KEYS[kind]))
+
+    def _write_shard(self, kind: str, path: str, rows: list) -> None:
+        _write_json(path, rows)
+        stamp = _stamp(path)
+        table = _build_shard(KEYS[kind])(rows)
+        self._write_snapshot(path, stamp, table)
+        with self._lock:
+            self._tables[path] = (stamp, table)
+
+    # --- операции над записями ---
+
+    def _get(self, kind: str, key) -> dict | None:
+        for layout in self.layouts():
+            row = self._get_in(kind, layout, key)
+            if row is not None:
+                return row
+        return None
+
+    def _get_in(self, kind: str, layout: dict, key) -> dict | None:
+        table = self._shard(kind, self._shard_path(kind, layout, key))
+        idx = table["pos"].get(key)
+        return table["rows"][idx] if idx is not None else None
+
+    def _put_many(self, kind: str, rows: list) -> None:
+        """
+        Ф-ция сохраняет записи в текущую раскладку и удаляет их копии из старых
+        """
+        # раскладки читаются под блокировкой: решардинг не переключит их посреди записи
+        with self._write_lock(), self._lock:
+            self._put_many_locked(kind, rows)
+
+    def _put_many_locked(self, kind: str, rows: list) -> None:
+        layouts = self.layouts()
+        self._put_many_in(kind, layouts[0], rows)
+        for layout in layouts[1:]:
+            self._delete_from(kind, layout, [row[KEYS[kind]] for row in rows])
+
+    def _put_many_in(self, kind: str, layout: dict, rows: list) -> None:
+        """
+        Ф-ция вставляет или заменяет записи, переписывая каждый затронутый шард один раз
+        """
+        key_field = KEYS[kind]
+        by_path: dict[str, list] = {}
+        for row in rows:
+            by_path.setdefault(self._shard_path(kind, layout, row[key_field]), []).append(row)
+
+        for path, changed in by_path.items():
+            table = self._shard(kind, path)
+            shard_rows = list(table["rows"])
+            for row in changed:
+                idx = table["pos"].get(row[key_field])
+                if idx is None:
+                    shard_rows.append(row)
+                else:
+                    shard_rows[idx] = row
+            self._write_shard(kind, path, shard_rows)
+
+    def _delete_from(self, kind: str, layout: dict, keys) -> None:
+        by_path: dict[str, set] = {}
+        for key in keys:
+            by_path.setdefault(self._shard_path(kind, layout, key), set()).add(key)
+        for path, drop in by_path.items():
+            table = self._shard(kind, path)
+            if any(key in table["pos"] for key in drop):
+                rows = [row for row in table["rows"] if row.get(KEYS[kind]) not in drop]
+                self._write_shard(kind, path, rows)
+
+    def _scan(self, kind: str, reader=None):
+        """
+        Ф-ция обходит все шарды вида: файлы шардов читаются параллельно,
+        при решардинге запись из новой раскладки скрывает свою старую копию.
+        reader(path) -> записи шарда; по умолчанию шард берётся через кеш и снимок
+        """
+        layouts = self.layouts()
+        key_field = KEYS[kind]
+        seen = set() if len(layouts) > 1 else None
+        load = reader or (lambda path: self._shard(kind, path)["rows"])
+
+        for layout in layouts:
+            paths = self.shard_paths(kind, layout)
+            with ThreadPoolExecutor(max_workers=min(SCAN_WORKERS, len(paths))) as executor:
+                for rows in executor.map(load, paths):
+                    for row in rows:
+                        if seen is not None:
+                            if row.get(key_field) in seen:
+                                continue
+                            seen.add(row.get(key_field))
+                        yield row
+
+    # --- пользователи и портфели ---
+
+    # users/user/portfolios/portfolio возвращают копии: изменения вызывающего не попадают
+    # в кеш, пока не сохранены; iter_* отдают записи кеша только для чтения
+
+    def users(self) -> list[dict]:
+        return copy.deepcopy(list(self._scan("users")))
+
+    def iter_users(self, reader=None):
+        """
+        Ф-ция отдаёт пользователей шард за шардом (reader - см. _scan), записи только для чтения
+        """
+        return self._scan("users", reader)
+
+    def user(self, user_id: int) -> dict | None:
+        return copy.deepcopy(self._get("users", user_id))
+
+    def user_by_name(self, username: str) -> dict | None:
+        self._ensure_usernames()
+        entry = self._get("usernames", username)
+        return self.user(entry["user_id"]) if entry else None
+
+    def _ensure_usernames(self) -> None:
+        """
+        Ф-ция строит индекс имён по шардам пользователей, если его ещё нет (данные до шардирования)
+        """
+        layout = self.layouts()[0]
+        if any(os.path.exists(p) for p in self.shard_paths("usernames", layout)):
+            return
+        entries = [{"username": u.get("username"), "user_id": u.get("user_id")} for u in self._scan("users")]
+        if entries:
+            self._put_many("usernames", entries)
+
+    def next_user_id(self, count: int = 1) -> int:
+        """
+        Ф-ция выдаёт следующий user_id из счётчика users_seq.json
+        (при count > 1 - первый из count подряд идущих)
+        """
+        path = settings.get_data_file_path("users_seq.json")
+        start = None
+        if not os.path.exists(path):
+            # счётчика ещё нет (данные до шардирования): продолжаем от максимального user_id.
+            # Обход идёт вне блокировки - потоки _scan сами берут её при чтении шардов
+            start = max((u.get("user_id") or 0 for u in self._scan("users")), default=0) + 1
+
+        with self._write_lock(), self._lock:
+            seq = _read_json(path, {}).get("next_id") or start
+            _write_json(path, {"next_id": seq + count})
+            return seq
+
+    def save_user(self, user: dict) -> None:
+        self.save_users([user])
+
+    def save_users(self, users: list[dict]) -> None:
+        self._ensure_usernames()
+        self._put_many("users", users)
+        self._put_many("usernames", [{"username": u["username"], "user_id": u["user_id"]} for u in users])
+
+    def portfolios(self) -> list[dict]:
+        return copy.deepcopy(list(self._scan("portfolios")))
+
+    def iter_portfolios(self, reader=None):
+        return self._scan("portfolios", reader)
+
+    def portfolio(self, user_id: int) -> dict | None:
+        return copy.deepcopy(self._get("portfolios", user_id))
+
+    def save_portfolio(self, portfolio: dict) -> None:
+        self._put_many("portfolios", [portfolio])
+
+    def save_portfolios(self, portfolios) -> None:
+        self._put_many("portfolios", list(portfolios))
+
+    def update_portfolios(self, apply) -> None:
+        """
+        Ф-ция читает, изменяет и сохраняет портфели под блокировкой записи, поэтому между
+        чтением и записью их не перепишет другой процесс. apply(get_portfolio) получает копии
+        портфелей через get_portfolio(user_id) и возвращает user_id изменённых
+        """
+        with self._write_lock(), self._lock:
+            touched = {}
+
+            def get_portfolio(user_id):
+                if user_id not in touched:
+                    touched[user_id] = copy.deepcopy(self._get("portfolios", user_id))
+                return touched[user_id]
+
+            changed = [touched[uid] for uid in apply(get_portfolio) if touched.get(uid) is not None]
+            if changed:
+                self._put_many_locked("portfolios", changed)
+
+    # --- решардинг ---
+
+    def reshard(self, shards: int, dirs: list[str] | None = None) -> dict:
+        """
+        Ф-ция переносит данные в новую раскладку, не останавливая работу:
+        сначала новая раскладка становится текущей (записи идут уже в неё), затем
+        старые шарды переносятся по одному и удаляются, в конце старые раскладки
+        убираются из манифеста
+        """
+        dirs = dirs or settings.data_directories
+        with self._write_lock(), self._lock:
+            layouts = self.layouts()
+            new = {"gen": max(layout["gen"] for layout in layouts) + 1, "shards": shards, "dirs": dirs}
+            old_layouts = layouts
+            self._save_layouts([new] + old_layouts)
+
+        moved = {kind: 0 for kind in KEYS}
+        for layout in old_layouts:
+            for kind in KEYS:
+                for path in self.shard_paths(kind, layout):
+                    if not os.path.exists(path):
+                        continue
+                    # шард читается и удаляется под блокировкой: запись другого процесса
+                    # попадёт в него до переноса или уже в новую раскладку
+                    with self._write_lock(), self._lock:
+                        rows = self._shard(kind, path)["rows"]
+                        # записи, уже сохранённые в новую раскладку после переключения, не трогаем
+                        fresh = [r for r in rows if self._get_in(kind, new, r.get(KEYS[kind])) is None]
+                        self._put_many_in(kind, new, fresh)
+                        moved[kind] += len(fresh)
+                        os.remove(path)
+                        self._tables.pop(path, None)
+                        try:
+                            os.remove(self._snapshot_path(path))
+                        except OSError:
+                            pass
+
+        with self._write_lock(), self._lock:
+            self._save_layouts([new])
+        logger.info(f"Resharded to {shards} shards in {', '.join(dirs)}: {moved}")
+        return moved
+
+    # --- курсы ---
+
+    def rates(self) -> dict:
+        """
+        Ф-ция возвращает содержимое rates.json (pairs, last_refresh)
+        """
+        return self._table(settings.get_data_file_path("rates.json"), {}, _build_rates)["raw"]
+
+    def rates_to(self, quote: str) -> dict[str, float]:
+        """
+        Ф-ция возвращает курсы всех валют к quote без разбора ключей пар
+        """
+        return self._table(settings.get_data_file_path("rates.json"), {}, _build_rates)["by_quote"].get(quote, {})
+
+
+def get_database() -> DatabaseManager:
+    return DatabaseManager()
@@ -31,7 +31,9 @@ class SettingsLoader(metaclass=_SettingsMeta):
             "log_format": "text",
             "max_log_size_mb": 10,
             "backup_log_files": 5,
-            "supported_currencies": ["USD", "EUR", "RUB", "GBP", "JPY", "BTC", "ETH"],
+            "supported_currencies": ["USD", "EUR", "RUB", "GBP", "JPY", "CNY", "BTC", "ETH", "SOL", "LTC", "XRP"],
+            "storage_shards": 1,
+            "data_directories": [],
         }
 
         self._config = dict(default_config)
@@ -97,8 +99,26 @@ class SettingsLoader(metaclass=_SettingsMeta):
     def log_format(self) -> str:
         return self.get("log_format", "text")
 
+    @property
+    def storage_shards(self) -> int:
+        return self.get("storage_shards", 1)
+
+    @property
+    def data_directories(self) -> list[str]:
+        return self.get("data_directories") or [self.data_directory]
+
     def get_data_file_path(self, filename: str) -> str:
         return str(Path(self.data_directory) / filename)
 
+    def get_shard_path(self, name: str, gen: int, index: int, dirs: list[str] | None = None) -> str:
+        """
+        Путь к шарду index раскладки gen. Раскладка 0 - исходные файлы <name>.json без шардирования,
+        шарды остальных раскладок распределяются по каталогам dirs по кругу
+        """
+        if gen == 0:
+            return self.get_data_file_path(f"{name}.json")
+        dirs = dirs or self.data_directories
+        return str(Path(dirs[index % len(dirs)]) / "shards" / f"{name}-g{gen}-{index:03d}.json")
+
 
 settings = SettingsLoader()
\ No newline at end of file
@@ -0,0 +1,138 @@
+import json
+import logging
+import math
+import os
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+NON_POSITIVE = "non_positive"
+MAX_JUMP = "max_jump"
+ZSCORE = "zscore"
+
+
+class AnomalyFilter:
+    """
+    Фильтр подозрительных тиков. По каждой паре хранит O(1) состояние: последний принятый курс,
+    EWMA-среднее и дисперсию лог-доходностей и число принятых изменений.
+    Тик отклоняется, если курс не положителен, если скачок |ln(rate/last)| больше
+    ANOMALY_MAX_JUMP или (после ANOMALY_WARMUP изменений) доходность дальше ANOMALY_Z
+    стандартных отклонений от среднего и больше ANOMALY_MIN_MOVE по модулю.
+    ANOMALY_CONFIRM подозрительных тиков подряд около одного уровня принимаются как новый уровень
+    """
+
+    def __init__(self, config: ParserConfig) -> None:
+        self.config = config
+        self.path = config.ANOMALY_STATE_PATH
+        self._stamp = None
+        self.pairs: dict[str, dict] = {}
+        self.dirty = False
+
+    def refresh(self) -> None:
+        """
+        Ф-ция перечитывает состояние, если файл изменился (например, его сохранил другой процесс)
+        """
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        self._stamp = stamp
+        self.pairs = data if isinstance(data, dict) else {}
+        self.dirty = False
+
+    def save(self) -> None:
+        if not self.dirty:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + f".{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.pairs, f, separators=(",", ":"))
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._stamp = (st.st_mtime_ns, st.st_size)
+        self.dirty = False
+
+    def check(self, pair: str, rate, prev_rate: float | None = None) -> str | None:
+        """
+        Ф-ция проверяет тик и обновляет состояние пары. Возвращает причину отклонения или None.
+        prev_rate (курс из кеша) задаёт начальный уровень пары без сохранённого состояния
+        """
+        if not isinstance(rate, (int, float)) or not math.isfinite(rate) or rate <= 0:
+            return NON_POSITIVE
+
+        state = self.pairs.get(pair)
+        if state is None:
+            state = {"last": prev_rate if prev_rate and prev_rate > 0 else None, "mean": 0.0, "var": 0.0, "n": 0}
+            self.pairs[pair] = state
+        self.dirty = True
+
+        if state["last"] is None:
+            state["last"] = rate
+            return None
+
+        ret = math.log(rate / state["last"])
+        reason = self._classify(state, ret)
+        if reason is None:
+            self._accept(state, rate, ret)
+            return None
+
+        if self._confirm(state, rate):
+            logger.warning(f"Anomaly filter: {pair} confirmed a new level {rate} after {self.config.ANOMALY_CONFIRM} ticks")
+            # новый уровень: статистику доходностей набираем заново
+            state.update(last=rate, mean=0.0, var=0.0, n=0)
+            return None
+        return reason
+
+    def _classify(self, state: dict, ret: float) -> str | None:
+        if abs(ret) > self.config.ANOMALY_MAX_JUMP:
+            return MAX_JUMP
+        if state["n"] >= self.config.ANOMALY_WARMUP and abs(ret) > self.config.ANOMALY_MIN_MOVE:
+            std = math.sqrt(state["var"])
+            if std > 0 and abs(ret - state["mean"]) > self.config.ANOMALY_Z * std:
+                return ZSCORE
+        return None
+
+    def _accept(self, state: dict, rate: float, ret: float) -> None:
+        alpha = self.config.ANOMALY_EWMA_ALPHA
+        diff = ret - state["mean"]
+        state["mean"] += alpha * diff
+        state["var"] = (1 - alpha) * (state["var"] + alpha * diff * diff)
+        state["n"] += 1
+        state["last"] = rate
+        state.pop("pending", None)
+
+    def _confirm(self, state: dict, rate: float) -> bool:
+        """
+        Ф-ция считает подряд идущие подозрительные тики около одного уровня
+        """
+        pending = state.get("pending")
+        if pending and abs(math.log(rate / pending[0])) <= self.config.ANOMALY_CONFIRM_BAND:
+            pending[1] += 1
+        else:
+            pending = [rate, 1]
+        state["pending"] = pending
+        if pending[1] >= self.config.ANOMALY_CONFIRM:
+            del state["pending"]
+            return True
+        return False
+
+
+def quarantine(config: ParserConfig, records: list[dict]) -> None:
+    """
+    Ф-ция дописывает отклонённые тики в журнал карантина (JSON Lines)
+    """
+    if not records:
+        return
+    os.makedirs(os.path.dirname(config.QUARANTINE_PATH) or ".", exist_ok=True)
+    with open(config.QUARANTINE_PATH, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
@@ -8,19 +8,42 @@ from valutatrade_hub.parser_service.config import ParserConfig
 
 class BaseApiClient(ABC):
     @abstractmethod
-    def fetch_rates(self) -> dict:
+    def fetch_rates(self, codes=None) -> dict:
+        """
+        Ф-ция возвращает курсы codes к базовой валюте (None - все валюты класса активов из конфига)
+        """
         pass
 
 
+def _select(codes, configured) -> list[str]:
+    """
+    Ф-ция оставляет запрошенные коды, которые поддерживает конфиг, в порядке конфига
+    """
+    if codes is None:
+        return list(configured)
+    wanted = set(codes)
+    return [code for code in configured if code in wanted]
+
+
+def _batches(items: list, size: int):
+    for i in range(0, len(items), max(1, size)):
+        yield items[i:i + size]
+
+
 class CoinGeckoClient(BaseApiClient):
     def __init__(self, config: ParserConfig):
         super().__init__()
         self.config = config
 
-    def fetch_rates(self) -> dict:
-        ids = ",".join(
-            self.config.CRYPTO_ID_MAP[code] for code in self.config.CRYPTO_CURRENCIES
-        )
+    def fetch_rates(self, codes=None) -> dict:
+        codes = [c for c in _select(codes, self.config.CRYPTO_CURRENCIES) if c in self.config.CRYPTO_ID_MAP]
+        rates = {}
+        for batch in _batches(codes, self.config.FETCH_BATCH_SIZE):
+            rates.update(self._fetch_batch(batch))
+        return rates
+
+    def _fetch_batch(self, codes: list[str]) -> dict:
+        ids = ",".join(self.config.CRYPTO_ID_MAP[code] for code in codes)
         url = (
             f"{self.config.COINGECKO_URL}?ids={ids}"
             f"&vs_currencies={self.config.BASE_CURRENCY.lower()}"
@@ -37,7 +60,7 @@ class CoinGeckoClient(BaseApiClient):
         data = response.json()
         rates = {}
 
-        for code in self.config.CRYPTO_CURRENCIES:
+        for code in codes:
             coin_id = self.config.CRYPTO_ID_MAP.get(code)
             if not coin_id:
                 continue
@@ -62,7 +85,11 @@ class ExchangeRateApiClient(BaseApiClient):
         super().__init__()
         self.config = config
 
-    def fetch_rates(self) -> dict:
+    def fetch_rates(self, codes=None) -> dict:
+        # эндпоинт отдаёт всю таблицу одним запросом, поэтому коды только фильтруют ответ
+        codes = _select(codes, self.config.FIAT_CURRENCIES)
+        if not codes:
+            return {}
         if not self.config.EXCHANGERATE_API_KEY:
             raise ValueError("EXCHANGERATE_API_KEY не установлен")
 
@@ -87,12 +114,12 @@ class ExchangeRateApiClient(BaseApiClient):
         base = self.config.BASE_CURRENCY
         conversion_rates = data.get("conversion_rates", {})
 
-        for code in self.config.FIAT_CURRENCIES:
+        for code in codes:
             usd_to_code = conversion_rates.get(code)
-            if usd_to_code is None:
+            if not usd_to_code:
                 continue
 
-            rate_code_to_usd = 1 / usd_to_code if usd_to_code != 0 else 0.0
+            rate_code_to_usd = 1 / usd_to_code
 
             pair = f"{code}_{base}"
             rates[pair] = {
@@ -105,4 +132,100 @@ class ExchangeRateApiClient(BaseApiClient):
                 },
             }
 
-        return rates
\ No newline at end of file
+        return rates
+
+
+class CryptoCompareClient(BaseApiClient):
+    def __init__(self, config: ParserConfig):
+        super().__init__()
+        self.config = config
+
+    def fetch_rates(self, codes=None) -> dict:
+        codes = _select(codes, self.config.CRYPTO_CURRENCIES)
+        rates = {}
+        for batch in _batches(codes, self.config.FETCH_BATCH_SIZE):
+            rates.update(self._fetch_batch(batch))
+        return rates
+
+    def _fetch_batch(self, codes: list[str]) -> dict:
+        base = self.config.BASE_CURRENCY
+        url = (
+            f"{self.config.CRYPTOCOMPARE_URL}?fsyms={','.join(codes)}"
+            f"&tsyms={base}"
+        )
+
+        try:
+            response = requests.get(url, timeout=self.config.REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            raise ApiRequestError(str(e)) from e
+
+        if response.status_code != 200:
+            raise ApiRequestError(f"Ошибка: {response.status_code}")
+
+        data = response.json()
+        if not isinstance(data, dict) or data.get("Response") == "Error":
+            raise ApiRequestError(f"CryptoCompare: {data}")
+
+        rates = {}
+        for code in codes:
+            rate = data.get(code, {}).get(base)
+            if rate is None:
+                continue
+
+            rates[f"{code}_{base}"] = {
+                "rate": rate,
+                "meta": {
+                    "request_ms": response.elapsed.total_seconds() * 1000,
+                    "status_code": response.status_code,
+                },
+            }
+
+        return rates
+
+
+class OpenErApiClient(BaseApiClient):
+    """
+    Бесплатный эндпоинт open.er-api.com (без ключа) - резервный источник фиатных курсов
+    """
+
+    def __init__(self, config: ParserConfig):
+        super().__init__()
+        self.config = config
+
+    def fetch_rates(self, codes=None) -> dict:
+        codes = _select(codes, self.config.FIAT_CURRENCIES)
+        if not codes:
+            return {}
+        base = self.config.BASE_CURRENCY
+        url = f"{self.config.OPEN_ER_API_URL}/{base}"
+
+        try:
+            response = requests.get(url, timeout=self.config.REQUEST_TIMEOUT)
+        except requests.RequestException as e:
+            raise ApiRequestError(str(e)) from e
+
+        if response.status_code != 200:
+            raise ApiRequestError(f"Ошибка: {response.status_code}")
+
+        data = response.json()
+        if data.get("result") != "success":
+            raise ApiRequestError(f"Open ER-API: {data}")
+
+        rates = {}
+        conversion_rates = data.get("rates", {})
+        for code in codes:
+            usd_to_code = conversion_rates.get(code)
+            if not usd_to_code:
+                continue
+
+            rates[f"{code}_{base}"] = {
+                "rate": 1 / usd_to_code,
+                "meta": {
+                    "raw_rate": usd_to_code,
+                    "request_ms": response.elapsed.total_seconds() * 1000,
+                    "status_code": response.status_code,
+                    "time_last_update_utc": data.get("time_last_update_utc", ""),
+                },
+            }
+
+        return rates
@@ -0,0 +1,162 @@
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from datetime import datetime
+from itertools import islice
+
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.storage import Storage
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+CHUNK_LINES = 50000
+
+
+def _normalize_timestamp(value) -> str:
+    """
+    Ф-ция приводит timestamp (ISO-строка или epoch) к формату истории YYYY-MM-DDTHH:MM:SS
+    """
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.replace(".", "", 1).isdigit()):
+        return datetime.fromtimestamp(float(value)).isoformat(timespec="seconds")
+    parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        # как и epoch, время со смещением переводится в местное
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat(timespec="seconds")
+
+
+def _to_record(row: dict, default_source: str) -> dict:
+    if row.get("pair"):
+        from_cur, _, to_cur = str(row["pair"]).partition("_")
+    else:
+        from_cur, to_cur = row.get("from_currency"), row.get("to_currency")
+
+    from_cur = str(from_cur).strip().upper()
+    to_cur = str(to_cur).strip().upper()
+    rate = float(row["rate"])
+    if not from_cur or not to_cur or rate <= 0:
+        raise ValueError("bad row")
+
+    timestamp = _normalize_timestamp(row["timestamp"])
+    return {
+        "id": f"{from_cur}_{to_cur}_{timestamp}",
+        "from_currency": from_cur,
+        "to_currency": to_cur,
+        "rate": rate,
+        "timestamp": timestamp,
+        "source": row.get("source") or default_source,
+        "meta": {"backfill": True},
+    }
+
+
+def parse_chunk(lines: list[str], fmt: str, header: list[str] | None, default_source: str) -> tuple[list[dict], int]:
+    """
+    Ф-ция разбирает кусок входного файла (выполняется в процессе пула).
+    Возвращает записи, отсортированные по (timestamp, id), и число отброшенных строк
+    """
+    if fmt == "csv":
+        rows = csv.DictReader(lines, fieldnames=header)
+    else:
+        rows = (json.loads(line) for line in lines if line.strip())
+
+    records = []
+    bad = 0
+    for row in rows:
+        try:
+            records.append(_to_record(row, default_source))
+        except (KeyError, TypeError, ValueError):
+            bad += 1
+
+    records.sort(key=lambda r: (r["timestamp"], r["id"]))
+    return records, bad
+
+
+def _read_chunks(path: str, fmt: str):
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        header = next(csv.reader([f.readline()])) if fmt == "csv" else None
+        while True:
+            lines = list(islice(f, CHUNK_LINES))
+            if not lines:
+                return
+            yield lines, header
+
+
+class HistoryBackfill:
+    """
+    Импорт исторических курсов из больших CSV/JSONL-дампов:
+    куски файла разбираются в пуле процессов (в работе не больше 2 * workers кусков),
+    каждый разобранный кусок сразу записывается в историю, поэтому память не зависит
+    от размера файла. Дубликаты по id (FROM_TO_timestamp) отбрасываются: внутри куска -
+    после сортировки, с уже записанным (в том числе прошлыми кусками) - по истории в его интервале
+    """
+
+    def __init__(self, config: ParserConfig, workers: int | None = None) -> None:
+        self.storage = Storage(config)
+        self.workers = workers or os.cpu_count() or 1
+
+    def run(self, path: str, source: str = "backfill") -> dict:
+        fmt = "csv" if path.lower().endswith(".csv") else "jsonl"
+        started = time.perf_counter()
+        parsed = imported = bad = 0
+
+        def write(future):
+            nonlocal parsed, imported, bad
+            records, chunk_bad = future.result()
+            parsed += len(records)
+            imported += self._write_chunk(records)
+            bad += chunk_bad
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = set()
+            for lines, header in _read_chunks(path, fmt):
+                pending.add(pool.submit(parse_chunk, lines, fmt, header, source))
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        write(future)
+            for future in as_completed(pending):
+                write(future)
+
+        seconds = time.perf_counter() - started
+        if not parsed:
+            return {"parsed": 0, "imported": 0, "duplicates": 0, "rejected": bad, "seconds": seconds}
+
+        result = {
+            "parsed": parsed,
+            "imported": imported,
+            "duplicates": parsed - imported,
+            "rejected": bad,
+            "seconds": seconds,
+            "records_per_second": parsed / seconds if seconds else 0.0,
+        }
+        logger.info(f"Backfill from {path}: {result}")
+        return result
+
+    def _write_chunk(self, records: list[dict]) -> int:
+        """
+        Ф-ция дописывает в историю новые записи разобранного куска и возвращает их число
+        """
+        if not records:
+            return 0
+        known_ids = self._known_ids(records[0]["timestamp"], records[-1]["timestamp"])
+
+        fresh = []
+        last_id = None
+        for record in records:
+            if record["id"] == last_id or record["id"] in known_ids:
+                continue
+            last_id = record["id"]
+            fresh.append(record)
+
+        if fresh:
+            self.storage.append_history(fresh)
+        return len(fresh)
+
+    def _known_ids(self, since: str, until: str) -> set:
+        """
+        Ф-ция собирает id уже сохранённых записей только в пределах интервала импорта
+        """
+        return {r["id"] for r in self.storage.iter_history(since=since, until=until)}
@@ -0,0 +1,155 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from valutatrade_hub.core.exceptions import CircuitOpenError
+from valutatrade_hub.parser_service.api_clients import BaseApiClient
+from valutatrade_hub.parser_service.config import ParserConfig
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class BreakerStateStore:
+    """
+    Состояния всех автоматов в одном JSON-файле каталога данных.
+    Файл перечитывается только при изменении, поэтому разные процессы видят общее состояние
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._states: dict[str, dict] = {}
+
+    def _refresh(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            loaded = {}
+        self._stamp = stamp
+        self._states = loaded if isinstance(loaded, dict) else {}
+
+    def get(self, name: str) -> dict:
+        with self._lock:
+            self._refresh()
+            return dict(self._states.get(name) or {"state": CLOSED, "outcomes": []})
+
+    def put(self, name: str, state: dict) -> None:
+        with self._lock:
+            self._refresh()
+            self._states[name] = state
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._states, f, indent=2)
+                os.replace(tmp_path, self.path)
+                st = os.stat(self.path)
+                self._stamp = (st.st_mtime_ns, st.st_size)
+            except OSError as e:
+                logger.warning(f"Failed to persist circuit breaker state: {e}")
+
+
+class CircuitBreaker:
+    """
+    Автомат closed → open → half_open → closed.
+    В состоянии open вызовы отклоняются сразу, по истечении cooldown один процесс
+    получает право на пробный запрос: успех замыкает автомат, ошибка снова размыкает
+    """
+
+    def __init__(self, name: str, store: BreakerStateStore, config: ParserConfig) -> None:
+        self.name = name
+        self.store = store
+        self.failure_rate = config.BREAKER_FAILURE_RATE
+        self.min_calls = config.BREAKER_MIN_CALLS
+        self.window = config.BREAKER_WINDOW
+        self.cooldown = config.BREAKER_COOLDOWN
+        self.probe_timeout = config.REQUEST_TIMEOUT
+
+    @property
+    def state(self) -> str:
+        return self.store.get(self.name)["state"]
+
+    def before_call(self) -> None:
+        """
+        Ф-ция пропускает вызов или бросает CircuitOpenError
+        """
+        data = self.store.get(self.name)
+        if data["state"] == CLOSED:
+            return
+
+        now = time.time()
+        if data["state"] == OPEN:
+            retry_at = data["opened_at"] + self.cooldown
+            if now < retry_at:
+                raise CircuitOpenError(self.name, retry_at - now)
+        elif now < data.get("probe_until", 0):
+            # пробный запрос уже выполняет другой вызов
+            raise CircuitOpenError(self.name, data["probe_until"] - now)
+
+        data.update(state=HALF_OPEN, probe_until=now + self.probe_timeout)
+        self.store.put(self.name, data)
+        logger.info(f"Circuit {self.name}: half-open, probing")
+
+    def record_success(self) -> None:
+        data = self.store.get(self.name)
+        if data["state"] != CLOSED:
+            logger.info(f"Circuit {self.name}: closed")
+            self.store.put(self.name, {"state": CLOSED, "outcomes": []})
+            return
+
+        outcomes = (data["outcomes"] + [1])[-self.window:]
+        if outcomes != data["outcomes"]:
+            self.store.put(self.name, dict(data, outcomes=outcomes))
+
+    def record_failure(self) -> None:
+        data = self.store.get(self.name)
+        now = time.time()
+
+        if data["state"] == HALF_OPEN:
+            logger.warning(f"Circuit {self.name}: probe failed, open again")
+            self.store.put(self.name, {"state": OPEN, "opened_at": now, "outcomes": []})
+            return
+
+        outcomes = (data["outcomes"] + [0])[-self.window:]
+        failures = outcomes.count(0)
+        if len(outcomes) >= self.min_calls and failures / len(outcomes) >= self.failure_rate:
+            logger.warning(f"Circuit {self.name}: open ({failures}/{len(outcomes)} failures)")
+            self.store.put(self.name, {"state": OPEN, "opened_at": now, "outcomes": []})
+        else:
+            self.store.put(self.name, dict(data, outcomes=outcomes))
+
+
+class BreakerClient(BaseApiClient):
+    """
+    Обёртка над клиентом API, пропускающая вызовы через CircuitBreaker
+    """
+
+    def __init__(self, client: BaseApiClient, breaker: CircuitBreaker) -> None:
+        super().__init__()
+        self.client = client
+        self.breaker = breaker
+
+    def fetch_rates(self, codes=None) -> dict:
+        self.breaker.before_call()
+        try:
+            rates = self.client.fetch_rates(codes)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return rates
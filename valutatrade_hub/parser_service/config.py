@@ -12,6 +12,8 @@ class ParserConfig:
 
     COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
     EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
+    CRYPTOCOMPARE_URL: str = "https://min-api.cryptocompare.com/data/pricemulti"
+    OPEN_ER_API_URL: str = "https://open.er-api.com/v6/latest"
 
     BASE_CURRENCY: str = "USD"
     FIAT_CURRENCIES: tuple = ("EUR", "GBP", "RUB")
@@ -26,5 +28,80 @@ class ParserConfig:
 
     RATES_FILE_PATH: str = "data/rates.json"
     HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    OHLC_FILE_PATH: str = "data/rates_ohlc.json"
+    # время последней проверки курсов: обновляется, даже если ни один курс не изменился,
+    # чтобы не переписывать ради свежести весь RATES_FILE_PATH
+    RATES_FRESHNESS_PATH: str = "data/rates_freshness.json"
+    # относительное изменение курса, меньше которого пара считается неизменной
+    RATE_CHANGE_EPSILON: float = 1e-9
+    # табло текущих курсов в разделяемой памяти (создаёт планировщик);
+    # без табло процессы читают RATES_FILE_PATH и пробуют подключиться снова раз в RATE_BOARD_RETRY_SECONDS
+    RATE_BOARD_NAME: str = "valutatrade_rates"
+    RATE_BOARD_RETRY_SECONDS: float = 30.0
+    # seqlock табло рассчитан на одного писателя: публикации процессов идут по очереди под этим замком
+    RATE_BOARD_LOCK_PATH: str = "data/rate_board.lock"
+
+    # выборка по спросу: запрашиваются только валюты из портфелей, активных алертов и ордеров
+    # и недавних запросов пользователей (не старше QUERY_DEMAND_TTL секунд), каждая - когда
+    # её последняя проверка старше целевой свежести источника спроса (в секундах)
+    RATE_QUERIES_PATH: str = "data/rate_queries.json"
+    QUERY_DEMAND_TTL: int = 24 * 3600
+    DEMAND_FRESHNESS: dict = field(
+        default_factory=lambda: {"orders": 60, "alerts": 60, "holdings": 300, "queries": 300}
+    )
+    # сколько валют запрашивать у источника за один HTTP-запрос
+    FETCH_BATCH_SIZE: int = 50
+
+    # одновременные автоматические обновления координируются файлом-замком: в источники идёт
+    # один процесс, остальные ждут его не дольше RATE_REFRESH_WAIT секунд и читают результат
+    RATE_REFRESH_LOCK_PATH: str = "data/rates_refresh.lock"
+    RATE_REFRESH_WAIT: float = 30.0
+
+    # фильтр аномальных тиков (см. parser_service.anomaly): отклонённые тики не публикуются,
+    # а пишутся в QUARANTINE_PATH; состояние фильтра хранится между запусками
+    ANOMALY_STATE_PATH: str = "data/anomaly_state.json"
+    QUARANTINE_PATH: str = "data/quarantine.jsonl"
+    ANOMALY_MAX_JUMP: float = 0.5
+    ANOMALY_Z: float = 8.0
+    ANOMALY_MIN_MOVE: float = 0.05
+    ANOMALY_WARMUP: int = 20
+    ANOMALY_EWMA_ALPHA: float = 0.05
+    ANOMALY_CONFIRM: int = 3
+    ANOMALY_CONFIRM_BAND: float = 0.01
+
+    # тики старше HISTORY_HOT_DAYS запечатываются в сжатые сегменты (gzip или lzma),
+    # сегменты старше HISTORY_RETENTION_DAYS удаляются (0 - хранить всё),
+    # свечи по ним остаются в OHLC_FILE_PATH
+    HISTORY_SEGMENTS_DIR: str = "data/history"
+    HISTORY_HOT_DAYS: int = 3
+    HISTORY_COMPRESSION: str = "gzip"
+    HISTORY_RETENTION_DAYS: int = 0
+    OHLC_RESOLUTIONS: dict = field(
+        default_factory=lambda: {"1m": 60, "1h": 3600, "1d": 86400}
+    )
+    # сколько дней хранить свечи каждого разрешения (None - без ограничения)
+    OHLC_RETENTION_DAYS: dict = field(
+        default_factory=lambda: {"1m": 7, "1h": 365, "1d": None}
+    )
 
     REQUEST_TIMEOUT: int = 10
+
+    # режим опроса резервных источников одного класса активов:
+    # single - только основной, hedge - резервный запрос после задержки p95,
+    # quorum - опрос всех и медиана с отбрасыванием выбросов
+    FETCH_MODE: str = "hedge"
+    HEDGE_PERCENTILE: float = 0.95
+    HEDGE_MIN_DELAY: float = 0.2
+    HEDGE_DEFAULT_DELAY: float = 1.0
+    QUORUM_MAX_DEVIATION: float = 0.02
+    LATENCY_STATS_PATH: str = "data/provider_latency.json"
+    LATENCY_WINDOW: int = 200
+
+    # circuit breaker вокруг каждого источника: размыкается, когда среди последних
+    # BREAKER_WINDOW вызовов (не меньше BREAKER_MIN_CALLS) доля ошибок >= BREAKER_FAILURE_RATE,
+    # через BREAKER_COOLDOWN секунд пропускает один пробный запрос
+    BREAKER_STATE_PATH: str = "data/circuit_breakers.json"
+    BREAKER_FAILURE_RATE: float = 0.5
+    BREAKER_MIN_CALLS: int = 3
+    BREAKER_WINDOW: int = 10
+    BREAKER_COOLDOWN: int = 60
@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+@dataclass(frozen=True)
+class RateTick:
+    """
+    Событие изменения курса пары
+    """
+    pair: str
+    from_currency: str
+    to_currency: str
+    rate: float
+    prev_rate: float | None
+    timestamp: str
+    source: str
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Subscription:
+    """
+    Ограниченная очередь событий одного подписчика.
+    При переполнении применяется политика:
+    drop_oldest - вытесняется самое старое событие,
+    drop_newest - новое событие отбрасывается,
+    block - издатель ждёт освобождения места не дольше block_timeout, затем отбрасывает событие
+    """
+
+    def __init__(self, bus, maxsize: int, policy: str, block_timeout: float, loop=None, pairs=None) -> None:
+        if policy not in POLICIES:
+            raise ValueError(f"unknown policy: {policy}")
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+
+        self._bus = bus
+        self.maxsize = maxsize
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.pairs = set(pairs) if pairs else None
+        self.dropped = 0
+        self.closed = False
+
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._loop = loop
+        self._ready = asyncio.Event() if loop is not None else None
+
+    def _offer(self, event: RateTick) -> None:
+        if self.pairs is not None and event.pair not in self.pairs:
+            return
+
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_OLDEST:
+                    self._items.popleft()
+                    self.dropped += 1
+                elif self.policy == DROP_NEWEST:
+                    self.dropped += 1
+                    return
+                else:
+                    deadline = time.monotonic() + self.block_timeout
+                    while len(self._items) >= self.maxsize and not self.closed:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            break
+                    if len(self._items) >= self.maxsize:
+                        self.dropped += 1
+                        return
+
+            self._items.append(event)
+            self._cond.notify_all()
+
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._ready.set)
+            except RuntimeError:
+                # цикл событий уже закрыт - подписчик больше не читает
+                self.close()
+
+    def _pop(self):
+        with self._cond:
+            if not self._items:
+                return None
+            event = self._items.popleft()
+            self._cond.notify_all()
+            return event
+
+    def get(self, timeout: float | None = None) -> RateTick | None:
+        """
+        Ф-ция блокирующе забирает следующее событие (None по таймауту или после close)
+        """
+        with self._cond:
+            if not self._items and not self.closed:
+                self._cond.wait(timeout)
+        return self._pop()
+
+    async def next(self, timeout: float | None = None) -> RateTick | None:
+        """
+        Ф-ция асинхронно ждёт следующее событие (для подписок, созданных с loop)
+        """
+        event = self._pop()
+        if event is not None or self.closed:
+            return event
+
+        self._ready.clear()
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return self._pop()
+
+    def close(self) -> None:
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._bus.unsubscribe(self)
+
+
+class RateEventBus:
+    """
+    Внутрипроцессная шина событий курсов.
+    Слушатели вызываются синхронно со списком событий одного обновления,
+    подписчики получают события через собственные ограниченные очереди
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._subscriptions: list[Subscription] = []
+        self._listeners: dict[str, object] = {}
+
+    def subscribe(self, maxsize: int = 1000, policy: str = DROP_OLDEST, block_timeout: float = 0.5,
+                  loop=None, pairs=None) -> Subscription:
+        subscription = Subscription(self, maxsize, policy, block_timeout, loop=loop, pairs=pairs)
+        with self._lock:
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+    def add_listener(self, name: str, callback) -> None:
+        """
+        Ф-ция регистрирует слушателя под именем (повторная регистрация заменяет прежнего)
+        """
+        with self._lock:
+            self._listeners[name] = callback
+
+    def remove_listener(self, name: str) -> None:
+        with self._lock:
+            self._listeners.pop(name, None)
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, events: list[RateTick]) -> None:
+        if not events:
+            return
+
+        with self._lock:
+            listeners = list(self._listeners.items())
+            subscriptions = list(self._subscriptions)
+
+        for name, callback in listeners:
+            try:
+                callback(events)
+            except Exception as e:
+                logger.error(f"Rate listener {name} failed: {e}")
+
+        for subscription in subscriptions:
+            for event in events:
+                subscription._offer(event)
+
+
+rate_bus = RateEventBus()
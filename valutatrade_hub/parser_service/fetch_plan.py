@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+
+from valutatrade_hub.parser_service.config import ParserConfig
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+QUERIES = "queries"
+
+
+class DemandRegistry:
+    """
+    Источники спроса на курсы: имя -> ф-ция, возвращающая коды нужных валют.
+    Имя источника задаёт целевую свежесть его пар (ParserConfig.DEMAND_FRESHNESS).
+    Ядро регистрирует источники при старте (core.listeners), сам парсер о портфелях,
+    алертах и ордерах не знает
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._sources: dict = {}
+
+    def add_source(self, name: str, source) -> None:
+        with self._lock:
+            self._sources[name] = source
+
+    def remove_source(self, name: str) -> None:
+        with self._lock:
+            self._sources.pop(name, None)
+
+    def collect(self) -> dict[str, set]:
+        """
+        Ф-ция опрашивает источники; упавший источник пропускается
+        """
+        with self._lock:
+            sources = dict(self._sources)
+
+        demand = {}
+        for name, source in sources.items():
+            try:
+                demand[name] = {code.upper() for code in source() if code}
+            except Exception as e:
+                logger.warning(f"Demand source {name} failed: {e}")
+        return demand
+
+
+demand_registry = DemandRegistry()
+
+
+def record_queries(config: ParserConfig, codes) -> None:
+    """
+    Ф-ция отмечает запрошенные пользователем валюты (get-rate, show-rates).
+    Повторная отметка той же валюты чаще раза в минуту файл не переписывает
+    """
+    now = time.time()
+    queries = load_queries(config)
+    fresh = {code.upper() for code in codes if code} - {config.BASE_CURRENCY}
+    if all(now - queries.get(code, 0) < 60 for code in fresh):
+        return
+
+    ttl = config.QUERY_DEMAND_TTL
+    queries = {code: ts for code, ts in queries.items() if now - ts <= ttl}
+    queries.update({code: now for code in fresh})
+
+    tmp_path = config.RATE_QUERIES_PATH + f".{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(config.RATE_QUERIES_PATH) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(queries, f, separators=(",", ":"))
+        os.replace(tmp_path, config.RATE_QUERIES_PATH)
+    except OSError as e:
+        logger.warning(f"Failed to record rate queries: {e}")
+
+
+def load_queries(config: ParserConfig) -> dict[str, float]:
+    try:
+        with open(config.RATE_QUERIES_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _epoch(timestamp: str | None) -> float:
+    if not timestamp:
+        return 0.0
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class FetchPlanner:
+    """
+    Планировщик выборки: собирает нужные валюты из источников спроса и недавних запросов,
+    каждой назначает целевую свежесть (минимум по источникам, которым она нужна)
+    и оставляет к выборке только те, чья последняя проверка старше цели
+    """
+
+    def __init__(self, config: ParserConfig, registry: DemandRegistry | None = None) -> None:
+        self.config = config
+        self.registry = registry or demand_registry
+
+    def targets(self) -> dict[str, float]:
+        """
+        Ф-ция возвращает {код валюты: целевая свежесть в секундах} для всех нужных валют
+        """
+        demand = self.registry.collect()
+
+        now = time.time()
+        ttl = self.config.QUERY_DEMAND_TTL
+        queried = {code for code, ts in load_queries(self.config).items() if now - ts <= ttl}
+        demand[QUERIES] = demand.get(QUERIES, set()) | queried
+
+        default = max(self.config.DEMAND_FRESHNESS.values())
+        targets = {}
+        for name, codes in demand.items():
+            target = self.config.DEMAND_FRESHNESS.get(name, default)
+            for code in codes - {self.config.BASE_CURRENCY}:
+                targets[code] = min(target, targets.get(code, target))
+        return targets
+
+    def plan(self, checked: dict[str, str]) -> set[str]:
+        """
+        Ф-ция возвращает коды валют, которые пора запросить.
+        checked - время последней проверки каждой пары (см. Storage.load_pair_checks)
+        """
+        now = time.time()
+        base = self.config.BASE_CURRENCY
+        due = {
+            code for code, target in self.targets().items()
+            if now - _epoch(checked.get(f"{code}_{base}")) >= target
+        }
+        logger.info(f"Fetch plan: {len(due)} currencies due: {', '.join(sorted(due)) or '-'}")
+        return due
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from valutatrade_hub.core.exceptions import ApiRequestError
+from valutatrade_hub.parser_service.config import ParserConfig
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+SINGLE = "single"
+HEDGE = "hedge"
+QUORUM = "quorum"
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек каждого источника (в секундах).
+    Окно сохраняется в файл, чтобы задержка хеджирования подстраивалась и между запусками CLI
+    """
+
+    def __init__(self, path: str, window: int = 200) -> None:
+        self.path = path
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples: dict[str, deque] = {}
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                loaded = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            loaded = {}
+        for name, samples in loaded.items():
+            self._samples[name] = deque(samples, maxlen=window)
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(name, deque(maxlen=self.window)).append(round(seconds, 4))
+
+    def percentile(self, name: str, q: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(name, ()))
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def save(self) -> None:
+        with self._lock:
+            data = {name: list(samples) for name, samples in self._samples.items()}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+
+class HedgedFetcher:
+    """
+    Опрос нескольких взаимозаменяемых источников одного класса активов.
+    hedge: первым идёт самый быстрый по p95 источник, если он не ответил за свою p95-задержку
+    (или упал), запускается следующий; берётся первый валидный ответ, остальные отменяются.
+    quorum: опрашиваются все, по каждой паре берётся медиана, значения дальше
+    QUORUM_MAX_DEVIATION от медианы отбрасываются как выбросы
+    """
+
+    def __init__(self, clients: dict, config: ParserConfig, tracker: LatencyTracker, codes=None) -> None:
+        self.clients = clients
+        self.config = config
+        self.tracker = tracker
+        self.codes = codes
+
+    def _timed_fetch(self, name: str) -> dict:
+        """
+        Ф-ция опрашивает источник и записывает задержку. Сбой (в том числе мгновенный отказ
+        разомкнутого breaker'а или пустой ответ) записывается штрафом REQUEST_TIMEOUT, чтобы
+        неработающий источник не оказался первым по p95
+        """
+        started = time.perf_counter()
+        try:
+            rates = self.clients[name].fetch_rates(self.codes)
+            if not rates:
+                raise ApiRequestError(f"{name}: пустой ответ")
+        except Exception:
+            self.tracker.record(name, max(time.perf_counter() - started, self.config.REQUEST_TIMEOUT))
+            raise
+        self.tracker.record(name, time.perf_counter() - started)
+        return rates
+
+    def _ordered(self) -> list[str]:
+        default = self.config.HEDGE_DEFAULT_DELAY
+        return sorted(
+            self.clients,
+            key=lambda name: self.tracker.percentile(name, self.config.HEDGE_PERCENTILE) or default,
+        )
+
+    def _hedge_delay(self, name: str) -> float:
+        p = self.tracker.percentile(name, self.config.HEDGE_PERCENTILE)
+        delay = p if p is not None else self.config.HEDGE_DEFAULT_DELAY
+        return min(max(delay, self.config.HEDGE_MIN_DELAY), self.config.REQUEST_TIMEOUT)
+
+    def fetch(self, mode: str | None = None) -> tuple[str, dict]:
+        """
+        Ф-ция возвращает (имя источника, курсы) согласно режиму
+        """
+        mode = mode or self.config.FETCH_MODE
+        order = self._ordered()
+
+        if mode == SINGLE or len(order) == 1:
+            name = order[0] if mode != SINGLE else next(iter(self.clients))
+            return name, self._timed_fetch(name)
+        if mode == QUORUM:
+            return self._fetch_quorum(order)
+        return self._fetch_hedged(order)
+
+    def _fetch_hedged(self, order: list[str]) -> tuple[str, dict]:
+        executor = ThreadPoolExecutor(max_workers=len(order))
+        pending = {}
+        errors = []
+        queue = list(order)
+
+        try:
+            name = queue.pop(0)
+            pending[executor.submit(self._timed_fetch, name)] = name
+            delay = self._hedge_delay(name)
+
+            while pending:
+                done, _ = wait(pending, timeout=delay if queue else None, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    name = pending.pop(future)
+                    try:
+                        return name, future.result()
+                    except Exception as e:
+                        errors.append(f"{name}: {e}")
+
+                # основной не успел за свою p95 или упал - подключаем следующий источник
+                if queue and (not done or not pending):
+                    name = queue.pop(0)
+                    logger.info(f"Hedging: starting {name}")
+                    pending[executor.submit(self._timed_fetch, name)] = name
+                    delay = self._hedge_delay(name)
+
+            raise ApiRequestError("; ".join(errors))
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _fetch_quorum(self, order: list[str]) -> tuple[str, dict]:
+        answers = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=len(order)) as executor:
+            futures = {executor.submit(self._timed_fetch, name): name for name in order}
+            for future, name in futures.items():
+                try:
+                    answers[name] = future.result()
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+
+        if not answers:
+            raise ApiRequestError("; ".join(errors))
+        if len(answers) == 1:
+            logger.warning(f"Quorum degraded to a single source: {', '.join(errors)}")
+
+        rates = {}
+        max_dev = self.config.QUORUM_MAX_DEVIATION
+        for pair in sorted({p for answer in answers.values() for p in answer}):
+            values = {name: answer[pair]["rate"] for name, answer in answers.items() if pair in answer}
+            median = statistics.median(values.values())
+            accepted = {n: v for n, v in values.items() if median and abs(v - median) / median <= max_dev}
+            rejected = sorted(set(values) - set(accepted))
+            if rejected:
+                logger.warning(f"Quorum rejected outliers for {pair}: {', '.join(rejected)}")
+            if not accepted:
+                continue
+
+            rates[pair] = {
+                "rate": statistics.median(accepted.values()),
+                "meta": {"providers": sorted(accepted), "rejected": rejected},
+            }
+
+        return "quorum:" + "+".join(sorted(answers)), rates
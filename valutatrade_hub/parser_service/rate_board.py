@@ -0,0 +1,197 @@
+import logging
+import math
+import struct
+import time
+import zlib
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.refresh_lock import RefreshLock
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+MAGIC = 0x56545242  # "VTRB"
+# magic, хеш раскладки пар, счётчик версии (seqlock), время обновления (epoch)
+HEADER = struct.Struct("<IIQd")
+READ_ATTEMPTS = 100
+PUBLISH_LOCK_TIMEOUT = 5.0
+
+
+def board_pairs(config: ParserConfig) -> list[str]:
+    """
+    Ф-ция задаёт фиксированную раскладку пар табло: одинакова во всех процессах с одним конфигом
+    """
+    codes = sorted(set(config.CRYPTO_CURRENCIES) | set(config.FIAT_CURRENCIES))
+    return [f"{code}_{config.BASE_CURRENCY}" for code in codes]
+
+
+def _layout_hash(pairs: list[str]) -> int:
+    return zlib.crc32(",".join(pairs).encode("ascii"))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Ф-ция подключается к существующему сегменту, не отдавая его resource_tracker'у:
+    иначе сегмент удалялся бы при выходе любого читающего процесса
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13: параметра track нет
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+class RateBoard:
+    """
+    Табло текущих курсов в разделяемой памяти: заголовок HEADER и вектор float64 по
+    раскладке board_pairs (NaN - курса нет). Сегмент создаёт планировщик, пишет в него
+    процесс, выполнивший обновление курсов. Согласованность чтения обеспечивает seqlock:
+    на время записи счётчик версии нечётный, читатель повторяет чтение, если видел
+    нечётный счётчик или счётчик изменился за время чтения
+    """
+
+    def __init__(self, config: ParserConfig, shm: shared_memory.SharedMemory, owner: bool = False) -> None:
+        self.pairs = board_pairs(config)
+        self.layout = _layout_hash(self.pairs)
+        self.slots = struct.Struct(f"<{len(self.pairs)}d")
+        self.shm = shm
+        self.owner = owner
+
+    @classmethod
+    def create(cls, config: ParserConfig) -> "RateBoard":
+        """
+        Ф-ция создаёт (или переиспользует оставшийся) сегмент табло
+        """
+        size = HEADER.size + 8 * len(board_pairs(config))
+        try:
+            shm = shared_memory.SharedMemory(name=config.RATE_BOARD_NAME, create=True, size=size)
+        except FileExistsError:
+            shm = shared_memory.SharedMemory(name=config.RATE_BOARD_NAME)
+            if shm.size < size:
+                shm.close()
+                shm.unlink()
+                shm = shared_memory.SharedMemory(name=config.RATE_BOARD_NAME, create=True, size=size)
+
+        board = cls(config, shm, owner=True)
+        HEADER.pack_into(shm.buf, 0, MAGIC, board.layout, 0, 0.0)
+        board.slots.pack_into(shm.buf, HEADER.size, *([math.nan] * len(board.pairs)))
+        return board
+
+    @classmethod
+    def attach(cls, config: ParserConfig) -> "RateBoard | None":
+        try:
+            shm = _attach(config.RATE_BOARD_NAME)
+        except (FileNotFoundError, OSError):
+            return None
+        board = cls(config, shm)
+        magic, layout, _, _ = HEADER.unpack_from(shm.buf, 0)
+        if magic != MAGIC or layout != board.layout or shm.size < HEADER.size + board.slots.size:
+            # табло другого конфига - не читаем
+            board.close()
+            return None
+        return board
+
+    def publish(self, pairs: dict, refreshed_at: datetime) -> None:
+        """
+        Ф-ция записывает вектор курсов (pairs в формате rates.json) под seqlock.
+        Снимок старше уже опубликованного не записывается
+        """
+        values = [float(pairs.get(p, {}).get("rate") or math.nan) for p in self.pairs]
+        buf = self.shm.buf
+        _, _, seq, published_at = HEADER.unpack_from(buf, 0)
+        if seq and refreshed_at.timestamp() < published_at:
+            return
+        HEADER.pack_into(buf, 0, MAGIC, self.layout, seq + 1, refreshed_at.timestamp())
+        self.slots.pack_into(buf, HEADER.size, *values)
+        HEADER.pack_into(buf, 0, MAGIC, self.layout, seq + 2, refreshed_at.timestamp())
+
+    def read(self) -> tuple[dict[str, float], float] | None:
+        """
+        Ф-ция возвращает согласованный снимок ({пара: курс}, время обновления) или None
+        """
+        buf = self.shm.buf
+        for _ in range(READ_ATTEMPTS):
+            _, _, seq, refreshed_at = HEADER.unpack_from(buf, 0)
+            if seq % 2:
+                continue
+            values = self.slots.unpack_from(buf, HEADER.size)
+            _, _, seq_after, refreshed_after = HEADER.unpack_from(buf, 0)
+            if seq != seq_after:
+                continue
+            if seq == 0:
+                return None  # табло ещё не заполнено
+            rates = {p: v for p, v in zip(self.pairs, values) if not math.isnan(v)}
+            return rates, refreshed_after
+        return None
+
+    def close(self, unlink: bool = False) -> None:
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+_board: RateBoard | None = None
+_next_attach = 0.0
+
+
+def read_rate_board(config: ParserConfig) -> tuple[dict[str, float], float] | None:
+    """
+    Ф-ция читает табло курсов текущего хоста. Сегмент подключается один раз на процесс,
+    неудачная попытка повторяется не чаще раза в RATE_BOARD_RETRY_SECONDS
+    """
+    global _board, _next_attach
+    if _board is None:
+        now = time.monotonic()
+        if now < _next_attach:
+            return None
+        _board = RateBoard.attach(config)
+        if _board is None:
+            _next_attach = now + config.RATE_BOARD_RETRY_SECONDS
+            return None
+    return _board.read()
+
+
+def create_rate_board(config: ParserConfig) -> RateBoard:
+    """
+    Ф-ция создаёт табло курсов для процесса-владельца (планировщика)
+    """
+    global _board
+    if _board is not None:
+        _board.close()
+    _board = RateBoard.create(config)
+    return _board
+
+
+def close_rate_board() -> None:
+    global _board
+    if _board is not None:
+        _board.close(unlink=_board.owner)
+        _board = None
+
+
+def publish_rate_board(config: ParserConfig, pairs: dict, refreshed_at: datetime) -> bool:
+    """
+    Ф-ция обновляет табло, если его создал планировщик (сегмент существует).
+    Писать могут несколько процессов (планировщик, update-rates, обновление по спросу),
+    поэтому запись идёт под межпроцессным замком: seqlock допускает только одного писателя
+    """
+    global _board
+    if _board is None:
+        _board = RateBoard.attach(config)
+        if _board is None:
+            return False
+
+    lock = RefreshLock(config.RATE_BOARD_LOCK_PATH)
+    if not lock.acquire(timeout=PUBLISH_LOCK_TIMEOUT):
+        logger.warning(f"Rate board is locked for more than {PUBLISH_LOCK_TIMEOUT}s, skipping publish")
+        return False
+    try:
+        _board.publish(pairs, refreshed_at)
+    finally:
+        lock.release()
+    return True
@@ -0,0 +1,77 @@
+import logging
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировка через эксклюзивное создание файла
+    fcntl = None
+
+logger = logging.getLogger("ValutaTrade.Parser")
+
+POLL_SECONDS = 0.05
+# файл-замок без fcntl, оставшийся от упавшего процесса, считается брошенным через столько секунд
+STALE_LOCK_SECONDS = 120
+
+
+class RefreshLock:
+    """
+    Межпроцессная рекомендательная блокировка на файле.
+    С fcntl - flock на открытом файле (снимается ядром при смерти процесса),
+    без него - файл, созданный с O_EXCL, брошенный файл удаляется по возрасту
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._fd = None
+
+    def _try_acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if fcntl is not None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+            self._fd = fd
+            return True
+
+        try:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(self.path) > STALE_LOCK_SECONDS:
+                    logger.warning(f"Removing stale lock {self.path}")
+                    os.remove(self.path)
+            except OSError:
+                pass
+            return False
+        os.write(fd, str(os.getpid()).encode("ascii"))
+        self._fd = fd
+        return True
+
+    def acquire(self, timeout: float = 0.0) -> bool:
+        """
+        Ф-ция берёт блокировку, ожидая не дольше timeout секунд
+        """
+        deadline = time.monotonic() + timeout
+        while not self._try_acquire():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_SECONDS)
+        return True
+
+    def release(self) -> None:
+        if self._fd is None:
+            return
+        if fcntl is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        else:
+            os.close(self._fd)
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self._fd = None
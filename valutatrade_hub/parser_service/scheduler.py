@@ -1,7 +1,9 @@
 import logging
 import time
 
+from valutatrade_hub.core.listeners import install_demand_sources, install_rate_listeners
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.rate_board import close_rate_board, create_rate_board
 from valutatrade_hub.parser_service.updater import RatesUpdater
 
 logger = logging.getLogger("ValutaTrade")
@@ -9,17 +11,22 @@ logger = logging.getLogger("ValutaTrade")
 
 class RateScheduler:
     def __init__(self, config: ParserConfig, interval_seconds: int = 3600):
+        self.config = config
         self.updater = RatesUpdater(config)
         self.interval = interval_seconds
+        install_rate_listeners()
+        install_demand_sources()
 
     def start(self):
         logger.info(f"Starting scheduler with interval {self.interval} seconds")
+        create_rate_board(self.config)
         while True:
             try:
-                self.updater.run_update(None)
+                self.updater.refresh_single_flight()
                 time.sleep(self.interval)
             except KeyboardInterrupt:
                 logger.info("Scheduler stopped")
+                close_rate_board()
                 break
             except Exception as e:
                 logger.error(f"Scheduler error: {e}")
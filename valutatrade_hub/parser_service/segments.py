@@ -0,0 +1,257 @@
+import gzip
+import heapq
+import itertools
+import json
+import lzma
+import os
+
+# строк в одном сегменте: день больше этого делится на несколько файлов
+SEGMENT_MAX_ROWS = 200000
+# сколько сегментов может перекрываться по времени (и читаться одновременно), прежде чем
+# холодная история будет переписана в сегменты по дням
+MAX_OPEN_SEGMENTS = 16
+
+SEGMENT_FIELDS = ["from_currency", "to_currency", "rate", "timestamp", "source"]
+
+OPENERS = {
+    "gzip": (gzip.open, ".jsonl.gz"),
+    "lzma": (lzma.open, ".jsonl.xz"),
+}
+
+
+class SegmentStore:
+    """
+    Холодная история курсов: запечатанные сжатые сегменты JSON Lines.
+    Строка сегмента - компактный массив полей SEGMENT_FIELDS (без meta), последняя строка -
+    футер с min/max timestamp. Те же границы лежат в индексе segments.json, чтобы при чтении
+    открывать только сегменты, пересекающиеся с запрошенным интервалом
+    """
+
+    def __init__(self, directory: str, compression: str = "gzip") -> None:
+        if compression not in OPENERS:
+            raise ValueError(f"unknown compression: {compression}")
+        self.directory = directory
+        self.compression = compression
+        self.index_path = os.path.join(directory, "segments.json")
+
+    def load_index(self) -> list[dict]:
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return self.rebuild_index() if os.path.isdir(self.directory) else []
+        except (OSError, json.JSONDecodeError):
+            return self.rebuild_index()
+        return index if isinstance(index, list) else []
+
+    def _save_index(self, index: list[dict]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def rebuild_index(self) -> list[dict]:
+        """
+        Ф-ция восстанавливает индекс по футерам сегментов (если индекс потерян или повреждён)
+        """
+        index = []
+        for name in sorted(os.listdir(self.directory)):
+            opener = next((o for o, ext in OPENERS.values() if name.endswith(ext)), None)
+            if opener is None:
+                continue
+            footer = None
+            with opener(os.path.join(self.directory, name), "rt", encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if isinstance(row, dict):
+                        footer = row.get("footer")
+            if footer:
+                index.append(dict(footer, file=name))
+
+        index.sort(key=lambda s: s["min_ts"])
+        self._save_index(index)
+        return index
+
+    def seal(self, records: list[dict]) -> list[dict]:
+        """
+        Ф-ция записывает записи в сегменты по дням: сегменты дней, в которые попадают записи,
+        переписываются вместе с новыми записями (по SEGMENT_MAX_ROWS строк на файл), поэтому
+        мелкие запечатывания не копятся, а сегменты не пересекаются по времени
+        """
+        if not records:
+            return []
+
+        index = self.load_index()
+        days = {_day(r["timestamp"]) for r in records}
+        footers = self._rewrite(index, days, records)
+        if _overlap_depth(self.load_index()) > MAX_OPEN_SEGMENTS:
+            self.compact()
+        return footers
+
+    def compact(self) -> int:
+        """
+        Ф-ция переписывает всю холодную историю в сегменты по дням (например, после
+        старого формата с одним мелким сегментом на каждое запечатывание). Возвращает число файлов
+        """
+        index = self.load_index()
+        if not index:
+            return 0
+        days = {_day(s["min_ts"]) for s in index} | {_day(s["max_ts"]) for s in index}
+        return len(self._rewrite(index, days, []))
+
+    def _rewrite(self, index: list[dict], days: set, records: list[dict]) -> list[dict]:
+        # сегменты, задевающие эти дни, переписываются целиком (вместе с другими их днями)
+        touched = []
+        while True:
+            touched = [s for s in index if any(_day(s["min_ts"]) <= d <= _day(s["max_ts"]) for d in days)]
+            spanned = days | {_day(s["min_ts"]) for s in touched} | {_day(s["max_ts"]) for s in touched}
+            if spanned == days:
+                break
+            days = spanned
+
+        merged = _unique_ids(heapq.merge(
+            *(self.iter_segment(s["file"]) for s in touched),
+            sorted(records, key=lambda r: r["timestamp"]),
+            key=lambda r: r["timestamp"],
+        ))
+        # записи идут по времени, поэтому в памяти держится не больше одного файла
+        footers = []
+        for _, day_records in itertools.groupby(merged, key=lambda r: _day(r["timestamp"])):
+            for chunk in iter(lambda: list(itertools.islice(day_records, SEGMENT_MAX_ROWS)), []):
+                footers.append(self._write_segment(chunk))
+
+        # новые файлы уже на диске: индекс переключается одной записью, старые файлы удаляются после
+        old_files = {s["file"] for s in touched}
+        index = [s for s in index if s["file"] not in old_files] + footers
+        index.sort(key=lambda s: s["min_ts"])
+        self._save_index(index)
+        for name in old_files:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+        return footers
+
+    def _write_segment(self, records: list[dict]) -> dict:
+        min_ts, max_ts = records[0]["timestamp"], records[-1]["timestamp"]
+        opener, ext = OPENERS[self.compression]
+
+        os.makedirs(self.directory, exist_ok=True)
+        stem = f"segment-{_compact_ts(min_ts)}-{_compact_ts(max_ts)}"
+        name = stem + ext
+        n = 1
+        while os.path.exists(os.path.join(self.directory, name)):
+            name = f"{stem}-{n}{ext}"
+            n += 1
+
+        footer = {"min_ts": min_ts, "max_ts": max_ts, "count": len(records)}
+        path = os.path.join(self.directory, name)
+        tmp_path = path + ".tmp"
+        with opener(tmp_path, "wt", encoding="utf-8") as f:
+            for r in records:
+                f.write(json.dumps([r.get(k) for k in SEGMENT_FIELDS], ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+            f.write(json.dumps({"footer": footer}))
+            f.write("\n")
+        os.replace(tmp_path, path)
+        return dict(footer, file=name)
+
+    def drop_older_than(self, cutoff: str) -> int:
+        """
+        Ф-ция удаляет сегменты, целиком лежащие раньше cutoff
+        """
+        index = self.load_index()
+        keep = [s for s in index if s["max_ts"] >= cutoff]
+        if len(keep) == len(index):
+            return 0
+
+        self._save_index(keep)
+        for segment in index:
+            if segment["max_ts"] < cutoff:
+                try:
+                    os.remove(os.path.join(self.directory, segment["file"]))
+                except OSError:
+                    pass
+        return len(index) - len(keep)
+
+    def iter_segment(self, name: str, since: str | None = None, until: str | None = None, pairs=None):
+        """
+        Ф-ция потоково декодирует один сегмент и отдаёт записи истории в порядке времени
+        """
+        opener = next(o for o, ext in OPENERS.values() if name.endswith(ext))
+        with opener(os.path.join(self.directory, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                if not isinstance(row, list):
+                    continue
+                record = dict(zip(SEGMENT_FIELDS, row))
+                ts = record["timestamp"]
+                if since and ts < since:
+                    continue
+                if until and ts > until:
+                    break
+                pair = f"{record['from_currency']}_{record['to_currency']}"
+                if pairs and pair not in pairs:
+                    continue
+                record["id"] = f"{pair}_{ts}"
+                yield record
+
+    def iter_records(self, since: str | None = None, until: str | None = None, pairs=None):
+        """
+        Ф-ция сливает по времени все сегменты, пересекающиеся с [since, until].
+        Непересекающиеся сегменты читаются цепочкой друг за другом, поэтому одновременно
+        открыто столько файлов, какова глубина перекрытия сегментов (для сегментов по дням - один)
+        """
+        segments = [
+            s for s in self.load_index()
+            if (not until or s["min_ts"] <= until) and (not since or s["max_ts"] >= since)
+        ]
+        streams = [
+            itertools.chain.from_iterable(self.iter_segment(s["file"], since, until, pairs) for s in chain)
+            for chain in _chains(segments)
+        ]
+        return heapq.merge(*streams, key=lambda r: r["timestamp"])
+
+
+def _unique_ids(records):
+    """
+    Ф-ция пропускает повторные записи (тот же id, что у сегментов: пара и timestamp), например
+    после повторного запечатывания тех же записей. Записи идут по времени, поэтому повторы
+    ищутся только среди записей с одинаковым timestamp; при повторе остаётся первая
+    """
+    for _, same_ts in itertools.groupby(records, key=lambda r: r["timestamp"]):
+        seen = set()
+        for r in same_ts:
+            record_id = (r.get("from_currency"), r.get("to_currency"))
+            if record_id not in seen:
+                seen.add(record_id)
+                yield r
+
+
+def _day(ts: str) -> str:
+    return ts[:10]
+
+
+def _chains(segments: list[dict]) -> list[list[dict]]:
+    """
+    Ф-ция раскладывает сегменты (по возрастанию min_ts) в минимальное число цепочек
+    непересекающихся сегментов
+    """
+    chains: list[list[dict]] = []
+    for segment in sorted(segments, key=lambda s: s["min_ts"]):
+        for chain in chains:
+            if chain[-1]["max_ts"] <= segment["min_ts"]:
+                chain.append(segment)
+                break
+        else:
+            chains.append([segment])
+    return chains
+
+
+def _overlap_depth(segments: list[dict]) -> int:
+    return len(_chains(segments))
+
+
+def _compact_ts(ts: str) -> str:
+    return ts.replace("-", "").replace(":", "")
@@ -1,9 +1,12 @@
+import bisect
+import heapq
 import json
 import os
 import tempfile
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.segments import SegmentStore
 
 
 class Storage:
@@ -11,6 +14,8 @@ class Storage:
         self.config = config
         self.rates_path = config.RATES_FILE_PATH
         self.history_path = config.HISTORY_FILE_PATH
+        self.ohlc_path = config.OHLC_FILE_PATH
+        self.segments = SegmentStore(config.HISTORY_SEGMENTS_DIR, config.HISTORY_COMPRESSION)
         os.makedirs(os.path.dirname(self.rates_path), exist_ok=True)
 
     def save_rates(self, pairs):
@@ -20,6 +25,29 @@ class Storage:
         }
         self._atomic_write(self.rates_path, data)
 
+    def save_freshness(self, timestamp: str, checked: int, changed: int, pairs=()) -> None:
+        """
+        Ф-ция отмечает проверку курсов в маленьком файле рядом с кешем курсов;
+        pairs - проверенные пары, время их проверки нужно планировщику выборки
+        """
+        checks = self.load_pair_checks()
+        checks.update({pair: timestamp for pair in pairs})
+        data = {"last_refresh": timestamp, "checked": checked, "changed": changed, "pairs": checks}
+        self._atomic_write(self.config.RATES_FRESHNESS_PATH, data, indent=None)
+
+    def load_pair_checks(self) -> dict[str, str]:
+        """
+        Ф-ция возвращает {пара: время последней проверки}
+        """
+        data = self._load_json(self.config.RATES_FRESHNESS_PATH, default={})
+        pairs = data.get("pairs") if isinstance(data, dict) else None
+        return pairs if isinstance(pairs, dict) else {}
+
+    def load_rates(self) -> dict:
+        data = self._load_json(self.rates_path, default={})
+        pairs = data.get("pairs") if isinstance(data, dict) else None
+        return pairs if isinstance(pairs, dict) else {}
+
     def append_history(self, records):
         existing = self._load_json(self.history_path, default=[])
 
@@ -30,13 +58,133 @@ class Storage:
             records = []
 
         new_ids = {r.get("id") for r in records if isinstance(r, dict) and r.get("id")}
-        filtered_existing = [
-            e for e in existing
-            if isinstance(e, dict) and e.get("id") not in new_ids
-        ]
-        updated = filtered_existing + records
+        known_ids = set()
+        filtered_existing = []
+        for e in existing:
+            if not isinstance(e, dict):
+                continue
+            if e.get("id") in new_ids:
+                known_ids.add(e.get("id"))
+            else:
+                filtered_existing.append(e)
+
+        if not os.path.exists(self.ohlc_path):
+            # первый запуск со свечами: сворачиваем уже накопленную историю целиком
+            self.update_ohlc(filtered_existing)
+
+        updated = self._seal_cold(filtered_existing + records)
         self._atomic_write(self.history_path, updated)
 
+        # записи, которые уже были в истории, в свечах учтены - повторно не добавляем
+        self.update_ohlc([r for r in records if r.get("id") not in known_ids])
+
+    def _seal_cold(self, records):
+        """
+        Ф-ция переносит записи старше HISTORY_HOT_DAYS в сжатый сегмент
+        и возвращает оставшуюся горячую часть истории
+        """
+        hot_cutoff = (datetime.now() - timedelta(days=self.config.HISTORY_HOT_DAYS)).isoformat(timespec="seconds")
+        hot, cold = [], []
+        for r in records:
+            (hot if str(r.get("timestamp", "")) >= hot_cutoff else cold).append(r)
+
+        if cold:
+            self.segments.seal(cold)
+
+        days = self.config.HISTORY_RETENTION_DAYS
+        if days and cold:
+            cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec="seconds")
+            self.segments.drop_older_than(cutoff)
+        return hot
+
+    def iter_history(self, since: str | None = None, until: str | None = None, pairs=None):
+        """
+        Ф-ция отдаёт записи истории в порядке времени: холодные сегменты декодируются потоково
+        и только если пересекаются с [since, until], горячая часть читается из HISTORY_FILE_PATH
+        """
+        pairs = set(pairs) if pairs else None
+        hot = self._load_json(self.history_path, default=[])
+        if not isinstance(hot, list):
+            hot = []
+
+        hot = sorted(
+            (
+                r for r in hot
+                if isinstance(r, dict)
+                and (not since or r["timestamp"] >= since)
+                and (not until or r["timestamp"] <= until)
+                and (not pairs or f"{r['from_currency']}_{r['to_currency']}" in pairs)
+            ),
+            key=lambda r: r["timestamp"],
+        )
+        return heapq.merge(self.segments.iter_records(since, until, pairs), hot, key=lambda r: r["timestamp"])
+
+    def load_ohlc(self) -> dict:
+        data = self._load_json(self.ohlc_path, default={})
+        return data if isinstance(data, dict) else {}
+
+    def update_ohlc(self, records):
+        """
+        Ф-ция инкрементально обновляет свечи всех разрешений по новым записям истории.
+        Строка свечи: [начало интервала (epoch), open, high, low, close, число тиков,
+        время первого и последнего тика (epoch)]. Пачка сначала сворачивается в свои свечи,
+        затем они сливаются с сохранёнными: open/close меняются, только если тики пачки
+        раньше/позже уже учтённых в интервале
+        """
+        if not records:
+            return
+
+        rollups = self.load_ohlc()
+        resolutions = self.config.OHLC_RESOLUTIONS
+
+        batch: dict[str, dict[str, dict]] = {}
+        for record in sorted(records, key=lambda r: r["timestamp"]):
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            ts = int(datetime.fromisoformat(record["timestamp"]).timestamp())
+            rate = record["rate"]
+            tiers = batch.setdefault(pair, {})
+
+            for name, seconds in resolutions.items():
+                candles = tiers.setdefault(name, {})
+                bucket = ts - ts % seconds
+                candle = candles.get(bucket)
+                if candle is None:
+                    candles[bucket] = [bucket, rate, rate, rate, rate, 1, ts, ts]
+                else:
+                    candle[2] = max(candle[2], rate)
+                    candle[3] = min(candle[3], rate)
+                    candle[4] = rate
+                    candle[5] += 1
+                    candle[7] = ts
+
+        for pair, tiers in batch.items():
+            for name, candles in tiers.items():
+                rows = rollups.setdefault(pair, {}).setdefault(name, [])
+                for candle in candles.values():
+                    _merge_candle(rows, candle)
+
+        now = datetime.now().timestamp()
+        for tiers in rollups.values():
+            for name, rows in tiers.items():
+                days = self.config.OHLC_RETENTION_DAYS.get(name)
+                if days:
+                    cutoff = now - days * 86400
+                    i = bisect.bisect_left(rows, cutoff, key=lambda row: row[0])
+                    del rows[:i]
+
+        self._atomic_write(self.ohlc_path, rollups, indent=None)
+
+    def get_ohlc(self, pair: str, resolution: str, since: float | None = None, limit: int | None = None) -> list:
+        """
+        Ф-ция возвращает свечи пары нужного разрешения, начиная с since (epoch), не больше limit последних
+        """
+        rows = self.load_ohlc().get(pair, {}).get(resolution, [])
+        if since is not None:
+            rows = rows[bisect.bisect_left(rows, since, key=lambda row: row[0]):]
+        if limit:
+            rows = rows[-limit:]
+        return rows
+
     def _load_json(self, path: str, default):
         try:
             with open(path, "r", encoding="utf-8") as f:
@@ -44,7 +192,7 @@ class Storage:
         except (FileNotFoundError, json.JSONDecodeError, OSError):
             return default
 
-    def _atomic_write(self, path, data):
+    def _atomic_write(self, path, data, indent=4):
         dir_path = os.path.dirname(path)
         os.makedirs(dir_path, exist_ok=True)
 
@@ -57,7 +205,7 @@ class Storage:
                 dir=dir_path,
                 encoding="utf-8",
             ) as tmp:
-                json.dump(data, tmp, indent=4, ensure_ascii=False, default=str)
+                json.dump(data, tmp, indent=indent, ensure_ascii=False, default=str)
                 tmp_path = tmp.name
 
             os.replace(tmp_path, path)
@@ -67,3 +215,45 @@ class Storage:
                     os.remove(tmp_path)
                 except OSError:
                     pass
+
+
+def _merge_candle(rows: list, candle: list) -> None:
+    """
+    Ф-ция сливает свечу пачки со свечами пары (отсортированы по началу интервала)
+    """
+    bucket = candle[0]
+    if not rows or rows[-1][0] < bucket:
+        rows.append(candle)
+        return
+    i = bisect.bisect_left(rows, bucket, key=lambda row: row[0])
+    if i == len(rows) or rows[i][0] != bucket:
+        rows.insert(i, candle)
+        return
+
+    row = rows[i]
+    # у свечей старого формата нет времени тиков: тики после последней свечи считаем новыми,
+    # внутри истории - запоздавшими
+    first, last = (row[6], row[7]) if len(row) >= 8 else (None, None)
+    if first is not None and candle[6] < first:
+        row[1] = candle[1]
+        first = candle[6]
+    if (candle[7] >= last) if last is not None else i == len(rows) - 1:
+        row[4] = candle[4]
+        last = candle[7]
+    row[2] = max(row[2], candle[2])
+    row[3] = min(row[3], candle[3])
+    row[5] += candle[5]
+    row[6:] = [first, last]
+
+
+def read_last_refresh(config: ParserConfig, fallback: str | None = None) -> str | None:
+    """
+    Ф-ция возвращает время последней проверки курсов: более позднее из last_refresh кеша
+    курсов (fallback) и отметки RATES_FRESHNESS_PATH
+    """
+    try:
+        with open(config.RATES_FRESHNESS_PATH, "r", encoding="utf-8") as f:
+            checked = json.load(f).get("last_refresh")
+    except (OSError, json.JSONDecodeError, AttributeError):
+        checked = None
+    return max((v for v in (fallback, checked) if v), default=None)
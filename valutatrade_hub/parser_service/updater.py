@@ -1,8 +1,21 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-from valutatrade_hub.parser_service.api_clients import CoinGeckoClient, ExchangeRateApiClient
+from valutatrade_hub.parser_service.anomaly import AnomalyFilter, quarantine
+from valutatrade_hub.parser_service.api_clients import (
+    CoinGeckoClient,
+    CryptoCompareClient,
+    ExchangeRateApiClient,
+    OpenErApiClient,
+)
+from valutatrade_hub.parser_service.circuit_breaker import BreakerClient, BreakerStateStore, CircuitBreaker
 from valutatrade_hub.parser_service.config import ParserConfig
+from valutatrade_hub.parser_service.events import RateTick, rate_bus
+from valutatrade_hub.parser_service.fetch_plan import FetchPlanner
+from valutatrade_hub.parser_service.hedging import HedgedFetcher, LatencyTracker
+from valutatrade_hub.parser_service.rate_board import publish_rate_board
+from valutatrade_hub.parser_service.refresh_lock import RefreshLock
 from valutatrade_hub.parser_service.storage import Storage
 
 logger = logging.getLogger("ValutaTrade.Parser")
@@ -12,13 +25,110 @@ class RatesUpdater:
     def __init__(self, config: ParserConfig):
         self.__crypto_client = CoinGeckoClient(config)
         self.__fiat_client = ExchangeRateApiClient(config)
+        self.config = config
         self.storage = Storage(config)
-        self.clients = {
-            "CoinGecko": self.__crypto_client,
-            "ExchangeRate-API": self.__fiat_client,
+        self.latency = LatencyTracker(config.LATENCY_STATS_PATH, config.LATENCY_WINDOW)
+        # основной источник каждого класса активов идёт первым, остальные - резервные
+        self.groups = {
+            "crypto": {
+                "CoinGecko": self.__crypto_client,
+                "CryptoCompare": CryptoCompareClient(config),
+            },
+            "fiat": {
+                "ExchangeRate-API": self.__fiat_client,
+                "Open ER-API": OpenErApiClient(config),
+            },
         }
+        # каждый источник за своим circuit breaker, состояние общее для всех процессов
+        breakers = BreakerStateStore(config.BREAKER_STATE_PATH)
+        for clients in self.groups.values():
+            for name, client in clients.items():
+                clients[name] = BreakerClient(client, CircuitBreaker(name, breakers, config))
+        self.clients = {name: client for group in self.groups.values() for name, client in group.items()}
+        self.group_codes = {"crypto": config.CRYPTO_CURRENCIES, "fiat": config.FIAT_CURRENCIES}
+        self.planner = FetchPlanner(config)
+        self.anomalies = AnomalyFilter(config)
+        # итог последнего run_update: {"checked", "changed", "quarantined"}
+        self.last_delta = {"checked": 0, "changed": 0, "quarantined": 0}
 
-    def run_update(self, sources):
+    def _select_groups(self, sources):
+        """
+        Ф-ция оставляет источники, подходящие под фильтр (имя источника или класса активов)
+        """
+        # приводим фильтры к тому же виду, что и source_name
+        source_filters = [
+            s.lower().replace("-", "").replace(" ", "")
+            for s in (sources or [])
+        ]
+
+        selected = {}
+        for group_name, clients in self.groups.items():
+            if not source_filters or group_name in source_filters:
+                selected[group_name] = clients
+                continue
+
+            chosen = {
+                name: client for name, client in clients.items()
+                if name.lower().replace("-", "").replace(" ", "") in source_filters
+            }
+            if chosen:
+                selected[group_name] = chosen
+        return selected
+
+    def _fetch_group(self, group_name, clients, codes=None):
+        fetcher = HedgedFetcher(clients, self.config, self.latency, codes)
+        try:
+            source_name, rates = fetcher.fetch()
+            logger.info(f"Fetching {group_name} from {source_name}... OK ({len(rates)} rates)")
+            return source_name, rates
+        except Exception as e:
+            logger.error(f"Failed to fetch {group_name} from {', '.join(clients)}: {e}")
+            return None, {}
+
+    def run_planned_update(self):
+        """
+        Ф-ция запрашивает только нужные валюты, чья последняя проверка старше целевой свежести
+        (см. FetchPlanner). Пока кеш курсов пуст, запрашивается всё
+        """
+        previous = self.storage.load_rates()
+        if not previous:
+            return self.run_update(None)
+
+        checked = self.storage.load_pair_checks()
+        for pair, data in previous.items():
+            checked[pair] = max(checked.get(pair) or "", data.get("updated_at") or "")
+        return self.run_update(None, codes=self.planner.plan(checked))
+
+    def refresh_single_flight(self, is_stale=None) -> bool:
+        """
+        Ф-ция выполняет обновление по спросу так, что из одновременно вызвавших процессов
+        в источники идёт только один. Остальные ждут его не дольше RATE_REFRESH_WAIT секунд
+        и пользуются результатом. is_stale() перепроверяется под блокировкой: если курсы
+        уже обновил другой процесс, запроса нет. Возвращает True, если обновлял этот вызов
+        """
+        lock = RefreshLock(self.config.RATE_REFRESH_LOCK_PATH)
+        if lock.acquire():
+            try:
+                if is_stale is not None and not is_stale():
+                    return False
+                self.run_planned_update()
+                return True
+            finally:
+                lock.release()
+
+        logger.info("Rates refresh is running in another process, waiting for it")
+        if lock.acquire(timeout=self.config.RATE_REFRESH_WAIT):
+            lock.release()
+        else:
+            logger.warning(f"Rates refresh still running after {self.config.RATE_REFRESH_WAIT}s, using cached rates")
+        return False
+
+    def run_update(self, sources, codes=None):
+        """
+        Ф-ция запрашивает курсы у источников (sources - фильтр источников, codes - коды валют,
+        None - все валюты из конфига) и сохраняет изменившиеся. Возвращает число полученных пар,
+        сколько из них изменилось - в last_delta
+        """
         logger.info("Starting rates update...")
 
         all_rates = {}
@@ -27,27 +137,59 @@ class RatesUpdater:
         timestamp = datetime.now()
         timestamp_str = timestamp.isoformat(timespec="seconds")
 
-        # приводим фильтры к тому же виду, что и source_name
-        source_filters = [
-            s.lower().replace("-", "").replace(" ", "")
-            for s in (sources or [])
-        ]
+        jobs = []
+        for group_name, clients in self._select_groups(sources).items():
+            group_codes = None
+            if codes is not None:
+                group_codes = [code for code in self.group_codes[group_name] if code in codes]
+                if not group_codes:
+                    continue
+            jobs.append((group_name, clients, group_codes))
 
-        for source_name, client in self.clients.items():
-            cleaned_source_name = source_name.lower().replace("-", "").replace(" ", "")
-            if source_filters and cleaned_source_name not in source_filters:
-                continue
+        if not jobs:
+            # запрашивать нечего: время проверки не отмечается, свежесть пар осталась прежней
+            self.last_delta = {"checked": 0, "changed": 0, "quarantined": 0}
+            return 0
 
-            try:
-                client_rates = client.fetch_rates()
-                logger.info(f"Fetching from {source_name}... OK ({len(client_rates)} rates)")
-            except Exception as e:
-                logger.error(f"Failed to fetch from {source_name}: {e}")
-                continue
+        # классы активов опрашиваются параллельно: медленный крипто-источник не задерживает фиат
+        with ThreadPoolExecutor(max_workers=len(jobs)) as executor:
+            results = list(executor.map(lambda job: self._fetch_group(*job), jobs))
+
+        try:
+            self.latency.save()
+        except OSError as e:
+            logger.warning(f"Failed to save provider latency stats: {e}")
 
+        previous = self.storage.load_rates()
+        eps = self.config.RATE_CHANGE_EPSILON
+        checked = 0
+        added = 0
+        rejected = []
+        self.anomalies.refresh()
+
+        for source_name, client_rates in results:
             for pair, data in client_rates.items():
-                from_cur, to_cur = pair.split("_")
+                checked += 1
+                prev_rate = previous.get(pair, {}).get("rate")
+                rate = data["rate"]
+                if prev_rate is not None and isinstance(rate, (int, float)) and abs(rate - prev_rate) <= eps * abs(prev_rate):
+                    continue
 
+                reason = self.anomalies.check(pair, data["rate"], prev_rate)
+                if reason is not None:
+                    # подозрительный тик не попадает ни в кеш, ни в историю, ни в шину
+                    rejected.append({
+                        "pair": pair,
+                        "rate": data["rate"],
+                        "prev_rate": prev_rate,
+                        "reason": reason,
+                        "timestamp": timestamp_str,
+                        "source": source_name,
+                    })
+                    continue
+                added += prev_rate is None
+
+                from_cur, to_cur = pair.split("_")
                 record = {
                     "id": f"{from_cur}_{to_cur}_{timestamp_str}",
                     "from_currency": from_cur,
@@ -65,9 +207,58 @@ class RatesUpdater:
                     "source": source_name,
                 }
 
+        if rejected:
+            logger.warning(
+                f"Quarantined {len(rejected)} suspicious ticks: "
+                + ", ".join(f"{r['pair']}={r['rate']} ({r['reason']})" for r in rejected)
+            )
+            quarantine(self.config, rejected)
+        try:
+            self.anomalies.save()
+        except OSError as e:
+            logger.warning(f"Failed to save anomaly filter state: {e}")
+
+        self.last_delta = {"checked": checked, "changed": len(all_rates), "quarantined": len(rejected)}
+        if not checked:
+            return 0
+
+        logger.info(
+            f"Rates delta: {len(all_rates)} changed ({added} new), {len(rejected)} quarantined, "
+            f"{checked - len(all_rates) - len(rejected)} unchanged of {checked} fetched"
+        )
+
         if all_rates:
+            # в истории и кеше меняются только изменившиеся пары, остальные остаются как были
             self.storage.append_history(all_records)
-            self.storage.save_rates(all_rates)
-            logger.info(f"Writing {len(all_rates)} rates to data/rates.json...")
+            self.storage.save_rates(previous | all_rates)
+            logger.info(f"Writing {len(all_rates)} changed rates to data/rates.json...")
+            self._publish(all_records, previous)
+        fetched = [pair for _, client_rates in results for pair in client_rates]
+        self.storage.save_freshness(timestamp_str, checked, len(all_rates), fetched)
+        publish_rate_board(self.config, previous | all_rates, timestamp)
+
+        return checked
+
+    def _publish(self, records, previous):
+        """
+        Ф-ция публикует в шину события по парам, курс которых изменился
+        """
+        events = []
+        for record in records:
+            pair = f"{record['from_currency']}_{record['to_currency']}"
+            prev_rate = previous.get(pair, {}).get("rate")
+            if prev_rate == record["rate"]:
+                continue
+            events.append(RateTick(
+                pair=pair,
+                from_currency=record["from_currency"],
+                to_currency=record["to_currency"],
+                rate=record["rate"],
+                prev_rate=prev_rate,
+                timestamp=record["timestamp"],
+                source=record["source"],
+            ))
 
-        return len(all_rates)
+        if events:
+            rate_bus.publish(events)
+            logger.info(f"Published {len(events)} rate ticks to {rate_bus.subscriber_count} subscribers")